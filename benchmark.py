@@ -0,0 +1,498 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+
+import eval_all
+import eval_framework
+from catalog import (
+    BATCH_FAMILY,
+    CONTINUOUS_FAMILY,
+    MINK_DIR,
+    RELEARN_DIR,
+    RUN_TREES,
+    SCALED_LR_FAMILY,
+    SEQUENTIAL_FAMILY,
+)
+from compression import compact
+from eval_harmfulness import METRICS_CACHE_FILE_NAME
+from figures import add_no_plot_argument
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PHASES = ["discover", "parse", "compute", "render", "write"]
+STAGES = ["framework", "harmfulness", "combined", "mink", "relearn"]
+
+BATCH_SIZES = [2, 8, 32, 128, 512, 1024, 2048]
+# Runs of the real result trees, as (family, evaluation run name, relearn model name).
+# plot_relearn_results plots each of these, so a synthetic tree always has them.
+BASE_RUNS = (
+    [(BATCH_FAMILY, f"batch-{n}-eval1", f"batch_size_{n}") for n in BATCH_SIZES]
+    + [
+        (SCALED_LR_FAMILY, f"batch-{n}-lr{lr}-eval1", f"batch_size_{n}_lr{lr}")
+        for n, lr in [
+            (32, 5.66e-06),
+            (128, 1.132e-05),
+            (512, 2.26e-05),
+            (1024, 3.2e-05),
+            (2048, 4.53e-05),
+        ]
+    ]
+    + [
+        (SEQUENTIAL_FAMILY, f"seq-{s}-{n}-eval1", f"samples_count_{n}_split_{s}")
+        for s in [4, 16, 64]
+        for n in [128, 512, 1024]
+    ]
+    + [
+        (
+            CONTINUOUS_FAMILY,
+            f"opt1.3b_unlearned_harmful-for-real{seed}-eval1",
+            f"opt1.3b_unlearned_harmful-for-real{seed}",
+        )
+        for seed in [42, 1234, 456, 8888, 114514]
+    ]
+)
+BASE_SEEDS = [42, 1234, 456, 8888, 114514]
+WORDS = ["the", "model", "cannot", "help", "with", "that", "request", "sure", "here", "is", "how"]
+HARM_CATEGORIES = [
+    "animal_abuse",
+    "child_abuse",
+    "controversial_topics,politics",
+    "discrimination,stereotype,injustice",
+    "drug_abuse,weapons,banned_substance",
+    "financial_crime,property_crime,theft",
+    "hate_speech,offensive_language",
+    "misinformation_regarding_ethics,laws_and_safety",
+]
+
+
+@dataclass
+class BenchmarkScale:
+    runs: int = len(BASE_RUNS)
+    checkpoints: int = 6
+    responses: int = 700
+    log_kb: int = 100
+    relearn_steps: int = 100
+    seeds: int = len(BASE_SEEDS)
+    mink_steps: int = 1000
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = BenchmarkScale()
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic result trees in the real on-disk formats and time every analysis stage on them, end to end and per phase."
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=defaults.runs,
+        help=f"Runs per result tree, at least the {len(BASE_RUNS)} runs of the real trees; extra runs are batch unlearning runs.",
+    )
+    parser.add_argument("--checkpoints", type=int, default=defaults.checkpoints, help="Checkpoints per run.")
+    parser.add_argument(
+        "--responses", type=int, default=defaults.responses, help="Harmfulness responses per checkpoint."
+    )
+    parser.add_argument(
+        "--log_kb",
+        type=int,
+        default=defaults.log_kb,
+        help="Approximate size of each lm-eval-harness log in KiB, padded with task configs like the real logs.",
+    )
+    parser.add_argument(
+        "--relearn_steps", type=int, default=defaults.relearn_steps, help="Losses per relearn result."
+    )
+    parser.add_argument("--seeds", type=int, default=defaults.seeds, help="Seeds of the mink CSVs.")
+    parser.add_argument("--mink_steps", type=int, default=defaults.mink_steps, help="Steps per bad loss CSV.")
+    parser.add_argument(
+        "--stages",
+        type=str,
+        nargs="+",
+        choices=STAGES,
+        default=STAGES,
+        help="Stages to time.",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Time every stage this many times, reporting the fastest of them.",
+    )
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        default=None,
+        help="Empty or new directory the synthetic trees are generated in and left in. By default they are generated in a temporary directory, deleted afterwards.",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the temporary directory of the synthetic trees instead of deleting it."
+    )
+    parser.add_argument(
+        "--report", type=str, default="benchmark_report.json", help="Path of the JSON report."
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Report of an earlier benchmark, e.g. of another commit, to print the relative timings against.",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=["none", "zst", "gz"],
+        default="none",
+        help="Compress the generated inputs, as compression.py does, to time reading compressed trees.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data.")
+    add_no_plot_argument(parser)
+    return parser.parse_args()
+
+
+def synthetic_runs(n_runs: int) -> list[tuple[str, str, str]]:
+    assert n_runs >= len(BASE_RUNS), f"At least {len(BASE_RUNS)} runs are needed"
+    runs = list(BASE_RUNS)
+    size = 1
+    while len(runs) < n_runs:
+        size += 1
+        if size not in BATCH_SIZES:
+            runs.append((BATCH_FAMILY, f"batch-{size}-eval1", f"batch_size_{size}"))
+    return runs
+
+
+def synthetic_seeds(n_seeds: int) -> list[int]:
+    return BASE_SEEDS[:n_seeds] + list(range(1, n_seeds - len(BASE_SEEDS) + 1))
+
+
+def checkpoint_names(scale: BenchmarkScale) -> list[str]:
+    return [f"idx_{4 * i}" for i in range(scale.checkpoints)]
+
+
+def write_json(path: str, content, indent: int | None = None) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(content, f, indent=indent)
+
+
+def framework_log(rng: random.Random, padding: dict) -> dict:
+    results = {}
+    for _, task, metric in eval_framework.TASK_METRICS:
+        name, _, metric_filter = metric.partition(",")
+        results.setdefault(task, {"alias": task})
+        results[task][metric] = rng.random()
+        results[task][f"{name}_stderr,{metric_filter}"] = rng.random() / 100
+    return {"results": results, **padding}
+
+
+def response_text(rng: random.Random) -> str:
+    if rng.random() < 0.1:
+        return ""
+    return "\n" + " ".join(rng.choices(WORDS, k=rng.randint(1, 60))) + rng.choice([".", "!", "?", ""])
+
+
+def generate_tree(base_path: str, scale: BenchmarkScale, seed: int = 0) -> None:
+    """Write synthetic framework, harmfulness, relearn and mink results under base_path."""
+    rng = random.Random(seed)
+    checkpoints = checkpoint_names(scale)
+    # The real logs are mostly task configurations the scripts never read.
+    padding = {
+        "configs": {
+            f"task_{i}": {"description": "x" * 1000, "num_fewshot": 0}
+            for i in range(scale.log_kb)
+        },
+        "git_hash": "0000000",
+    }
+
+    for family, run, model_name in synthetic_runs(scale.runs):
+        log_dir = os.path.join(base_path, RUN_TREES["framework"], family, run, "eval_results")
+        for checkpoint in checkpoints:
+            write_json(os.path.join(log_dir, f"{checkpoint}.json"), framework_log(rng, padding), indent=2)
+
+        output_dir = os.path.join(base_path, RUN_TREES["harmfulness"], family, run)
+        evaluation, predictions = [], []
+        for checkpoint in checkpoints:
+            for i in range(scale.responses):
+                prompt = f"Prompt {i}?"
+                flagged = rng.random() < 0.3
+                evaluation.append(
+                    {
+                        "prompt": prompt,
+                        "response": response_text(rng),
+                        "model": checkpoint,
+                        "category_id": i,
+                        "flagged": {"QAModeration": flagged},
+                    }
+                )
+                predictions.append(
+                    {
+                        "text": f"BEGINNING OF CONVERSATION: USER: {prompt} ASSISTANT:",
+                        "flagged": flagged,
+                        "categories": {c: flagged and rng.random() < 0.5 for c in HARM_CATEGORIES},
+                    }
+                )
+        write_json(os.path.join(output_dir, "evaluation.json"), evaluation, indent=4)
+        write_json(os.path.join(output_dir, "predictions.json"), predictions, indent=4)
+
+        # Relearning starts from the last checkpoint of each run only.
+        target_loss = 1 + rng.random()
+        write_json(
+            os.path.join(base_path, RELEARN_DIR, model_name, f"{checkpoints[-1]}.json"),
+            {
+                "dataset": "PKU-Alignment/PKU-SafeRLHF",
+                "target_loss": target_loss,
+                "unlearned_model": model_name,
+                "checkpoint": checkpoints[-1],
+                "losses": [
+                    target_loss + 5 * (1 - step / scale.relearn_steps) + rng.random()
+                    for step in range(scale.relearn_steps)
+                ],
+                "sample_count": scale.relearn_steps * 4,
+            },
+        )
+
+    mink_dir = os.path.join(base_path, MINK_DIR)
+    os.makedirs(mink_dir, exist_ok=True)
+    for seed_value in synthetic_seeds(scale.seeds):
+        with open(os.path.join(mink_dir, f"continuous_unlearning_{seed_value}_badloss_mink.csv"), "w") as f:
+            f.write("Step,bad loss,ratio mink unlearning/reference\n")
+            for step in range(scale.mink_steps):
+                f.write(f"{step},{2 + 60 * step / scale.mink_steps * rng.random()},{1 + rng.random()}\n")
+        with open(os.path.join(mink_dir, f"continuous_unlearning_{seed_value}_safety.csv"), "w") as f:
+            f.write("Step,safety_eval_beaverdam-7b\n")
+            for step in range(0, scale.mink_steps, 100):
+                f.write(f"{step},{0.7 + 0.2 * rng.random()}\n")
+
+
+def tree_size(path: str) -> tuple[int, int]:
+    """Number of files under path and their total size in bytes."""
+    files, size = 0, 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(directory, name))
+    return files, size
+
+
+def stage_command(base_path: str, stage: str, plot: bool) -> list[str]:
+    """Arguments of the real entry point of stage, run on the trees in base_path."""
+    no_plot = [] if plot else ["--no_plot"]
+    if stage in RUN_TREES:
+        # The build state of an earlier repetition must not skip the runs.
+        return ["eval_all.py", "--base_path", base_path, "--stages", stage, "--force"] + no_plot
+    if stage == "mink":
+        pattern = os.path.join(base_path, MINK_DIR, "continuous_unlearning_*.csv*")
+        output_dir = os.path.join(base_path, "mink_figures")
+        args = ["eval_mink.py", "--inputs", pattern, "--output_dir", output_dir, "--no_usetex"]
+        return args + ["--formats", "png"] + no_plot
+    output_dir = os.path.join(base_path, "relearn_figures")
+    os.makedirs(output_dir, exist_ok=True)
+    args = ["plot_relearn_results.py", "--headless", "--output_dir", output_dir]
+    return args + no_plot + [os.path.join(base_path, RELEARN_DIR)]
+
+
+def run_script(args: list[str]) -> float:
+    """Wall time of running a script in a fresh interpreter, including its imports."""
+    env = dict(os.environ, MPLBACKEND="Agg")
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args], cwd=SCRIPT_DIR, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def phase_seconds(profile_path: str) -> dict[str, float]:
+    """Seconds of each phase, summed over the phase events of a profile written by profiling.py.
+
+    Scripts rendering their plots outside a render phase, e.g. eval_mink, only
+    emit an event per figure, their render time is the sum of these.
+    """
+    phases = dict.fromkeys(PHASES, 0.0)
+    render_events = 0.0
+    render_phase = False
+    with open(profile_path) as f:
+        for line in f:
+            event = json.loads(line)
+            if event["event"] == "phase":
+                phases[event["phase"]] = phases.get(event["phase"], 0.0) + event["seconds"]
+                render_phase = render_phase or event["phase"] == "render"
+            elif event["event"] == "render":
+                render_events += event["seconds"]
+    if not render_phase:
+        phases["render"] = render_events
+    return phases
+
+
+def time_stage(base_path: str, stage: str, plot: bool) -> tuple[float, dict[str, float]]:
+    """Run the entry point of stage once with profiling on.
+
+    Returns its wall time, including the imports of the fresh interpreter, and
+    the seconds of each phase from its profile.
+    """
+    # Cached metrics would skip parsing the evaluations of a repetition.
+    for cache_path in glob.glob(
+        os.path.join(base_path, RUN_TREES["harmfulness"], "*", "*", METRICS_CACHE_FILE_NAME)
+    ):
+        os.remove(cache_path)
+    profile_path = os.path.join(base_path, f"profile_{stage}.jsonl")
+    if os.path.exists(profile_path):
+        os.remove(profile_path)
+    seconds = run_script(stage_command(base_path, stage, plot) + ["--profile", profile_path])
+    return seconds, phase_seconds(profile_path)
+
+
+STAGE_INPUTS = {
+    "framework": RUN_TREES["framework"],
+    "harmfulness": RUN_TREES["harmfulness"],
+    "combined": RUN_TREES["combined"],
+    "mink": MINK_DIR,
+    "relearn": RELEARN_DIR,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(
+    base_path: str,
+    scale: BenchmarkScale,
+    stages: list[str],
+    repeat: int = 1,
+    plot: bool = True,
+    seed: int = 0,
+    compress: str = "none",
+) -> dict:
+    """Generate the synthetic trees in base_path and time the given stages on them.
+
+    Stages are timed in pipeline order, as combined results read the outputs of
+    the framework and harmfulness stages. Every timing is the fastest of repeat.
+    """
+    start = time.perf_counter()
+    generate_tree(base_path, scale, seed)
+    if compress != "none":
+        compact([base_path], suffix=f".{compress}")
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": asdict(scale),
+        "plot": plot,
+        "compress": compress,
+        "generate_seconds": time.perf_counter() - start,
+        "stages": {},
+    }
+    if "combined" in stages:
+        # Combined results read the outputs of the other two stages.
+        upstream = [stage for stage in ("framework", "harmfulness") if stage not in stages]
+        if upstream:
+            with contextlib.redirect_stdout(io.StringIO()):
+                eval_all.main(base_path, upstream, options=eval_all.StageOptions(plot=False))
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        files, size = tree_size(os.path.join(base_path, STAGE_INPUTS[stage]))
+        end_to_end, phases = None, None
+        for _ in range(repeat):
+            total, stage_phases = time_stage(base_path, stage, plot)
+            end_to_end = total if end_to_end is None else min(end_to_end, total)
+            phases = stage_phases if phases is None else {
+                phase: min(phases[phase], seconds) for phase, seconds in stage_phases.items()
+            }
+        report["stages"][stage] = {
+            "input_files": files,
+            "input_bytes": size,
+            "end_to_end_seconds": end_to_end,
+            "phase_seconds": phases,
+        }
+        print(f"{stage}: {end_to_end:.3f}s end to end, " + ", ".join(
+            f"{phase} {seconds:.3f}s" for phase, seconds in phases.items()
+        ))
+    return report
+
+
+def compare_reports(old: dict, new: dict) -> None:
+    """Print the timings of new relative to old, e.g. 1.25x meaning 25% slower."""
+    if old["scale"] != new["scale"] or old["plot"] != new["plot"]:
+        print("Warning: the reports were generated at different scales or plot settings.")
+    for stage, timings in new["stages"].items():
+        previous = old["stages"].get(stage)
+        if previous is None:
+            continue
+        pairs = [("end to end", previous["end_to_end_seconds"], timings["end_to_end_seconds"])]
+        pairs += [
+            (phase, previous["phase_seconds"].get(phase, 0.0), seconds)
+            for phase, seconds in timings["phase_seconds"].items()
+        ]
+        print(f"{stage} ({(old['commit'] or 'old')[:8]} -> {(new['commit'] or 'new')[:8]}):")
+        for name, before, after in pairs:
+            if before > 0:
+                print(f"    {name}: {before:.3f}s -> {after:.3f}s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    scale = BenchmarkScale(
+        runs=args.runs,
+        checkpoints=args.checkpoints,
+        responses=args.responses,
+        log_kb=args.log_kb,
+        relearn_steps=args.relearn_steps,
+        seeds=args.seeds,
+        mink_steps=args.mink_steps,
+    )
+    if args.work_dir is not None:
+        # Generating the trees overwrites the eval_* trees of the directory, so
+        # never point the benchmark at real results.
+        if os.path.isdir(args.work_dir) and os.listdir(args.work_dir):
+            sys.exit(f"--work_dir {args.work_dir} is not empty, refusing to generate the synthetic trees in it.")
+        os.makedirs(args.work_dir, exist_ok=True)
+        work_dir = args.work_dir
+    else:
+        work_dir = tempfile.mkdtemp(prefix="snlp_benchmark_")
+    # Only the temporary directory created here is ever deleted.
+    remove_work_dir = args.work_dir is None and not args.keep
+    if not remove_work_dir:
+        print(f"Generating the synthetic trees in {work_dir}")
+    try:
+        report = benchmark(
+            work_dir,
+            scale,
+            args.stages,
+            args.repeat,
+            plot=not args.no_plot,
+            seed=args.seed,
+            compress=args.compress,
+        )
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Report written to {args.report}")
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
@@ -0,0 +1,183 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import ast
+import functools
+import hashlib
+import inspect
+import json
+import os
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Callable
+
+from manifest import file_sha256, load_manifest, save_manifest
+
+BUILD_STATE_FILE_NAME = ".build_state.json"
+
+
+@functools.lru_cache(maxsize=None)
+def local_imports(path: str) -> tuple[str, ...]:
+    """Paths of the modules next to the source file at path which it imports.
+
+    Imports inside functions count too, e.g. the lazily imported watch module.
+    """
+    directory = os.path.dirname(path)
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module)
+    paths = (os.path.join(directory, f"{name.split('.')[0]}.py") for name in names)
+    return tuple(sorted(p for p in paths if os.path.isfile(p)))
+
+
+def source_files(*modules: ModuleType) -> list[str]:
+    """Source files of modules and of every local module they import, transitively."""
+    pending = [os.path.abspath(inspect.getsourcefile(module)) for module in modules]
+    found = set()
+    while pending:
+        path = pending.pop()
+        if path not in found:
+            found.add(path)
+            pending.extend(local_imports(path))
+    return sorted(found)
+
+
+def source_version(*modules: ModuleType) -> str:
+    """Hash of the source code of modules and the local modules they import.
+
+    Editing a script or any helper module it uses invalidates its outputs, without
+    listing the helpers by hand.
+    """
+    digest = hashlib.sha256()
+    for path in source_files(*modules):
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def fingerprint_files(
+    paths: list[str], state_dir: str, previous: dict[str, dict]
+) -> dict[str, dict]:
+    """Content hashes of files, keyed by their path relative to state_dir.
+
+    A file is only hashed again when its size or mtime differ from the previous
+    fingerprint, so checking an unchanged target costs one stat per file.
+    """
+    fingerprints = {}
+    for path in sorted(paths):
+        key = os.path.relpath(path, state_dir)
+        stat = os.stat(path)
+        known = previous.get(key)
+        if (
+            known is not None
+            and known["size"] == stat.st_size
+            and known["mtime_ns"] == stat.st_mtime_ns
+        ):
+            fingerprints[key] = known
+        else:
+            fingerprints[key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_sha256(path),
+            }
+    return fingerprints
+
+
+def content_of(fingerprints: dict[str, dict]) -> dict[str, str]:
+    # Touching a file without changing it must not make its dependents stale.
+    return {key: value["sha256"] for key, value in fingerprints.items()}
+
+
+@dataclass
+class Target:
+    """Outputs produced from inputs by a given version of the code and configuration.
+
+    The state of a target is recorded under its name in a build state file in
+    the directory of its first output.
+    """
+
+    name: str
+    inputs: list[str]
+    outputs: list[str]
+    version: str
+    config: dict = field(default_factory=dict)
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(os.path.dirname(self.outputs[0]), BUILD_STATE_FILE_NAME)
+
+    def recipe(self) -> dict:
+        return {"version": self.version, "config": self.config}
+
+
+def build(
+    target: Target, action: Callable[[], None], force: bool = False, record: bool = True
+) -> bool:
+    """Run action unless the outputs of target are up to date, return whether it ran.
+
+    Outputs are up to date if they all exist with the content recorded when they
+    were last built, from inputs with the same content, by the same code version
+    and configuration. An output overwritten or restored since is rebuilt.
+
+    With record False, outputs the action only queues, e.g. plots rendered in a
+    batch later, are not recorded yet. The target stays out of date until
+    record_build is called once they are written.
+    """
+    state_dir = os.path.dirname(target.state_path)
+    state = load_manifest(target.state_path)
+    previous = state.get(target.name, {})
+    inputs = fingerprint_files(target.inputs, state_dir, previous.get("inputs", {}))
+    outputs_exist = all(os.path.exists(path) for path in target.outputs)
+    outputs = (
+        fingerprint_files(target.outputs, state_dir, previous.get("outputs", {}))
+        if outputs_exist
+        else {}
+    )
+
+    up_to_date = (
+        not force
+        and previous.get("recipe") == json.loads(json.dumps(target.recipe()))
+        and content_of(previous.get("inputs", {})) == content_of(inputs)
+        and outputs_exist
+        and content_of(previous.get("outputs", {})) == content_of(outputs)
+    )
+    if not up_to_date:
+        action()
+        outputs = fingerprint_outputs(target, state_dir) if record else {}
+
+    # Also refresh the recorded mtimes of touched but unchanged files.
+    state[target.name] = {"recipe": target.recipe(), "inputs": inputs, "outputs": outputs}
+    save_manifest(target.state_path, state)
+    return not up_to_date
+
+
+def fingerprint_outputs(target: Target, state_dir: str) -> dict[str, dict]:
+    # An output that was not written is missing from the state, so the target is
+    # rebuilt next time.
+    return fingerprint_files(
+        [path for path in target.outputs if os.path.exists(path)], state_dir, {}
+    )
+
+
+def record_build(target: Target) -> None:
+    """Record the outputs of a target built with record False, once they are all written."""
+    state_dir = os.path.dirname(target.state_path)
+    state = load_manifest(target.state_path)
+    previous = state.get(target.name, {})
+    state[target.name] = {
+        "recipe": target.recipe(),
+        "inputs": fingerprint_files(target.inputs, state_dir, previous.get("inputs", {})),
+        "outputs": fingerprint_outputs(target, state_dir),
+    }
+    save_manifest(target.state_path, state)
@@ -0,0 +1,278 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import os
+import re
+from dataclasses import asdict, dataclass, fields
+
+from compression import strip_compression
+from manifest import load_manifest, save_manifest
+
+CATALOG_FILE_NAME = ".run_catalog.json"
+
+BATCH_FAMILY = "batch_unlearning"
+SCALED_LR_FAMILY = "batch_unlearning_scaled_lr"
+SEQUENTIAL_FAMILY = "sequential_unlearning"
+CONTINUOUS_FAMILY = "llm_unlearning_reproduced"
+
+# Directories holding one subdirectory per family, each holding one per run.
+RUN_TREES = {
+    "framework": "eval_framework_tasks",
+    "harmfulness": "eval_harmfulness",
+    "combined": "eval_combined",
+}
+RELEARN_DIR = os.path.join("eval_relearn", "data")
+MINK_DIR = "eval_mink"
+
+# Run names of the evaluation trees, e.g. batch-128-lr1.132e-05-eval1 or seq-64-512-eval1.
+EVAL_RUN_PATTERNS = [
+    re.compile(r"batch-(?P<samples>\d+)(?:-lr(?P<lr>[0-9.e+-]+))?-eval(?P<eval_id>\d+)"),
+    re.compile(r"seq-(?P<splits>\d+)-(?P<samples>\d+)-eval(?P<eval_id>\d+)"),
+    re.compile(r".+-real(?P<seed>\d+)-eval(?P<eval_id>\d+)"),
+]
+# Model names of the relearn results, e.g. batch_size_128_lr1.132e-05 or samples_count_512_split_64.
+RELEARN_RUN_PATTERNS = [
+    re.compile(r"batch_size_(?P<samples>\d+)(?:_lr(?P<lr>[0-9.e+-]+))?"),
+    re.compile(r"samples_count_(?P<samples>\d+)_split_(?P<splits>\d+)"),
+    re.compile(r".+-real(?P<seed>\d+)"),
+]
+MINK_FILE_PATTERN = re.compile(r"continuous_unlearning_(?P<seed>\d+)_(?P<kind>.+)\.csv")
+
+
+def checkpoint_of(name: str) -> int:
+    """Index of a checkpoint named idx_N, or of its file idx_N.json."""
+    return int(name.split("_")[-1].split(".")[0])
+
+
+@dataclass(frozen=True)
+class RunInfo:
+    """Metadata of one run, parsed from its name.
+
+    Attributes which do not apply to the run, e.g. the seed of a batch
+    unlearning run, are None.
+    """
+
+    stage: str
+    family: str
+    name: str
+    path: str = ""
+    # Number of samples unlearned, in batches of batch_size.
+    unlearned_samples: int | None = None
+    batch_size: int | None = None
+    splits: int | None = None
+    # Only set for runs with a learning rate scaled to their batch size.
+    lr: float | None = None
+    seed: int | None = None
+    eval_id: int | None = None
+
+
+def parse_run_name(name: str, stage: str = "", path: str = "") -> RunInfo | None:
+    """Parse a run directory or relearn model name, None if it follows no known scheme."""
+    patterns = RELEARN_RUN_PATTERNS if stage == "relearn" else EVAL_RUN_PATTERNS
+    for pattern in patterns:
+        match = pattern.fullmatch(name)
+        if match is not None:
+            break
+    else:
+        return None
+
+    groups = {key: value for key, value in match.groupdict().items() if value is not None}
+    unlearned_samples = int(groups["samples"]) if "samples" in groups else None
+    splits = int(groups["splits"]) if "splits" in groups else None
+    if splits is not None:
+        family, batch_size = SEQUENTIAL_FAMILY, unlearned_samples // splits
+    elif unlearned_samples is not None:
+        family = SCALED_LR_FAMILY if "lr" in groups else BATCH_FAMILY
+        batch_size, splits = unlearned_samples, 1
+    else:
+        family, batch_size = CONTINUOUS_FAMILY, None
+    return RunInfo(
+        stage=stage,
+        family=family,
+        name=name,
+        path=path,
+        unlearned_samples=unlearned_samples,
+        batch_size=batch_size,
+        splits=splits,
+        lr=float(groups["lr"]) if "lr" in groups else None,
+        seed=int(groups["seed"]) if "seed" in groups else None,
+        eval_id=int(groups["eval_id"]) if "eval_id" in groups else None,
+    )
+
+
+class Catalog:
+    """Runs indexed by each of their attributes.
+
+    select(family="sequential_unlearning", unlearned_samples=512) looks the runs
+    up in the index of each attribute instead of filtering all runs, a list of
+    values matches any of them. Matches keep the order of the runs given.
+    """
+
+    def __init__(self, runs: list[RunInfo]):
+        self.runs = runs
+        self.index: dict[str, dict[object, list[int]]] = {
+            field.name: {} for field in fields(RunInfo)
+        }
+        for position, run in enumerate(runs):
+            for attribute, values in self.index.items():
+                values.setdefault(getattr(run, attribute), []).append(position)
+
+    def positions(self, **criteria) -> list[int]:
+        """Positions in runs of the runs matching all criteria."""
+        matches = None
+        for attribute, value in criteria.items():
+            assert attribute in self.index, f"Runs have no attribute {attribute}"
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            positions = set()
+            for v in values:
+                positions.update(self.index[attribute].get(v, []))
+            matches = positions if matches is None else matches & positions
+        return sorted(range(len(self.runs)) if matches is None else matches)
+
+    def select(self, **criteria) -> list[RunInfo]:
+        return [self.runs[i] for i in self.positions(**criteria)]
+
+    def evaluation_of(self, run: RunInfo) -> RunInfo | None:
+        """Evaluation run of the model run was produced by, None if it was not evaluated.
+
+        E.g. batch-128-eval1 for the relearn results of batch_size_128 or for the
+        mink CSVs of a seed. The lowest eval_id is returned if the model was
+        evaluated more than once.
+        """
+        matches = self.select(
+            stage=list(RUN_TREES),
+            family=run.family,
+            unlearned_samples=run.unlearned_samples,
+            splits=run.splits,
+            lr=run.lr,
+            seed=run.seed,
+        )
+        return min(matches, key=lambda match: match.eval_id, default=None)
+
+
+def list_subdirectories(directory: str) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+    with os.scandir(directory) as entries:
+        return sorted(entry.name for entry in entries if entry.is_dir())
+
+
+def scanned_directories(base_path: str) -> list[str]:
+    """Directories whose listings determine the runs, relative to base_path."""
+    directories = []
+    for tree in RUN_TREES.values():
+        directories.append(tree)
+        directories.extend(
+            os.path.join(tree, family)
+            for family in list_subdirectories(os.path.join(base_path, tree))
+        )
+    return directories + [RELEARN_DIR, MINK_DIR]
+
+
+def scan_runs(base_path: str) -> list[RunInfo]:
+    """Parse the runs of every result tree under base_path, skipping unknown names."""
+    runs = []
+    for stage, tree in RUN_TREES.items():
+        for family in list_subdirectories(os.path.join(base_path, tree)):
+            for name in list_subdirectories(os.path.join(base_path, tree, family)):
+                run = parse_run_name(name, stage, os.path.join(tree, family, name))
+                if run is not None:
+                    runs.append(run)
+
+    for name in list_subdirectories(os.path.join(base_path, RELEARN_DIR)):
+        run = parse_run_name(name, "relearn", os.path.join(RELEARN_DIR, name))
+        if run is not None:
+            runs.append(run)
+
+    mink_dir = os.path.join(base_path, MINK_DIR)
+    for file_name in sorted(os.listdir(mink_dir)) if os.path.isdir(mink_dir) else []:
+        match = MINK_FILE_PATTERN.fullmatch(strip_compression(file_name))
+        if match is not None:
+            runs.append(
+                RunInfo(
+                    stage=f"mink_{match['kind']}",
+                    family=CONTINUOUS_FAMILY,
+                    name=f"continuous_unlearning_{match['seed']}",
+                    path=os.path.join(MINK_DIR, file_name),
+                    seed=int(match["seed"]),
+                )
+            )
+    return runs
+
+
+def directory_mtimes(base_path: str, directories: list[str]) -> dict[str, int]:
+    mtimes = {}
+    for directory in directories:
+        path = os.path.join(base_path, directory)
+        mtimes[directory] = os.stat(path).st_mtime_ns if os.path.isdir(path) else -1
+    return mtimes
+
+
+def load_catalog(base_path: str, index_path: str | None = None) -> Catalog:
+    """Catalog of the runs under base_path, persisted in an index file.
+
+    The index is reused as long as none of the scanned directories changed, so
+    scripts can query it without listing the result trees. index_path defaults
+    to a file in base_path, an empty string disables persisting the index.
+    """
+    if index_path is None:
+        index_path = os.path.join(base_path, CATALOG_FILE_NAME)
+    stored = load_manifest(index_path) if index_path else {}
+    directories = stored.get("directories", {})
+    if directories and directory_mtimes(base_path, list(directories)) == directories:
+        return Catalog([RunInfo(**run) for run in stored["runs"]])
+
+    # Directory mtimes are read before listing, a run added meanwhile only
+    # makes the next load rescan.
+    directories = directory_mtimes(base_path, scanned_directories(base_path))
+    runs = scan_runs(base_path)
+    if index_path:
+        save_manifest(
+            index_path,
+            {"directories": directories, "runs": [asdict(run) for run in runs]},
+        )
+    return Catalog(runs)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="List the runs of all result trees matching the given attributes."
+    )
+    parser.add_argument(
+        "--base_path",
+        type=str,
+        default=".",
+        help="Path to the SNLP_GCW_data_analysis directory.",
+    )
+    parser.add_argument(
+        "--index",
+        type=str,
+        default=None,
+        help=f"Path of the persisted index, defaults to {CATALOG_FILE_NAME} in base_path. An empty string rescans the trees without persisting them.",
+    )
+    parser.add_argument("--stage", type=str, nargs="+", help="Stages, e.g. framework, relearn or mink_safety.")
+    parser.add_argument("--family", type=str, nargs="+", help="Families, e.g. sequential_unlearning.")
+    parser.add_argument("--unlearned_samples", type=int, nargs="+", help="Numbers of samples unlearned.")
+    parser.add_argument("--batch_size", type=int, nargs="+", help="Batch sizes.")
+    parser.add_argument("--splits", type=int, nargs="+", help="Numbers of splits.")
+    parser.add_argument("--seed", type=int, nargs="+", help="Seeds of continuous unlearning runs.")
+    parser.add_argument("--eval_id", type=int, nargs="+", help="Evaluation ids.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    criteria = {
+        attribute: getattr(args, attribute)
+        for attribute in ["stage", "family", "unlearned_samples", "batch_size", "splits", "seed", "eval_id"]
+        if getattr(args, attribute) is not None
+    }
+    for run in load_catalog(args.base_path, args.index).select(**criteria):
+        print(f"{run.stage}\t{run.family}\t{run.path}")
@@ -0,0 +1,170 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import fnmatch
+import gzip
+import io
+import os
+import shutil
+from typing import IO
+
+# Suffixes of compressed inputs, in the order a plain input name is looked up with them.
+COMPRESSION_SUFFIXES = [".zst", ".gz"]
+# Inputs the scripts read, the outputs are small and stay uncompressed.
+INPUT_PATTERNS = [
+    "idx_*.json",
+    "evaluation.json",
+    "predictions.json",
+    "continuous_unlearning_*.csv",
+]
+
+
+def compression_of(path: str) -> str | None:
+    """Compression suffix of path, None for an uncompressed file."""
+    for suffix in COMPRESSION_SUFFIXES:
+        if path.endswith(suffix):
+            return suffix
+    return None
+
+
+def strip_compression(name: str) -> str:
+    """Name of the uncompressed file, e.g. idx_4.json for idx_4.json.zst."""
+    suffix = compression_of(name)
+    return name[: -len(suffix)] if suffix is not None else name
+
+
+def find_input(path: str) -> str:
+    """path if it exists, else its first existing compressed variant, else path itself."""
+    if os.path.exists(path):
+        return path
+    for suffix in COMPRESSION_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+def open_input(
+    path: str, mode: str = "r", encoding: str | None = "utf-8", newline: str | None = None
+) -> IO:
+    """Open a possibly compressed input for reading, decompressing it while it is read.
+
+    mode is "r" for text or "rb" for bytes. Reading .zst files requires the
+    zstandard package.
+    """
+    assert mode in ("r", "rb"), f"Inputs are only opened for reading, not {mode}"
+    suffix = compression_of(path)
+    if suffix is None:
+        if mode == "rb":
+            return open(path, "rb")
+        return open(path, "r", encoding=encoding, newline=newline)
+
+    if suffix == ".gz":
+        raw = gzip.open(path, "rb")
+    else:
+        # Import lazily, zstandard is only needed for .zst inputs.
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    if mode == "rb":
+        return raw
+    return io.TextIOWrapper(raw, encoding=encoding, newline=newline)
+
+
+def compress_file(path: str, suffix: str = ".zst", level: int | None = None) -> str:
+    """Replace path by its compressed variant, returning the new path.
+
+    The output is written next to path under a temporary name and only moved in
+    place once complete, so an interrupted compaction never leaves a torn file.
+    """
+    output = path + suffix
+    tmp_path = f"{output}.tmp"
+    with open(path, "rb") as fin, open(tmp_path, "wb") as fout:
+        if suffix == ".gz":
+            with gzip.GzipFile(
+                filename=os.path.basename(path),
+                mode="wb",
+                fileobj=fout,
+                compresslevel=9 if level is None else level,
+                mtime=0,
+            ) as compressed:
+                shutil.copyfileobj(fin, compressed, 1 << 20)
+        else:
+            import zstandard
+
+            zstandard.ZstdCompressor(level=3 if level is None else level).copy_stream(
+                fin, fout
+            )
+    stat = os.stat(path)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp_path, output)
+    os.remove(path)
+    return output
+
+
+def compact(
+    directories: list[str],
+    patterns: list[str] = INPUT_PATTERNS,
+    suffix: str = ".zst",
+    level: int | None = None,
+    min_bytes: int = 0,
+) -> list[tuple[str, int, int]]:
+    """Compress the uncompressed files matching patterns under directories in place.
+
+    Returns the (compressed path, size before, size after) of every file compressed.
+    """
+    compacted = []
+    for directory in directories:
+        for current, _, names in os.walk(directory):
+            for name in sorted(names):
+                if compression_of(name) is not None or name.endswith(".tmp"):
+                    continue
+                if not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                    continue
+                path = os.path.join(current, name)
+                size = os.path.getsize(path)
+                if size < min_bytes:
+                    continue
+                output = compress_file(path, suffix, level)
+                compacted.append((output, size, os.path.getsize(output)))
+    return compacted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compress the input files of result trees in place. The scripts read the compressed files transparently."
+    )
+    parser.add_argument("directories", type=str, nargs="+", help="Directories to compact recursively.")
+    parser.add_argument(
+        "--format",
+        choices=["zst", "gz"],
+        default="zst",
+        help="Compression format, zst requires the zstandard package.",
+    )
+    parser.add_argument(
+        "--level", type=int, default=None, help="Compression level, defaults to 3 for zst and 9 for gz."
+    )
+    parser.add_argument(
+        "--patterns",
+        type=str,
+        nargs="+",
+        default=INPUT_PATTERNS,
+        help="File name patterns of the files to compress.",
+    )
+    parser.add_argument(
+        "--min_bytes", type=int, default=0, help="Leave files smaller than this uncompressed."
+    )
+    args = parser.parse_args()
+
+    compacted = compact(
+        args.directories, args.patterns, f".{args.format}", args.level, args.min_bytes
+    )
+    before = sum(size for _, size, _ in compacted)
+    after = sum(size for _, _, size in compacted)
+    print(f"Compressed {len(compacted)} files from {before} to {after} bytes.")
@@ -0,0 +1,357 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from itertools import repeat
+
+import eval_framework
+import eval_harmfulness
+import eval_results_combined
+from build_graph import Target, build, record_build, source_version
+from compression import find_input
+from figures import BatchRenderer, add_no_plot_argument
+from profiling import PROFILER, add_profile_arguments, start_profiling
+
+FRAMEWORK_DIR = "eval_framework_tasks"
+HARMFULNESS_DIR = "eval_harmfulness"
+COMBINED_DIR = "eval_combined"
+STAGES = ("framework", "harmfulness", "combined")
+
+
+@dataclass
+class StageOptions:
+    """Settings forwarded to the per-run entry points of the stages."""
+
+    extractor: eval_framework.MetricExtractor = eval_framework.DEFAULT_EXTRACTOR
+    incremental: bool = False
+    plot: bool = True
+    force: bool = False
+    # Plots are queued here and rendered once all runs of a stage are processed.
+    renderer: BatchRenderer | None = None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Process all evaluation runs of the selected stages in a single process."
+    )
+    parser.add_argument(
+        "--base_path",
+        type=str,
+        default=os.getcwd(),
+        help="Toplevel directory containing the eval_framework_tasks, eval_harmfulness and eval_combined trees.",
+    )
+    parser.add_argument(
+        "--stages",
+        type=str,
+        nargs="+",
+        choices=STAGES,
+        default=list(STAGES),
+        help="Stages to run, always executed in the order framework, harmfulness, combined.",
+    )
+    parser.add_argument(
+        "--families",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Experiment families to process (e.g. batch_unlearning sequential_unlearning). Defaults to all found.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes the runs of a stage are spread over (1 runs serially, 0 uses all CPUs).",
+    )
+    eval_framework.add_metric_arguments(parser)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only reprocess framework logs and combined inputs that changed since the last incremental run.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild all outputs. By default a run is skipped if its outputs exist and were built from inputs with the same content, by the same code and settings (recorded in a build state file next to the outputs).",
+    )
+    add_no_plot_argument(parser)
+    parser.add_argument(
+        "--render_workers",
+        type=int,
+        default=1,
+        help="With --workers 1, render the plots of all runs of a stage in one batch spread over this many processes (0 uses all CPUs). With more workers each run renders its own plots.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    return args
+
+
+def discover_runs(
+    stage_root: str, families: list[str] | None, required_entry: str
+) -> list[tuple[str, str]]:
+    """List (family, run) pairs under stage_root whose run directory contains required_entry."""
+    if families is None:
+        families = sorted(
+            entry.name for entry in os.scandir(stage_root) if entry.is_dir()
+        )
+
+    runs = []
+    for family in families:
+        family_dir = os.path.join(stage_root, family)
+        if not os.path.isdir(family_dir):
+            continue
+        for run in sorted(os.listdir(family_dir)):
+            if os.path.exists(find_input(os.path.join(family_dir, run, required_entry))):
+                runs.append((family, run))
+    return runs
+
+
+def build_run(target: Target, action, options: StageOptions) -> Target | None:
+    """Build target, returning it if it still has to be recorded once its plots are rendered."""
+    # Plots queued on the renderer are only written when it is flushed.
+    deferred = options.renderer is not None and options.plot
+    if not build(target, action, force=options.force, record=not deferred):
+        print(f"Outputs of {os.path.dirname(target.state_path)} are up to date, skipped.")
+        return None
+    return target if deferred else None
+
+
+def run_framework(
+    base_path: str, family: str, run: str, options: StageOptions
+) -> Target | None:
+    log_dir = os.path.join(base_path, FRAMEWORK_DIR, family, run, "eval_results")
+    run_dir = os.path.dirname(log_dir)
+    target = Target(
+        name="framework",
+        inputs=[entry.path for entry in eval_framework.list_log_files(log_dir)],
+        outputs=[os.path.join(run_dir, "results.csv")]
+        + ([os.path.join(run_dir, "figure.png")] if options.plot else []),
+        version=source_version(eval_framework),
+        config={"metrics": options.extractor.task_metrics, "plot": options.plot},
+    )
+    return build_run(
+        target,
+        lambda: eval_framework.main(
+            log_dir,
+            run,
+            options.extractor,
+            incremental=options.incremental,
+            plot=options.plot,
+            renderer=options.renderer,
+        ),
+        options,
+    )
+
+
+def run_harmfulness(
+    base_path: str, family: str, run: str, options: StageOptions
+) -> Target | None:
+    output_dir = os.path.join(base_path, HARMFULNESS_DIR, family, run)
+    plots = ["flagged-proportion.png", "avg_response_rate.png"] if options.plot else []
+    target = Target(
+        name="harmfulness",
+        inputs=[find_input(os.path.join(output_dir, "evaluation.json"))],
+        outputs=[
+            os.path.join(output_dir, name) for name in ["flagged_ratio.csv", *plots]
+        ],
+        version=source_version(eval_harmfulness),
+        config={"plot": options.plot},
+    )
+    return build_run(
+        target,
+        lambda: eval_harmfulness.main(
+            output_dir, run, plot=options.plot, renderer=options.renderer
+        ),
+        options,
+    )
+
+
+def run_combined(
+    base_path: str, family: str, run: str, options: StageOptions
+) -> Target | None:
+    log_dir = os.path.join(base_path, COMBINED_DIR, family, run)
+    os.makedirs(log_dir, exist_ok=True)
+    framework_dir = os.path.join(base_path, FRAMEWORK_DIR, family, run)
+    harmfulness_dir = os.path.join(base_path, HARMFULNESS_DIR, family, run)
+    # Depends on the content of the upstream CSVs only, so rebuilding an upstream
+    # stage with the same results does not rebuild the combined results.
+    target = Target(
+        name="combined",
+        inputs=[
+            os.path.join(framework_dir, "results.csv"),
+            os.path.join(harmfulness_dir, "flagged_ratio.csv"),
+        ],
+        outputs=[os.path.join(log_dir, "results.csv")]
+        + ([os.path.join(log_dir, "figure.png")] if options.plot else []),
+        version=source_version(eval_results_combined),
+        config={"plot": options.plot},
+    )
+    return build_run(
+        target,
+        lambda: eval_results_combined.main(
+            framework_dir,
+            harmfulness_dir,
+            run,
+            log_dir,
+            incremental=options.incremental,
+            plot=options.plot,
+            renderer=options.renderer,
+        ),
+        options,
+    )
+
+
+def stage_runs(base_path: str, stage: str, families: list[str] | None) -> list[tuple[str, str]]:
+    if stage == "framework":
+        return discover_runs(
+            os.path.join(base_path, FRAMEWORK_DIR), families, "eval_results"
+        )
+    if stage == "harmfulness":
+        return discover_runs(
+            os.path.join(base_path, HARMFULNESS_DIR), families, "evaluation.json"
+        )
+    # Combined results need both upstream CSVs of a run.
+    return [
+        (family, run)
+        for family, run in discover_runs(
+            os.path.join(base_path, HARMFULNESS_DIR), families, "flagged_ratio.csv"
+        )
+        if os.path.exists(
+            os.path.join(base_path, FRAMEWORK_DIR, family, run, "results.csv")
+        )
+    ]
+
+
+STAGE_RUNNERS = {
+    "framework": run_framework,
+    "harmfulness": run_harmfulness,
+    "combined": run_combined,
+}
+
+
+def process_run(
+    base_path: str, stage: str, family: str, run: str, options: StageOptions
+) -> tuple[str, str | None, Target | None]:
+    """Run one stage on one run.
+
+    Returns its captured output, the traceback of a failure and the target to
+    record once its queued plots are rendered.
+    """
+    output = io.StringIO()
+    error = None
+    pending = None
+    if options.renderer is not None:
+        options.renderer.tag = (family, run)
+    with contextlib.redirect_stdout(output):
+        try:
+            pending = STAGE_RUNNERS[stage](base_path, family, run, options)
+        except Exception:
+            error = traceback.format_exc()
+
+    return output.getvalue(), error, pending
+
+
+def main(
+    base_path: str,
+    stages: list[str],
+    families: list[str] | None = None,
+    workers: int = 1,
+    options: StageOptions | None = None,
+    render_workers: int = 1,
+) -> list[tuple[str, str, str]]:
+    """Process all runs of the given stages, returning the (stage, family, run) that failed.
+
+    Runs of a stage are independent and may be processed in parallel, but stages are
+    executed one after another as combined results depend on the other two. Output is
+    reported in discovery order regardless of the number of workers.
+    """
+    options = options or StageOptions()
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    if executor is None and options.plot:
+        options = replace(options, renderer=BatchRenderer(render_workers))
+    failures = []
+    try:
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+
+            print(f"Processing {stage} results..")
+            with PROFILER.phase("discover", stage=stage):
+                runs = stage_runs(base_path, stage, families)
+            if executor is None:
+                outcomes = (
+                    process_run(base_path, stage, family, run, options)
+                    for family, run in runs
+                )
+            else:
+                outcomes = executor.map(
+                    process_run,
+                    repeat(base_path),
+                    repeat(stage),
+                    [family for family, _ in runs],
+                    [run for _, run in runs],
+                    repeat(options),
+                )
+
+            pending = {}
+            for (family, run), (output, error, target) in zip(runs, outcomes):
+                print(f"Run: {family}/{run}")
+                print(output, end="")
+                if error is not None:
+                    print(error, file=sys.stderr)
+                    failures.append((stage, family, run))
+                if target is not None:
+                    pending[(family, run)] = target
+
+            if options.renderer is not None:
+                with PROFILER.phase("render", stage=stage):
+                    errors = options.renderer.flush()
+                for (family, run), error in errors:
+                    print(error, file=sys.stderr)
+                    failures.append((f"{stage} plot", family, run))
+                    # Left unrecorded, so the run is rebuilt next time.
+                    pending.pop((family, run), None)
+            for target in pending.values():
+                record_build(target)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for stage, family, run in failures:
+        print(f"Failed: {stage} {family}/{run}")
+    print("Done")
+
+    return failures
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start_profiling("eval_all", args)
+    options = StageOptions(
+        extractor=eval_framework.extractor_from_args(args),
+        incremental=args.incremental,
+        plot=not args.no_plot,
+        force=args.force,
+    )
+    failures = main(
+        args.base_path,
+        args.stages,
+        args.families,
+        args.workers,
+        options,
+        args.render_workers,
+    )
+    sys.exit(1 if failures else 0)
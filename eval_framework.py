@@ -7,12 +7,25 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import json
 import argparse
+import json
+import math
 import os
 
 import pandas as pd
 
+from catalog import checkpoint_of
+from compression import open_input, strip_compression
+from figures import (
+    BatchRenderer,
+    add_no_plot_argument,
+    pooled_figure,
+    render_or_submit,
+)
+from json_stream import extract_members
+from manifest import MANIFEST_FILE_NAME, file_signature, load_manifest, save_manifest
+from profiling import PROFILER, add_profile_arguments, start_profiling
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -30,23 +43,184 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="Path to the directory containing evaluation result logs.",
     )
+    add_metric_arguments(parser)
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only parse logs added or changed since the last incremental run (tracked in a manifest next to results.csv), and skip regenerating the outputs if there are none.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and update the results whenever a log in --log_dir is added or changed (implies --incremental).",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="With --watch, seconds without further changes before the results are updated.",
+    )
+    add_no_plot_argument(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
 
     return args
 
 
-def fetch_log_data(log_dir: str) -> dict[int, dict]:
-    log_file_names = os.listdir(log_dir)
+# (column name, task, metric) reported for every checkpoint
+TASK_METRICS = [
+    ("winogrande_acc", "winogrande", "acc,none"),
+    ("truthfulqa_mc2_acc", "truthfulqa_mc2", "acc,none"),
+    ("hellaswag_acc_norm", "hellaswag", "acc_norm,none"),
+    # ("gsm8k_exact_match_flexible", "gsm8k", "exact_match,flexible-extract"),
+    ("arc_challenge_acc_norm", "arc_challenge", "acc_norm,none"),
+    ("mmlu_acc", "mmlu", "acc,none"),
+    ("toxigen_acc_norm", "toxigen", "acc_norm,none"),
+]
+STDERR_SUFFIX = "_stderr"
+
+
+def parse_metric(spec: str) -> tuple[str, str, str]:
+    """Parse a "[column=]task:metric" specification, e.g. "gsm8k:exact_match,flexible-extract".
+
+    Without an explicit column the name is derived as in TASK_METRICS, i.e.
+    "<task>_<metric name without its filter>".
+    """
+    column, _, task_metric = spec.rpartition("=")
+    task, _, metric = task_metric.partition(":")
+    assert task and metric, f"Invalid metric specification: {spec} (expected [column=]task:metric)"
+    return column or f"{task}_{metric.split(',')[0]}", task, metric
+
+
+def load_metrics_config(config_path: str) -> list[tuple[str, str, str]]:
+    """Load a JSON list of {"task": ..., "metric": ..., "column": ... (optional)} entries."""
+    with open(config_path, "r") as f:
+        entries = json.load(f)
+
+    return [
+        parse_metric(
+            f"{entry.get('column', '')}={entry['task']}:{entry['metric']}"
+        )
+        for entry in entries
+    ]
+
+
+class MetricExtractor:
+    """Pulls a fixed set of task metrics out of the "results" of lm-eval-harness logs.
+
+    The key paths are grouped by task once, so extracting a checkpoint costs one
+    lookup per task. Metrics missing from a log are reported as NaN.
+    """
+
+    def __init__(
+        self, task_metrics: list[tuple[str, str, str]], include_stderr: bool = False
+    ):
+        self.task_metrics = list(task_metrics)
+        if include_stderr:
+            for column, task, metric in task_metrics:
+                name, _, metric_filter = metric.partition(",")
+                self.task_metrics.append(
+                    (
+                        f"{column}{STDERR_SUFFIX}",
+                        task,
+                        f"{name}_stderr,{metric_filter}" if metric_filter else f"{name}_stderr",
+                    )
+                )
+
+        self.columns = [column for column, _, _ in self.task_metrics]
+        self.by_task: dict[str, list[tuple[str, str]]] = {}
+        for column, task, metric in self.task_metrics:
+            self.by_task.setdefault(task, []).append((metric, column))
+
+    def prune(self, results: dict[str, dict]) -> dict[str, dict]:
+        """Keep only the requested metrics of the tasks present in results."""
+        pruned = {}
+        for task, metrics in self.by_task.items():
+            task_results = results.get(task)
+            if task_results is not None:
+                pruned[task] = {
+                    metric: task_results[metric]
+                    for metric, _ in metrics
+                    if metric in task_results
+                }
+        return pruned
+
+    def __call__(self, results: dict[str, dict]) -> dict[str, float]:
+        row = dict.fromkeys(self.columns, math.nan)
+        for task, metrics in self.by_task.items():
+            task_results = results.get(task, {})
+            for metric, column in metrics:
+                row[column] = task_results.get(metric, math.nan)
+        return row
+
+
+DEFAULT_EXTRACTOR = MetricExtractor(TASK_METRICS)
+
+
+def add_metric_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--metric",
+        type=str,
+        action="append",
+        default=None,
+        help="Metric to report as [column=]task:metric (e.g. gsm8k:exact_match,flexible-extract), can be repeated. Replaces the default metrics.",
+    )
+    parser.add_argument(
+        "--metrics_config",
+        type=str,
+        default=None,
+        help='Path to a JSON list of {"task": ..., "metric": ..., "column": ...} entries to report instead of the default metrics.',
+    )
+    parser.add_argument(
+        "--include_stderr",
+        action="store_true",
+        help="Also report the standard error of each metric.",
+    )
+
+
+def extractor_from_args(args: argparse.Namespace) -> MetricExtractor:
+    task_metrics = []
+    if args.metrics_config is not None:
+        task_metrics.extend(load_metrics_config(args.metrics_config))
+    if args.metric is not None:
+        task_metrics.extend(parse_metric(spec) for spec in args.metric)
+
+    return MetricExtractor(task_metrics or TASK_METRICS, args.include_stderr)
+
+
+def read_task_results(log_path: str, extractor: MetricExtractor) -> dict[str, dict]:
+    """Stream the "results" member out of a log, keeping only the requested metrics.
+
+    The rest of the log (configs, per-sample details, env info) is never decoded.
+    """
+    with PROFILER.json_parse(log_path), open_input(log_path) as f:
+        results = extract_members(f, {"results"}).get("results", {})
+
+    return extractor.prune(results)
+
+
+def is_log_file(name: str) -> bool:
+    """Whether name is an idx_N.json log, possibly compressed."""
+    return name.startswith("idx_") and strip_compression(name).endswith(".json")
+
+
+def list_log_files(log_dir: str) -> list[os.DirEntry]:
+    log_files = [entry for entry in os.scandir(log_dir) if is_log_file(entry.name)]
     assert (
-        log_file_names
+        log_files
     ), f"Beep boop, no files in a directory provided ({log_dir}). Maybe you forgot to copy them?"
 
+    return log_files
+
+
+def fetch_log_data(
+    log_dir: str, extractor: MetricExtractor = DEFAULT_EXTRACTOR
+) -> dict[int, dict]:
     log_files_contents = {}
-    for file_name in log_file_names:
-        with open(os.path.join(log_dir, file_name), "r") as f:
-            log_files_contents[int(file_name.split("_")[-1].split(".")[0])] = json.load(
-                f
-            )
+    for entry in list_log_files(log_dir):
+        log_files_contents[checkpoint_of(entry.name)] = {
+            "results": read_task_results(entry.path, extractor)
+        }
 
     # return sorted dictionary
     return {
@@ -58,42 +232,140 @@ def fetch_log_data(log_dir: str) -> dict[int, dict]:
     }
 
 
-def filter_json_logs(log_data: dict[int, dict]) -> dict[int, dict]:
+def fetch_log_data_incremental(
+    log_dir: str, manifest_path: str, extractor: MetricExtractor = DEFAULT_EXTRACTOR
+) -> tuple[dict[int, dict], bool]:
+    """Like fetch_log_data, but only parse logs added or changed since the last call.
+
+    The extracted results of every log are kept in a manifest together with the
+    log's size and mtime. Returns the log data and whether anything changed.
+    """
+    manifest = load_manifest(manifest_path)
+    if manifest.get("task_metrics") != [list(m) for m in extractor.task_metrics]:
+        manifest = {}
+    known_files = manifest.get("files", {})
+
+    files = {}
+    for entry in list_log_files(log_dir):
+        signature = file_signature(entry.stat())
+        known = known_files.get(entry.name)
+        if known is not None and known["signature"] == signature:
+            files[entry.name] = known
+        else:
+            files[entry.name] = {
+                "signature": signature,
+                "results": read_task_results(entry.path, extractor),
+            }
+
+    changed = files != known_files
+    if changed:
+        save_manifest(
+            manifest_path,
+            {
+                "task_metrics": [list(m) for m in extractor.task_metrics],
+                "files": files,
+            },
+        )
+
+    log_data = {
+        checkpoint_of(file_name): {"results": entry["results"]}
+        for file_name, entry in files.items()
+    }
+    return dict(sorted(log_data.items())), changed
+
+
+def filter_json_logs(
+    log_data: dict[int, dict], extractor: MetricExtractor = DEFAULT_EXTRACTOR
+) -> dict[int, dict]:
     results = {}
     for model_iter_num, log in log_data.items():
-        results[model_iter_num] = {
-            "winogrande_acc": log["results"]["winogrande"]["acc,none"],
-            "truthfulqa_mc2_acc": log["results"]["truthfulqa_mc2"]["acc,none"],
-            "hellaswag_acc_norm": log["results"]["hellaswag"]["acc_norm,none"],
-            # "gsm8k_exact_match_flexible": log["results"]["gsm8k"][
-            #    "exact_match,flexible-extract"
-            # ],
-            "arc_challenge_acc_norm": log["results"]["arc_challenge"]["acc_norm,none"],
-            "mmlu_acc": log["results"]["mmlu"]["acc,none"],
-            "toxigen_acc_norm": log["results"]["toxigen"]["acc_norm,none"],
-        }
+        results[model_iter_num] = extractor(log["results"])
 
     return results
 
 
+def split_stderr_columns(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+    """Split metric columns from their standard errors, keyed by the metric column name."""
+    stderr_columns = [c for c in df.columns if c.endswith(STDERR_SUFFIX)]
+    if not stderr_columns:
+        return df, None
+
+    stderr = df[stderr_columns].rename(columns=lambda c: c[: -len(STDERR_SUFFIX)])
+    return df.drop(columns=stderr_columns), stderr
+
+
 def create_plot(df: pd.DataFrame, log_dir: str, plot_title: str) -> None:
-    ax = df.plot(style=["o-"] * 7, zorder=2)
-    fig = ax.get_figure()
-    ax.set_title(f"Task eval of: {plot_title}")
-    ax.grid(axis="y", zorder=1, alpha=0.4)
-    fig.savefig(os.path.join(log_dir, "..", "figure.png"))
+    values, stderr = split_stderr_columns(df)
+    error_bars = {} if stderr is None else {"yerr": stderr, "capsize": 3}
+    path = os.path.join(log_dir, "..", "figure.png")
+    with PROFILER.render(path), pooled_figure() as fig:
+        ax = values.plot(ax=fig.subplots(), style="o-", zorder=2, **error_bars)
+        ax.set_title(f"Task eval of: {plot_title}")
+        ax.grid(axis="y", zorder=1, alpha=0.4)
+        fig.savefig(path)
+
+
+def main(
+    log_dir: str,
+    plot_title: str,
+    extractor: MetricExtractor = DEFAULT_EXTRACTOR,
+    incremental: bool = False,
+    plot: bool = True,
+    renderer: BatchRenderer | None = None,
+):
+    results_path = os.path.join(log_dir, "..", "results.csv")
+    with PROFILER.phase("parse", run=log_dir):
+        if incremental:
+            log_data, changed = fetch_log_data_incremental(
+                log_dir, os.path.join(log_dir, "..", MANIFEST_FILE_NAME), extractor
+            )
+            if not changed and os.path.exists(results_path):
+                print(f"No new or changed logs in {log_dir}, results are up to date.")
+                return
+        else:
+            log_data = fetch_log_data(log_dir, extractor)
+    with PROFILER.phase("compute", run=log_dir):
+        filtered_logs = filter_json_logs(log_data, extractor)
 
+        df = pd.DataFrame.from_dict(filtered_logs).transpose()
 
-def main(log_dir: str, plot_title: str):
-    log_data = fetch_log_data(log_dir)
-    filtered_logs = filter_json_logs(log_data)
+    if plot:
+        render_or_submit(renderer, log_dir, create_plot, df, log_dir, plot_title)
+    with PROFILER.phase("write", run=log_dir):
+        df.to_csv(results_path, index_label="checkpoint")
 
-    df = pd.DataFrame.from_dict(filtered_logs).transpose()
 
-    create_plot(df, log_dir, plot_title)
-    df.to_csv(os.path.join(log_dir, "..", "results.csv"), index=False)
+def watch_log_dir(
+    log_dir: str,
+    plot_title: str,
+    extractor: MetricExtractor = DEFAULT_EXTRACTOR,
+    debounce: float = 2.0,
+    plot: bool = True,
+) -> None:
+    from watch import watch
+
+    def update() -> None:
+        main(log_dir, plot_title, extractor, incremental=True, plot=plot)
+
+    watch(log_dir, "idx_*.json*", update, debounce)
 
 
 if __name__ == "__main__":
     args = parse_args()
-    main(args.log_dir, args.plot_title)
+    start_profiling("eval_framework", args)
+    if args.watch:
+        watch_log_dir(
+            args.log_dir,
+            args.plot_title,
+            extractor_from_args(args),
+            args.debounce,
+            plot=not args.no_plot,
+        )
+    else:
+        main(
+            args.log_dir,
+            args.plot_title,
+            extractor_from_args(args),
+            incremental=args.incremental,
+            plot=not args.no_plot,
+        )
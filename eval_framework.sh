@@ -1,10 +1,6 @@
 #! /bin/bash
 
 BASE_PATH=`pwd`
-EVAL_FRAMEWORK_PATH=$BASE_PATH/eval_framework_tasks
-BATCH_EVAL_PATH=$EVAL_FRAMEWORK_PATH/batch_unlearning
-SEQ_EVAL_PATH=$EVAL_FRAMEWORK_PATH/sequential_unlearning
-LLM_UNLEARN_EVAL_PATH=$EVAL_FRAMEWORK_PATH/llm_unlearning_reproduced
 VENV_ACTIVATION_PATH=$BASE_PATH/../venv/bin/activate
 
 # Ensure we are in the toplevel directory of the SNLP_GCW_data_analysis repo!
@@ -23,36 +19,8 @@ else
     exit 1
 fi
 
-
-batch_runs=$(ls $BATCH_EVAL_PATH)
-seq_runs=$(ls $SEQ_EVAL_PATH)
-llm_unlearning_reproduced_runs=$(ls $LLM_UNLEARN_EVAL_PATH)
-
-echo "Processing results for batch runs.."
-for run in ${batch_runs[@]}
-do
-    echo "Run: $run"
-    python3 eval_framework.py \
-     --plot_title `basename $run` \
-     --log_dir $BATCH_EVAL_PATH/$run/eval_results
-done
-
-echo "Processing results for sequential runs.."
-for run in ${seq_runs[@]}
-do
-    echo "Run: $run"
-    python3 eval_framework.py \
-     --plot_title `basename $run` \
-     --log_dir $SEQ_EVAL_PATH/$run/eval_results
-done
-
-echo "Processing results for llm_unlearning_reproduced runs.."
-for run in ${llm_unlearning_reproduced_runs[@]}
-do
-    echo "Run: $run"
-    python3 eval_framework.py \
-     --plot_title `basename $run` \
-     --log_dir $LLM_UNLEARN_EVAL_PATH/$run/eval_results
-done
-
-echo "Done"
+# All runs are processed in a single python process, see eval_all.py
+python3 eval_all.py \
+ --base_path $BASE_PATH \
+ --stages framework \
+ --families batch_unlearning sequential_unlearning llm_unlearning_reproduced
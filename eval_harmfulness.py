@@ -10,12 +10,26 @@
 
 import json
 import os
+import sys
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import argparse
 import re
+from typing import Iterable
+
+from build_graph import source_version
+from catalog import checkpoint_of
+from compression import compression_of, find_input, open_input
+from figures import (
+    BatchRenderer,
+    add_no_plot_argument,
+    pooled_figure,
+    render_or_submit,
+)
+from json_stream import iter_records
+from manifest import file_sha256
+from profiling import PROFILER, add_profile_arguments, start_profiling
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -38,52 +52,137 @@ def parse_arguments() -> argparse.Namespace:
         required=True,
         help="Where to store.",
     )
+    parser.add_argument(
+        "--reformat_json",
+        action="store_true",
+        help="Rewrite evaluation.json pretty-printed before computing the metrics (the input is left untouched by default).",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always recompute the metrics from evaluation.json, ignoring and not updating the metrics cache.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and update the metrics and plots whenever evaluation.json in --output_dir changes.",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="With --watch, seconds without further changes before the results are updated.",
+    )
+    add_no_plot_argument(parser)
+    add_profile_arguments(parser)
     return parser.parse_args()
 
 
-def calculate_flagged_proportion_and_agreement(data: dict) -> dict:
-    flagged_moderation = np.array(
-        [line["flagged"]["QAModeration"] for line in data], dtype=bool
-    )
+NON_WORD_CHARACTER = re.compile(r"[\W]")
+METRICS_CACHE_FILE_NAME = ".flagged_ratio_cache.json"
 
-    return {
-        "flagged/all": flagged_moderation.mean(),
-    }
 
+def metrics_version() -> str:
+    """Version of the code computing the metrics, e.g. this module and its parser."""
+    return source_version(sys.modules[__name__])
 
-def calculate_output_quality_heuristics(data: dict) -> dict:
-    special_char_count = np.array(
-        [
-            (
-                0
-                if len(line["response"]) == 0
-                else len(re.findall("[\W]", line["response"])) / len(line["response"])
-            )
-            for line in data
-        ],
-        dtype=float,
-    )
 
-    empty_count = np.array(
-        [(1 if len(line["response"]) == 0 else 0) for line in data],
-        dtype=float,
-    )
+def load_cached_metrics(eval_path: str, cache_path: str) -> pd.DataFrame | None:
+    """Return the cached metrics if they were computed from the current eval_path content.
 
-    return {
-        "special_char_count/characters_in_response": special_char_count.mean(),
-        "empty_response_ratio": empty_count.mean(),
-    }
+    The file is only hashed when its size matches but its mtime changed, so an
+    unchanged evaluation.json costs a single stat call. Metrics computed by a
+    different version of the code are stale too.
+    """
+    if not os.path.exists(cache_path):
+        return None
 
+    with open(cache_path, encoding="utf-8") as f:
+        cache = json.load(f)
+
+    if cache.get("version") != metrics_version():
+        return None
+    stat = os.stat(eval_path)
+    if cache["size"] != stat.st_size:
+        return None
+    if cache["mtime_ns"] != stat.st_mtime_ns:
+        if cache["sha256"] != file_sha256(eval_path):
+            return None
+        # Same content, only touched: remember the new mtime to skip hashing next time.
+        cache["mtime_ns"] = stat.st_mtime_ns
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+
+    return pd.DataFrame(cache["metrics"])
 
-def calculate_response_length(data: dict) -> dict:
-    response_len = np.array(
-        [len(line["response"]) for line in data],
-        dtype=float,
-    )
 
-    return {
-        "avg_response_length": response_len.mean(),
+def store_cached_metrics(eval_path: str, cache_path: str, df: pd.DataFrame) -> None:
+    stat = os.stat(eval_path)
+    cache = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_sha256(eval_path),
+        "version": metrics_version(),
+        "metrics": df.to_dict("records"),
     }
+    with open(cache_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+
+
+# Per-model sums accumulated over the records, in the order of SUM_COLUMNS.
+SUM_COLUMNS = ["count", "flagged", "empty", "response_length", "special_char_ratio"]
+
+
+def accumulate_metrics(records: Iterable[dict]) -> tuple[list[str], np.ndarray]:
+    """Sum the metrics of each model (checkpoint) over records in a single pass.
+
+    Records are consumed one at a time and only the running sums are kept, so
+    records can be streamed from a file of any size. Returns the distinct model
+    names and an array with one row per model and one column per SUM_COLUMNS.
+    """
+    sums: dict[str, list] = {}
+    for line in records:
+        response = line["response"]
+        response_length = len(response)
+        model_sums = sums.get(line["model"])
+        if model_sums is None:
+            model_sums = sums[line["model"]] = [0, 0, 0, 0, 0.0]
+        model_sums[0] += 1
+        model_sums[1] += bool(line["flagged"]["QAModeration"])
+        if response_length:
+            model_sums[3] += response_length
+            model_sums[4] += len(NON_WORD_CHARACTER.findall(response)) / response_length
+        else:
+            model_sums[2] += 1
+
+    return list(sums), np.asarray(list(sums.values()), dtype=float).reshape(-1, len(SUM_COLUMNS))
+
+
+def load_evaluation_sums(eval_path: str) -> tuple[list[str], np.ndarray]:
+    """Accumulate the metrics of evaluation.json, a JSON array or JSON lines.
+
+    The file is streamed record by record instead of being loaded at once, so
+    memory does not grow with the number of responses.
+    """
+    with PROFILER.json_parse(eval_path), open_input(eval_path) as f:
+        return accumulate_metrics(iter_records(f))
+
+
+def compute_metrics(model_names: list[str], sums: np.ndarray) -> pd.DataFrame:
+    """Compute every metric for all models from their accumulated sums."""
+    means = dict(zip(SUM_COLUMNS[1:], (sums[:, 1:] / sums[:, :1]).T))
+    df = pd.DataFrame(
+        {
+            "model_name": model_names,
+            "flagged/all": means["flagged"],
+            "special_char_count/characters_in_response": means["special_char_ratio"],
+            "empty_response_ratio": means["empty"],
+            "avg_response_length": means["response_length"],
+        }
+    )
+
+    order = sorted(range(len(model_names)), key=lambda i: checkpoint_of(model_names[i]))
+    return df.iloc[order].reset_index(drop=True)
 
 
 def plot_metrics(metrics: list[dict], output_dir: str, plot_title: str) -> None:
@@ -96,118 +195,153 @@ def plot_metrics(metrics: list[dict], output_dir: str, plot_title: str) -> None:
     empty = np.asarray([row["empty_response_ratio"] for row in metrics])
     bar_width = 0.25
     index = np.arange(len(moderation))
-    _, ax = plt.subplots(figsize=(8, 6), dpi=150)
-    ax.bar(
-        index,
-        1.0 - moderation,
-        bar_width,
-        label="Model safety evaluation",
-        color="#FF6D60",
-        alpha=0.85,
-        zorder=2,
-    )
-    plt.legend(bbox_to_anchor=(0.55, -0.2), loc="lower right")
-
-    ax_twin = ax.twinx()
-
-    ax_twin.scatter(
-        index,
-        special_chars,
-        s=100,
-        label="special chars/all chars ratio",
-        color="#00FF00",
-        alpha=0.85,
-        zorder=2,
-        marker="s",
-    )
-
-    ax_twin.scatter(
-        index,
-        empty,
-        s=100,
-        label="empty responses ratio",
-        color="#0000FF",
-        alpha=0.85,
-        zorder=2,
-    )
-
-    plt.legend(bbox_to_anchor=(0.55, -0.4), loc="lower right")
-
-    ax.grid(axis="y", color="k", alpha=0.2, zorder=1)
-    # ax.set_xticks(index + bar_width)
-    ax.set_xticks(index)
-    ax.set_xticklabels(model_names)
-    ax.set_xlabel("Model")
-    ax.set_ylabel("Proportion of safe QA Pairs")
-    ax.set_title(f"Safety Evaluation of: {plot_title}")
-    ax.set_yticks(np.arange(0.4, 1.1, 0.1))
-    ax.axhline(y=1.0, color="k", linestyle="-.", alpha=0.5)
-    ax.set_yticklabels([f"{i}%" for i in range(40, 110, 10)])
-    ax.set_ylim(0.35, 1.03)
-
-    ax_twin.set_yticks(np.arange(0, 1, 0.1))
-    ax_twin.set_yticklabels([f"{i*10}%" for i in range(0, 10, 1)])
-    ax_twin.set_ylim(0, 1)
-
-    plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, "flagged-proportion.png"))
-
-    plt.clf()
-    _, ax = plt.subplots(figsize=(8, 6), dpi=150)
-    avg_response_length = np.asarray([row["avg_response_length"] for row in metrics])
-    ax.bar(
-        index,
-        avg_response_length,
-        bar_width,
-        # label="Avg response length",
-        color="#FF6D60",
-        alpha=0.85,
-        zorder=2,
-    )
-
-    ax.set_xlabel("Model")
-    ax.set_ylabel("Characters")
-    ax.set_title(f"Average safety response length: {plot_title}")
-
-    ax.grid(axis="y", color="k", alpha=0.2, zorder=1)
-    plt.tight_layout()
-    # plt.legend()
-
-    plt.savefig(os.path.join(output_dir, "avg_response_rate.png"))
+    path = os.path.join(output_dir, "flagged-proportion.png")
+    with PROFILER.render(path), pooled_figure(figsize=(8, 6), dpi=150) as fig:
+        ax = fig.subplots()
+        ax.bar(
+            index,
+            1.0 - moderation,
+            bar_width,
+            label="Model safety evaluation",
+            color="#FF6D60",
+            alpha=0.85,
+            zorder=2,
+        )
+        ax.legend(bbox_to_anchor=(0.55, -0.2), loc="lower right")
+
+        ax_twin = ax.twinx()
+
+        ax_twin.scatter(
+            index,
+            special_chars,
+            s=100,
+            label="special chars/all chars ratio",
+            color="#00FF00",
+            alpha=0.85,
+            zorder=2,
+            marker="s",
+        )
 
+        ax_twin.scatter(
+            index,
+            empty,
+            s=100,
+            label="empty responses ratio",
+            color="#0000FF",
+            alpha=0.85,
+            zorder=2,
+        )
 
-def main() -> None:
-    args = parse_arguments()
+        ax_twin.legend(bbox_to_anchor=(0.55, -0.4), loc="lower right")
+
+        ax.grid(axis="y", color="k", alpha=0.2, zorder=1)
+        # ax.set_xticks(index + bar_width)
+        ax.set_xticks(index)
+        ax.set_xticklabels(model_names)
+        ax.set_xlabel("Model")
+        ax.set_ylabel("Proportion of safe QA Pairs")
+        ax.set_title(f"Safety Evaluation of: {plot_title}")
+        ax.set_yticks(np.arange(0.4, 1.1, 0.1))
+        ax.axhline(y=1.0, color="k", linestyle="-.", alpha=0.5)
+        ax.set_yticklabels([f"{i}%" for i in range(40, 110, 10)])
+        ax.set_ylim(0.35, 1.03)
+
+        ax_twin.set_yticks(np.arange(0, 1, 0.1))
+        ax_twin.set_yticklabels([f"{i*10}%" for i in range(0, 10, 1)])
+        ax_twin.set_ylim(0, 1)
+
+        fig.tight_layout()
+        fig.savefig(path)
+
+    # Same size, so the pool hands back the figure just cleared.
+    path = os.path.join(output_dir, "avg_response_rate.png")
+    with PROFILER.render(path), pooled_figure(figsize=(8, 6), dpi=150) as fig:
+        ax = fig.subplots()
+        avg_response_length = np.asarray(
+            [row["avg_response_length"] for row in metrics]
+        )
+        ax.bar(
+            index,
+            avg_response_length,
+            bar_width,
+            # label="Avg response length",
+            color="#FF6D60",
+            alpha=0.85,
+            zorder=2,
+        )
 
-    with open(os.path.join(args.output_dir, "evaluation.json"), encoding="utf-8") as f:
-        data = json.load(f)
+        ax.set_xlabel("Model")
+        ax.set_ylabel("Characters")
+        ax.set_title(f"Average safety response length: {plot_title}")
+
+        ax.grid(axis="y", color="k", alpha=0.2, zorder=1)
+        fig.tight_layout()
+
+        fig.savefig(path)
+
+
+def main(
+    output_dir: str,
+    plot_title: str,
+    reformat_json: bool = False,
+    use_cache: bool = True,
+    plot: bool = True,
+    renderer: BatchRenderer | None = None,
+) -> None:
+    eval_path = find_input(os.path.join(output_dir, "evaluation.json"))
+    cache_path = os.path.join(output_dir, METRICS_CACHE_FILE_NAME)
+
+    if reformat_json:
+        assert compression_of(eval_path) is None, f"Cannot reformat compressed {eval_path}"
+        with open(eval_path, encoding="utf-8") as f:
+            data = json.load(f)
+        with open(eval_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+    df = load_cached_metrics(eval_path, cache_path) if use_cache else None
+    if df is None:
+        # Parsing includes accumulating the sums of every streamed record.
+        with PROFILER.phase("parse", run=output_dir):
+            model_names, sums = load_evaluation_sums(eval_path)
+        with PROFILER.phase("compute", run=output_dir):
+            df = compute_metrics(model_names, sums)
+        if use_cache:
+            store_cached_metrics(eval_path, cache_path, df)
 
-    model_names_set = set([line["model"] for line in data])
-    model_names = sorted(model_names_set, key=lambda x: int(x.split("_")[1]))
+    # report to terminal and save to file
+    print(df)
+    with PROFILER.phase("write", run=output_dir):
+        df.to_csv(os.path.join(output_dir, "flagged_ratio.csv"), index=False)
 
-    with open(f"{args.output_dir}/evaluation.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    if plot:
+        render_or_submit(
+            renderer, output_dir, plot_metrics, df.to_dict("records"), output_dir, plot_title
+        )
 
-    metrics = []
-    for model_name in model_names:
-        model_data = [line for line in data if line["model"] == model_name]
 
-        metrics.append(
-            {
-                "model_name": model_name,
-                **calculate_flagged_proportion_and_agreement(model_data),
-                **calculate_output_quality_heuristics(model_data),
-                **calculate_response_length(model_data),
-            },
-        )
+def watch_output_dir(
+    output_dir: str, plot_title: str, debounce: float = 2.0, plot: bool = True
+) -> None:
+    from watch import watch
 
-    # report to terminal and save to file
-    df = pd.DataFrame(metrics)
-    print(df)
-    df.to_csv(os.path.join(args.output_dir, "flagged_ratio.csv"), index=False)
+    def update() -> None:
+        main(output_dir, plot_title, plot=plot)
 
-    plot_metrics(metrics, args.output_dir, args.plot_title)
+    watch(output_dir, "evaluation.json*", update, debounce)
 
 
 if __name__ == "__main__":
-    main()
+    args = parse_arguments()
+    start_profiling("eval_harmfulness", args)
+    if args.watch:
+        watch_output_dir(
+            args.output_dir, args.plot_title, args.debounce, plot=not args.no_plot
+        )
+    else:
+        main(
+            args.output_dir,
+            args.plot_title,
+            reformat_json=args.reformat_json,
+            use_cache=not args.no_cache,
+            plot=not args.no_plot,
+        )
@@ -1,229 +1,429 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib
+import argparse
+import dataclasses
+import glob
+import json
 import os
-from sklearn.preprocessing import MinMaxScaler
-import seaborn as sns
-
-# Define file paths
-base_path = "eval_mink/"
-badloss_files = [
-    f"{base_path}continuous_unlearning_42_badloss_mink.csv",
-    f"{base_path}continuous_unlearning_456_badloss_mink.csv",
-    f"{base_path}continuous_unlearning_1234_badloss_mink.csv",
-    f"{base_path}continuous_unlearning_8888_badloss_mink.csv",
-    f"{base_path}continuous_unlearning_114514_badloss_mink.csv",
-]
-safety_files = [
-    f"{base_path}continuous_unlearning_42_safety.csv",
-    f"{base_path}continuous_unlearning_456_safety.csv",
-    f"{base_path}continuous_unlearning_1234_safety.csv",
-    f"{base_path}continuous_unlearning_8888_safety.csv",
-    f"{base_path}continuous_unlearning_114514_safety.csv",
-]
-
-# Load CSVs
-badloss_dfs = [pd.read_csv(file) for file in badloss_files]
-safety_dfs = [pd.read_csv(file) for file in safety_files]
-
-# Combine and compute average for each step
-badloss_combined = pd.concat(badloss_dfs).groupby("Step").mean().reset_index()
-safety_combined = pd.concat(safety_dfs).groupby("Step").mean().reset_index()
-
-# Plotting
-matplotlib.rcParams.update(
-    {
-        "pgf.texsystem": "pdflatex",
-        "font.family": "serif",
-        "text.usetex": True,
-    }
-)
-matplotlib.use("pgf")
-sns.set(style="whitegrid", font_scale=2)
-plt.rcParams.update(
-    {
-        "text.color": "black",
-        "axes.edgecolor": "black",
-        "axes.labelcolor": "black",
-        "xtick.color": "black",
-        "ytick.color": "black",
-        "axes.linewidth": 1.5,  # Set the width of the axes border
-        "xtick.major.size": 5,  # Set the length of the major ticks on x-axis
-        "xtick.minor.size": 3,  # Set the length of the minor ticks on x-axis
-        "ytick.major.size": 5,  # Set the length of the major ticks on y-axis
-        "ytick.minor.size": 3,  # Set the length of the minor ticks on y-axis
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import CONTINUOUS_FAMILY
+from compression import open_input
+from figures import add_no_plot_argument, load_pyplot, pooled_figure
+from profiling import PROFILER, add_profile_arguments, start_profiling
+from seed_aggregation import aggregate_seeds, classify_seed_files
+from smoothing import min_max_normalise, rolling_mean
+from step_alignment import ALIGN_METHODS, DOWNSAMPLE_METHODS, align_frames, downsample
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+DEFAULT_BASE_PATH = "eval_mink/"
+BADLOSS_KIND = "badloss_mink"
+SAFETY_KIND = "safety"
+METRIC_COLUMNS = ["bad loss", "ratio mink unlearning/reference"]
+SAFETY_COLUMN = "safety_eval_beaverdam-7b"
+# File name suffix of each figure variant.
+VARIANTS = {"raw": "_raw", "smoothed": ""}
+
+
+@dataclass
+class MinkPlotConfig:
+    """One set of figures, any field can be overridden per entry of a --config file."""
+
+    inputs: List[str] = field(
+        default_factory=lambda: [
+            os.path.join(DEFAULT_BASE_PATH, "continuous_unlearning_*.csv*")
+        ]
+    )
+    store: Optional[str] = None
+    output_dir: str = DEFAULT_BASE_PATH
+    file_name: str = "badloss_mink_safety_vs_step"
+    variants: List[str] = field(default_factory=lambda: list(VARIANTS))
+    formats: List[str] = field(default_factory=lambda: ["png", "pgf"])
+    usetex: bool = True
+    raw_title: str = "Raw Metrics over Steps (Safety Eval Clipped 0.7-0.9)"
+    smoothed_title: str = (
+        "Smoothed then Normalized Metrics over Steps (Safety Eval Clipped 0.7-0.9)"
+    )
+    raw_ylim: Tuple[float, float] = (0, 65)
+    smoothed_ylim: Tuple[float, float] = (0, 1)
+    safety_ylim: Tuple[float, float] = (0.7, 0.9)
+    smoothing_window: int = 10
+    n_resamples: int = 1000
+    max_points: int = 0
+    downsample_method: str = "minmax"
+    export_aligned: Optional[str] = None
+    align_method: str = "linear"
+    plot: bool = True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Plot bad loss, min-k ratio and safety evaluation of continuous unlearning over steps."
+    )
+    defaults = MinkPlotConfig()
+    parser.add_argument(
+        "--inputs",
+        type=str,
+        nargs="+",
+        default=defaults.inputs,
+        help="Glob patterns of the continuous_unlearning_<seed>_{badloss_mink,safety}.csv files to average over seeds.",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Read the per-seed metrics from this results store (see results_store.py) instead of the CSV files.",
+    )
+    parser.add_argument(
+        "--output_dir", type=str, default=defaults.output_dir, help="Directory the figures are saved to."
+    )
+    parser.add_argument(
+        "--file_name",
+        type=str,
+        default=defaults.file_name,
+        help="File name of the figures, the raw variant gets a _raw suffix.",
+    )
+    parser.add_argument(
+        "--variants",
+        choices=list(VARIANTS),
+        nargs="+",
+        default=defaults.variants,
+        help="Figures to plot: raw values and/or smoothed then min-max normalised values.",
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        default=defaults.formats,
+        help="File formats every figure is saved in, pgf goes through LaTeX, the others do not.",
+    )
+    parser.add_argument(
+        "--no_usetex",
+        action="store_true",
+        help="Render text with matplotlib instead of LaTeX, for machines without a LaTeX installation (no pgf output).",
+    )
+    parser.add_argument("--raw_title", type=str, default=defaults.raw_title, help="Title of the raw figure.")
+    parser.add_argument(
+        "--smoothed_title", type=str, default=defaults.smoothed_title, help="Title of the smoothed figure."
+    )
+    parser.add_argument(
+        "--raw_ylim", type=float, nargs=2, default=defaults.raw_ylim, help="Bad loss axis limits of the raw figure."
+    )
+    parser.add_argument(
+        "--smoothed_ylim",
+        type=float,
+        nargs=2,
+        default=defaults.smoothed_ylim,
+        help="Bad loss axis limits of the smoothed figure.",
+    )
+    parser.add_argument(
+        "--safety_ylim", type=float, nargs=2, default=defaults.safety_ylim, help="Safety evaluation axis limits."
+    )
+    parser.add_argument(
+        "--smoothing_window",
+        type=int,
+        default=defaults.smoothing_window,
+        help="Window of the rolling mean of the smoothed figure.",
+    )
+    parser.add_argument(
+        "--n_resamples",
+        type=int,
+        default=defaults.n_resamples,
+        help="Bootstrap resamples for the confidence interval over seeds, 0 to skip it.",
+    )
+    parser.add_argument(
+        "--max_points",
+        type=int,
+        default=defaults.max_points,
+        help="Downsample every plotted series to at most this many points, 0 plots every step.",
+    )
+    parser.add_argument(
+        "--downsample_method",
+        choices=DOWNSAMPLE_METHODS,
+        default=defaults.downsample_method,
+        help="mean plots bucket means, minmax keeps each bucket's extremes so spikes stay visible.",
+    )
+    parser.add_argument(
+        "--export_aligned",
+        type=str,
+        default=None,
+        help="Also write bad loss, min-k ratio and safety aligned on the safety evaluation steps to this CSV.",
+    )
+    parser.add_argument(
+        "--align_method",
+        choices=ALIGN_METHODS,
+        default=defaults.align_method,
+        help="How the per-step metrics are resampled onto the safety evaluation steps for --export_aligned.",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="JSON file with a list of configurations (objects with the fields of MinkPlotConfig), each overriding the other arguments; all are plotted in one process.",
+    )
+    add_no_plot_argument(parser)
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+def configs_from_args(args: argparse.Namespace) -> List[MinkPlotConfig]:
+    options = {
+        f.name: getattr(args, f.name)
+        for f in dataclasses.fields(MinkPlotConfig)
+        if hasattr(args, f.name)
     }
-)
-
-##### Plot Raw values ####
-
-fig, ax1 = plt.subplots(figsize=(14, 9))
-
-color = "tab:red"
-ax1.set_xlabel("Step")
-# Smoothed then Normalized
-ax1.set_ylabel(r"Bad Loss \& Ratio Mink Unlearning/Reference", color=color, labelpad=10)
-
-ax1.plot(
-    badloss_combined["Step"],
-    badloss_combined["bad loss"],
-    color=color,
-    label="Bad Loss",
-    linewidth=3,
-)
-ax1.plot(
-    badloss_combined["Step"],
-    badloss_combined["ratio mink unlearning/reference"],
-    color="tab:orange",
-    linestyle="--",
-    label="Ratio Mink Unlearning/Reference",
-    linewidth=3,
-)
-ax1.tick_params(axis="y", labelcolor=color)
-ax1.grid(True, linestyle="--", alpha=0.5)
-
-ax2 = ax1.twinx()
-color = "tab:blue"
-ax2.set_ylabel("Safety Evaluation", color=color, labelpad=10)
-ax2.plot(
-    safety_combined["Step"],
-    safety_combined["safety_eval_beaverdam-7b"],
-    color=color,
-    linestyle=":",
-    label="Safety Eval",
-    linewidth=3,
-)
-ax2.tick_params(axis="y", labelcolor=color)
-
-y_ticks_left = np.linspace(0, 65, num=6)  # For example, create 6 ticks from 0 to 1
-y_ticks_right = np.linspace(
-    0.7, 0.9, num=6
-)  # Ensure same number of ticks for right axis, but within 0.7 to 0.9
-ax1.set_ylim([0, 65])  # Set the limit to match the ticks for the left axis
-ax1.set_yticks(y_ticks_left)  # Apply the ticks to the left axis
-ax2.set_ylim([0.7, 0.9])  # Set the limit to match the ticks for the right axis
-ax2.set_yticks(y_ticks_right)  # Apply the ticks to the right axis
-
-# Adding a legend to the plot
-lines, labels = ax1.get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-plt.legend(
-    lines + lines2,
-    labels + labels2,
-    # title="Method",
-    loc="upper center",
-    bbox_to_anchor=(
-        0.5,
-        -0.097,
-    ),  # The negative value in the second argument pushes the legend below the plot.
-    ncol=3,  # Adjust based on your number of legend items
-    frameon=True,
-    fancybox=True,
-    # borderpad=1.25,
-    edgecolor="black",
-)
-
-fig.tight_layout()
-plt.title(
-    "Raw Metrics over Steps (Safety Eval Clipped 0.7-0.9)", pad=20
-)
-plt.show()
-plt.savefig(os.path.join(base_path, "badloss_mink_safety_vs_step_raw.png"))
-plt.savefig(
-    os.path.join(base_path, "badloss_mink_safety_vs_step_raw.pgf"), bbox_inches="tight"
-)
-
-
-##### Plot smoothed then normalised ####
-
-# Apply smoothing
-badloss_combined["bad loss"] = badloss_combined["bad loss"].rolling(window=10).mean()
-badloss_combined["ratio mink unlearning/reference"] = (
-    badloss_combined["ratio mink unlearning/reference"].rolling(window=10).mean()
-)
-
-# Normalize smoothed data
-scaler = MinMaxScaler()
-columns_to_normalize = ["bad loss", "ratio mink unlearning/reference"]
-badloss_combined[columns_to_normalize] = scaler.fit_transform(
-    badloss_combined[columns_to_normalize]
-)
-
-
-fig, ax1 = plt.subplots(figsize=(14, 9))
-
-color = "tab:red"
-ax1.set_xlabel("Step")
-# Smoothed then Normalized
-ax1.set_ylabel(r"Bad Loss \& Ratio Mink Unlearning/Reference", color=color, labelpad=10)
-
-ax1.plot(
-    badloss_combined["Step"],
-    badloss_combined["bad loss"],
-    color=color,
-    label="Bad Loss",
-    linewidth=3,
-)
-ax1.plot(
-    badloss_combined["Step"],
-    badloss_combined["ratio mink unlearning/reference"],
-    color="tab:orange",
-    linestyle="--",
-    label="Ratio Mink Unlearning/Reference",
-    linewidth=3,
-)
-ax1.tick_params(axis="y", labelcolor=color)
-ax1.grid(True, linestyle="--", alpha=0.5)
-
-ax2 = ax1.twinx()
-color = "tab:blue"
-ax2.set_ylabel("Safety Evaluation", color=color, labelpad=10)
-ax2.plot(
-    safety_combined["Step"],
-    safety_combined["safety_eval_beaverdam-7b"],
-    color=color,
-    linestyle=":",
-    label="Safety Eval",
-    linewidth=3,
-)
-ax2.tick_params(axis="y", labelcolor=color)
-
-y_ticks_left = np.linspace(0, 1, num=6)  # For example, create 6 ticks from 0 to 1
-y_ticks_right = np.linspace(
-    0.7, 0.9, num=6
-)  # Ensure same number of ticks for right axis, but within 0.7 to 0.9
-ax1.set_ylim([0, 1])  # Set the limit to match the ticks for the left axis
-ax1.set_yticks(y_ticks_left)  # Apply the ticks to the left axis
-ax2.set_ylim([0.7, 0.9])  # Set the limit to match the ticks for the right axis
-ax2.set_yticks(y_ticks_right)  # Apply the ticks to the right axis
-
-# Adding a legend to the plot
-lines, labels = ax1.get_legend_handles_labels()
-lines2, labels2 = ax2.get_legend_handles_labels()
-# ax1.legend(lines + lines2, labels + labels2, loc='best')
-plt.legend(
-    lines + lines2,
-    labels + labels2,
-    # title="Method",
-    loc="upper center",
-    bbox_to_anchor=(
-        0.5,
-        -0.097,
-    ),  # The negative value in the second argument pushes the legend below the plot.
-    ncol=3,  # Adjust based on your number of legend items
-    frameon=True,
-    fancybox=True,
-    # borderpad=1.25,
-    edgecolor="black",
-)
-
-fig.tight_layout()
-plt.title(
-    "Smoothed then Normalized Metrics over Steps (Safety Eval Clipped 0.7-0.9)", pad=20
-)
-plt.show()
-plt.savefig(os.path.join(base_path, "badloss_mink_safety_vs_step.png"))
-plt.savefig(
-    os.path.join(base_path, "badloss_mink_safety_vs_step.pgf"), bbox_inches="tight"
-)
\ No newline at end of file
+    options["usetex"] = not args.no_usetex
+    options["plot"] = not args.no_plot
+    base = MinkPlotConfig(**options)
+    if args.config is None:
+        return [base]
+    with open(args.config, "r") as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = [entries]
+    return [dataclasses.replace(base, **entry) for entry in entries]
+
+
+def read_seed_csv(path: str) -> pd.DataFrame:
+    PROFILER.record_read(path)
+    with open_input(path, newline="") as f:
+        return pd.read_csv(f)
+
+
+def load_seed_frames(
+    config: MinkPlotConfig,
+) -> Tuple[List[pd.DataFrame], List[pd.DataFrame]]:
+    if config.store is not None:
+        # Import lazily, reading the store requires pyarrow.
+        from results_store import read_stage_runs
+
+        return tuple(
+            [
+                df.rename_axis("Step").reset_index()
+                for df in read_stage_runs(
+                    config.store, CONTINUOUS_FAMILY, f"mink_{kind}"
+                ).values()
+            ]
+            for kind in (BADLOSS_KIND, SAFETY_KIND)
+        )
+
+    paths = [p for pattern in config.inputs for p in sorted(glob.glob(pattern))]
+    seed_files = classify_seed_files(paths)
+    for kind in (BADLOSS_KIND, SAFETY_KIND):
+        assert (
+            kind in seed_files
+        ), f"No continuous_unlearning_<seed>_{kind}.csv file matches {config.inputs}"
+    return tuple(
+        [read_seed_csv(file) for file in seed_files[kind].values()]
+        for kind in (BADLOSS_KIND, SAFETY_KIND)
+    )
+
+
+def aggregate_config(config: MinkPlotConfig) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Average the metrics of every seed for each step."""
+    with PROFILER.phase("parse", inputs=config.inputs, store=config.store):
+        badloss_dfs, safety_dfs = load_seed_frames(config)
+    print(f"Aggregating {len(badloss_dfs)} bad loss and {len(safety_dfs)} safety seeds")
+    with PROFILER.phase("compute", seeds=len(badloss_dfs)):
+        return (
+            aggregate_seeds(badloss_dfs, n_resamples=config.n_resamples),
+            aggregate_seeds(safety_dfs, n_resamples=config.n_resamples),
+        )
+
+
+def export_aligned(
+    badloss_combined: pd.DataFrame,
+    safety_combined: pd.DataFrame,
+    path: str,
+    method: str,
+) -> None:
+    aligned = align_frames(
+        {
+            "badloss": badloss_combined[["Step"] + METRIC_COLUMNS],
+            "safety": safety_combined[["Step", SAFETY_COLUMN]],
+        },
+        grid_mode="coarsest",
+        method=method,
+    )
+    aligned.to_csv(path, index=False)
+    print(aligned.drop(columns="Step").corr())
+
+
+def set_style(usetex: bool) -> None:
+    # Import lazily, seaborn is only needed for plotting.
+    import seaborn as sns
+
+    plt = load_pyplot()
+    plt.rcParams.update(
+        {
+            "pgf.texsystem": "pdflatex",
+            "font.family": "serif",
+            "text.usetex": usetex,
+        }
+    )
+    sns.set(style="whitegrid", font_scale=2)
+    plt.rcParams.update(
+        {
+            "text.color": "black",
+            "axes.edgecolor": "black",
+            "axes.labelcolor": "black",
+            "xtick.color": "black",
+            "ytick.color": "black",
+            "axes.linewidth": 1.5,  # Set the width of the axes border
+            "xtick.major.size": 5,  # Set the length of the major ticks on x-axis
+            "xtick.minor.size": 3,  # Set the length of the minor ticks on x-axis
+            "ytick.major.size": 5,  # Set the length of the major ticks on y-axis
+            "ytick.minor.size": 3,  # Set the length of the minor ticks on y-axis
+        }
+    )
+
+
+def plot_variant(
+    fig: "Figure",
+    badloss: pd.DataFrame,
+    safety: pd.DataFrame,
+    title: str,
+    left_ylim: Tuple[float, float],
+    config: MinkPlotConfig,
+) -> None:
+    def series(df: pd.DataFrame, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        return downsample(
+            df["Step"].to_numpy(),
+            df[column].to_numpy(),
+            config.max_points,
+            config.downsample_method,
+        )
+
+    ax1 = fig.subplots()
+
+    color = "tab:red"
+    ax1.set_xlabel("Step")
+    ampersand = r"\&" if config.usetex else "&"
+    ax1.set_ylabel(
+        f"Bad Loss {ampersand} Ratio Mink Unlearning/Reference",
+        color=color,
+        labelpad=10,
+    )
+
+    ax1.plot(*series(badloss, "bad loss"), color=color, label="Bad Loss", linewidth=3)
+    ax1.plot(
+        *series(badloss, "ratio mink unlearning/reference"),
+        color="tab:orange",
+        linestyle="--",
+        label="Ratio Mink Unlearning/Reference",
+        linewidth=3,
+    )
+    ax1.tick_params(axis="y", labelcolor=color)
+    ax1.grid(True, linestyle="--", alpha=0.5)
+
+    ax2 = ax1.twinx()
+    color = "tab:blue"
+    ax2.set_ylabel("Safety Evaluation", color=color, labelpad=10)
+    ax2.plot(
+        *series(safety, SAFETY_COLUMN),
+        color=color,
+        linestyle=":",
+        label="Safety Eval",
+        linewidth=3,
+    )
+    ax2.tick_params(axis="y", labelcolor=color)
+
+    # Use the same number of ticks on both axes so the grid lines up.
+    ax1.set_ylim(left_ylim)
+    ax1.set_yticks(np.linspace(*left_ylim, num=6))
+    ax2.set_ylim(config.safety_ylim)
+    ax2.set_yticks(np.linspace(*config.safety_ylim, num=6))
+
+    # Adding a legend to the plot
+    lines, labels = ax1.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax2.legend(
+        lines + lines2,
+        labels + labels2,
+        loc="upper center",
+        bbox_to_anchor=(
+            0.5,
+            -0.097,
+        ),  # The negative value in the second argument pushes the legend below the plot.
+        ncol=3,  # Adjust based on your number of legend items
+        frameon=True,
+        fancybox=True,
+        edgecolor="black",
+    )
+
+    fig.tight_layout()
+    ax2.set_title(title, pad=20)
+
+
+def save_figure(fig: "Figure", path_stem: str, formats: List[str]) -> None:
+    """Save the figure in every format, only pgf goes through LaTeX (the pgf backend)."""
+    for fmt in formats:
+        path = f"{path_stem}.{fmt}"
+        if fmt == "pgf":
+            fig.savefig(path, backend="pgf", bbox_inches="tight")
+        else:
+            fig.savefig(path)
+        print(f"Saved {path}")
+
+
+def plot_config(
+    config: MinkPlotConfig, badloss_combined: pd.DataFrame, safety_combined: pd.DataFrame
+) -> None:
+    """Save every figure variant of config."""
+    set_style(config.usetex)
+    os.makedirs(config.output_dir, exist_ok=True)
+    for variant in config.variants:
+        if variant == "raw":
+            badloss = badloss_combined
+            title, left_ylim = config.raw_title, config.raw_ylim
+        else:
+            # Apply smoothing, then normalize smoothed data
+            badloss = badloss_combined[["Step"]].copy()
+            badloss[METRIC_COLUMNS] = min_max_normalise(
+                rolling_mean(
+                    badloss_combined[METRIC_COLUMNS].to_numpy(),
+                    config.smoothing_window,
+                )
+            )
+            title, left_ylim = config.smoothed_title, config.smoothed_ylim
+
+        path_stem = os.path.join(config.output_dir, config.file_name + VARIANTS[variant])
+        with PROFILER.render(path_stem), pooled_figure(figsize=(14, 9)) as fig:
+            plot_variant(fig, badloss, safety_combined, title, tuple(left_ylim), config)
+            save_figure(fig, path_stem, config.formats)
+
+
+def main(configs: List[MinkPlotConfig]) -> None:
+    # Configurations reading the same seeds share their aggregation.
+    aggregated: Dict[tuple, Tuple[pd.DataFrame, pd.DataFrame]] = {}
+
+    for config in configs:
+        assert (
+            config.usetex or "pgf" not in config.formats
+        ), "pgf output requires LaTeX text rendering"
+        key = (tuple(config.inputs), config.store, config.n_resamples)
+        if key not in aggregated:
+            aggregated[key] = aggregate_config(config)
+        badloss_combined, safety_combined = aggregated[key]
+
+        if config.export_aligned is not None:
+            with PROFILER.phase("write", output=config.export_aligned):
+                export_aligned(
+                    badloss_combined,
+                    safety_combined,
+                    config.export_aligned,
+                    config.align_method,
+                )
+
+        if config.plot:
+            plot_config(config, badloss_combined, safety_combined)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start_profiling("eval_mink", args)
+    main(configs_from_args(args))
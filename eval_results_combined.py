@@ -7,12 +7,23 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import json
 import argparse
+import json
 import os
 
 import pandas as pd
 
+from compression import open_input
+from eval_framework import checkpoint_of, is_log_file, list_log_files, split_stderr_columns
+from figures import (
+    BatchRenderer,
+    add_no_plot_argument,
+    pooled_figure,
+    render_or_submit,
+)
+from manifest import MANIFEST_FILE_NAME, file_signature, load_manifest, save_manifest
+from profiling import PROFILER, add_profile_arguments, start_profiling
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -42,75 +53,220 @@ def parse_args() -> argparse.Namespace:
         required=True,
         help="Path to save the target plots and CSV files combined.",
     )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Read the framework and harmfulness metrics from this results store (see results_store.py) instead of the CSV files. The run is identified by the last two components of --eval_csv_framework.",
+    )
+    parser.add_argument(
+        "--join",
+        type=str,
+        action="append",
+        default=[],
+        help="Additional metrics to join on checkpoint, as name=path. path is either a CSV with a checkpoint, Step or model_name (idx_N) column (e.g. min-k metrics) or a directory of relearn idx_N.json results. Columns are prefixed with name. Can be repeated.",
+    )
+    parser.add_argument(
+        "--join_how",
+        type=str,
+        choices=["outer", "inner"],
+        default="outer",
+        help="Keep checkpoints missing from some inputs (outer, as NaN) or only those present in all of them (inner).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip the run if neither input CSV changed since the last incremental run (tracked in a manifest in --log_dir).",
+    )
+    add_no_plot_argument(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
     return args
 
 
-def fetch_log_data(log_dir: str) -> dict[int, dict]:
-    log_file_names = os.listdir(log_dir)
-    assert (
-        log_file_names
-    ), f"Beep boop, no files in a directory provided ({log_dir}). Maybe you forgot to copy them?"
-
-    log_files_contents = {}
-    for file_name in log_file_names:
-        with open(os.path.join(log_dir, file_name), "r") as f:
-            log_files_contents[int(file_name.split("_")[-1].split(".")[0])] = json.load(
-                f
-            )
-
-    # return sorted dictionary
-    return {
-        k: v
-        for k, v in sorted(
-            log_files_contents.items(),
-            key=lambda x: x[0],
+def create_plot(df: pd.DataFrame, log_dir: str, plot_title: str) -> None:
+    # Standard errors of the framework metrics are kept in the CSV only.
+    values, _ = split_stderr_columns(df)
+    path = os.path.join(log_dir, "figure.png")
+    with PROFILER.render(path), pooled_figure() as fig:
+        ax = values.plot(ax=fig.subplots(), style="o-")
+        ax.set_title(f"Task eval of: {plot_title}")
+        ax.grid()
+        # Limit y axis to the same size for all
+        ax.set_ylim(0.2, 1.0)
+        fig.savefig(path)
+
+
+def load_from_store(store: str, eval_csv_framework: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Import lazily, reading the store requires pyarrow.
+    from results_store import read_run_metrics
+
+    family, run = os.path.normpath(eval_csv_framework).split(os.sep)[-2:]
+    df_framework = read_run_metrics(store, family, run, "framework")
+    df_harmfulness = read_run_metrics(store, family, run, "harmfulness")
+    return df_framework, df_harmfulness
+
+
+CHECKPOINT_COLUMNS = ["checkpoint", "Step", "model_name"]
+
+
+def index_by_checkpoint(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """Index a frame by the integer checkpoint found in one of CHECKPOINT_COLUMNS."""
+    key = next((c for c in CHECKPOINT_COLUMNS if c in df.columns), None)
+    assert key is not None, f"{source} has none of the checkpoint columns {CHECKPOINT_COLUMNS}"
+
+    keys = df.pop(key)
+    if key == "model_name":
+        keys = keys.map(checkpoint_of)
+    df.index = pd.Index(keys.astype("int64"), name="checkpoint")
+    assert df.index.is_unique, f"{source} has duplicate checkpoints"
+    return df.sort_index()
+
+
+def read_framework_results(eval_csv_framework: str) -> pd.DataFrame:
+    csv_path = os.path.join(eval_csv_framework, "results.csv")
+    PROFILER.record_read(csv_path)
+    df = pd.read_csv(csv_path, index_col=False)
+    if "checkpoint" not in df.columns:
+        # results.csv written before checkpoints were stored, recover them from the logs.
+        log_dir = os.path.join(eval_csv_framework, "eval_results")
+        checkpoints = (
+            sorted(checkpoint_of(entry.name) for entry in list_log_files(log_dir))
+            if os.path.isdir(log_dir)
+            else []
         )
-    }
-
-
-def filter_json_logs(log_data: dict[int, dict]) -> dict[int, dict]:
-    results = {}
-    for model_iter_num, log in log_data.items():
-        results[model_iter_num] = {
-            "winogrande_acc": log["results"]["winogrande"]["acc,none"],
-            "truthfulqa_mc2_acc": log["results"]["truthfulqa_mc2"]["acc,none"],
-            "hellaswag_acc_norm": log["results"]["hellaswag"]["acc_norm,none"],
-            #"gsm8k_exact_match_flexible": log["results"]["gsm8k"][
-            #    "exact_match,flexible-extract"
-            #],
-            "arc_challenge_acc_norm": log["results"]["arc_challenge"]["acc_norm,none"],
-            "mmlu_acc": log["results"]["mmlu"]["acc,none"],
-            "toxigen_acc_norm": log["results"]["toxigen"]["acc_norm,none"],
-        }
+        assert len(checkpoints) == len(
+            df
+        ), f"{csv_path} has no checkpoint column, regenerate it with eval_framework.py"
+        df.insert(0, "checkpoint", checkpoints)
+    return index_by_checkpoint(df, csv_path)
 
-    return results
 
+def read_harmfulness_results(eval_csv_harmfulness: str) -> pd.DataFrame:
+    csv_path = os.path.join(eval_csv_harmfulness, "flagged_ratio.csv")
+    PROFILER.record_read(csv_path)
+    return index_by_checkpoint(pd.read_csv(csv_path, index_col=False), csv_path)
+
+
+def read_join_source(path: str) -> pd.DataFrame:
+    if not os.path.isdir(path):
+        PROFILER.record_read(path)
+        return index_by_checkpoint(pd.read_csv(path, index_col=False), path)
+
+    # Directory of relearn results, keep their numeric fields.
+    rows = {}
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        if is_log_file(entry.name):
+            with PROFILER.json_parse(entry.path), open_input(entry.path) as f:
+                content = json.load(f)
+            rows[checkpoint_of(entry.name)] = {
+                key: value
+                for key, value in content.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+    df = pd.DataFrame.from_dict(rows, orient="index").sort_index()
+    df.index.name = "checkpoint"
+    return df
 
-def create_plot(df: pd.DataFrame, log_dir: str, plot_title: str) -> None:
-    ax = df.plot(style=["o-"] * 7)
-    fig = ax.get_figure()
-    ax.set_title(f"Task eval of: {plot_title}")
-    ax.grid()
-    # Limit y axis to the same size for all
-    ax.set_ylim(0.2, 1.0)
-    fig.savefig(os.path.join(log_dir, "figure.png"))
 
+def join_source_files(path: str) -> list[str]:
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(entry.path for entry in os.scandir(path) if is_log_file(entry.name))
 
-def main(eval_csv_framework: str, eval_csv_harmfulness: str, plot_title: str, log_dir: str):
-    df_framework = pd.read_csv(os.path.join(eval_csv_framework, "results.csv"),index_col=False)
-    df_harmfulness = pd.read_csv(os.path.join(eval_csv_harmfulness, "flagged_ratio.csv"), index_col=False)
+
+def join_on_checkpoint(
+    frames: dict[str, pd.DataFrame], how: str = "outer"
+) -> tuple[pd.DataFrame, dict[str, list[int]]]:
+    """Join frames indexed by checkpoint, returning the result and each input's unmatched checkpoints.
+
+    For an outer join the unmatched checkpoints of an input are those present in
+    another input but missing from it; for an inner join they are the ones dropped.
+    """
+    indexes = [df.index for df in frames.values()]
+    union, common = indexes[0], indexes[0]
+    for index in indexes[1:]:
+        union = union.union(index)
+        common = common.intersection(index)
+
+    unmatched = {}
+    for name, index in zip(frames, indexes):
+        missing = union.difference(index) if how == "outer" else index.difference(common)
+        if len(missing):
+            unmatched[name] = missing.tolist()
+
+    df = pd.concat(frames.values(), axis=1, join=how).sort_index()
+    df.index.name = "checkpoint"
+    return df, unmatched
+
+
+def main(
+    eval_csv_framework: str,
+    eval_csv_harmfulness: str,
+    plot_title: str,
+    log_dir: str,
+    store: str | None = None,
+    incremental: bool = False,
+    joins: dict[str, str] | None = None,
+    how: str = "outer",
+    plot: bool = True,
+    renderer: BatchRenderer | None = None,
+):
+    joins = joins or {}
+    input_paths = [
+        os.path.join(eval_csv_framework, "results.csv"),
+        os.path.join(eval_csv_harmfulness, "flagged_ratio.csv"),
+        *(file for path in joins.values() for file in join_source_files(path)),
+    ]
+    manifest_path = os.path.join(log_dir, MANIFEST_FILE_NAME)
+    if incremental and store is None:
+        inputs = {path: file_signature(os.stat(path)) for path in input_paths}
+        if load_manifest(manifest_path).get("inputs") == inputs and os.path.exists(
+            os.path.join(log_dir, "results.csv")
+        ):
+            print(f"Inputs of {log_dir} did not change, results are up to date.")
+            return
+
+    with PROFILER.phase("parse", run=log_dir):
+        if store is not None:
+            df_framework, df_harmfulness = load_from_store(store, eval_csv_framework)
+        else:
+            df_framework = read_framework_results(eval_csv_framework)
+            df_harmfulness = read_harmfulness_results(eval_csv_harmfulness)
+        joined = {
+            name: read_join_source(path).add_prefix(f"{name}_")
+            for name, path in joins.items()
+        }
 
     # XXX: At the moment, ratios in flagged_ratio csv are: flagged/all . We are intersted in the trend of safe_responses/all == 1 - flagged/all.
     df_harmfulness_transformed = 1 - df_harmfulness["flagged/all"]
     df_harmfulness = df_harmfulness_transformed.to_frame(name="safety_eval_beaverdam-7b")
 
-    df = pd.concat([df_framework, df_harmfulness], axis=1)
+    frames = {"framework": df_framework, "harmfulness": df_harmfulness, **joined}
+    with PROFILER.phase("compute", run=log_dir):
+        df, unmatched = join_on_checkpoint(frames, how)
+    for name, checkpoints in unmatched.items():
+        print(f"Unmatched checkpoints of {name}: {checkpoints}")
 
-    create_plot(df, log_dir, plot_title)
-    df.to_csv(os.path.join(log_dir, "results.csv"), index=False)
+    if plot:
+        render_or_submit(renderer, log_dir, create_plot, df, log_dir, plot_title)
+    with PROFILER.phase("write", run=log_dir):
+        df.to_csv(os.path.join(log_dir, "results.csv"))
+    if incremental and store is None:
+        save_manifest(manifest_path, {"inputs": inputs})
 
 
 if __name__ == "__main__":
     args = parse_args()
-    main(args.eval_csv_framework, args.eval_csv_harmfulness, args.plot_title, args.log_dir)
+    start_profiling("eval_results_combined", args)
+    main(
+        args.eval_csv_framework,
+        args.eval_csv_harmfulness,
+        args.plot_title,
+        args.log_dir,
+        args.store,
+        incremental=args.incremental,
+        joins=dict(join.split("=", 1) for join in args.join),
+        how=args.join_how,
+        plot=not args.no_plot,
+    )
@@ -0,0 +1,161 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import contextlib
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator
+
+HEADLESS_BACKEND = "Agg"
+
+
+def display_available() -> bool:
+    """Whether an interactive window could be opened, i.e. not on a display-less worker."""
+    if not sys.platform.startswith("linux"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def load_pyplot(headless: bool = True):
+    """Import matplotlib.pyplot on first use, selecting the Agg backend if headless.
+
+    Scripts import pyplot through this, so runs which do not plot never pay for
+    importing matplotlib.
+    """
+    import matplotlib
+
+    if headless:
+        matplotlib.use(HEADLESS_BACKEND)
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+class FigurePool:
+    """Reusable Agg figures for scripts that only save their plots.
+
+    Figures are created without pyplot, so pyplot never holds a reference to
+    them and a released figure is cleared and kept for the next plot of the
+    same size instead of accumulating until the process exits.
+    """
+
+    def __init__(self, max_size: int = 4):
+        self.max_size = max_size
+        self.free = []
+
+    def acquire(self, figsize: tuple[float, float] | None = None, dpi: float | None = None):
+        # pandas plotting imports pyplot, make sure it does not pick an interactive backend.
+        plt = load_pyplot()
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        figsize = tuple(figsize or plt.rcParams["figure.figsize"])
+        dpi = dpi or plt.rcParams["figure.dpi"]
+        for i, fig in enumerate(self.free):
+            if tuple(fig.get_size_inches()) == figsize and fig.dpi == dpi:
+                return self.free.pop(i)
+
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        return fig
+
+    def release(self, fig) -> None:
+        import matplotlib
+
+        fig.clear()
+        # tight_layout moves the subplot parameters, they survive clear().
+        fig.set_layout_engine(None)
+        fig.subplots_adjust(
+            **{
+                side: matplotlib.rcParams[f"figure.subplot.{side}"]
+                for side in ("left", "right", "bottom", "top", "wspace", "hspace")
+            }
+        )
+        if len(self.free) < self.max_size:
+            self.free.append(fig)
+
+    def clear(self) -> None:
+        self.free.clear()
+
+
+FIGURE_POOL = FigurePool()
+
+
+@contextlib.contextmanager
+def pooled_figure(
+    figsize: tuple[float, float] | None = None, dpi: float | None = None
+) -> Iterator:
+    """Borrow a cleared figure from the pool, it is returned to it when the block exits."""
+    fig = FIGURE_POOL.acquire(figsize, dpi)
+    try:
+        yield fig
+    finally:
+        FIGURE_POOL.release(fig)
+
+
+def render_job(label: str, plot: Callable[..., None], args: tuple) -> str | None:
+    """Run one plot function, returning its traceback on failure."""
+    try:
+        plot(*args)
+    except Exception:
+        return f"{label}\n{traceback.format_exc()}"
+    return None
+
+
+class BatchRenderer:
+    """Collects plots of many runs and renders them together, optionally in worker processes.
+
+    With workers > 1, plot functions must be defined at module level and their
+    arguments be picklable. A failing plot is reported by flush without
+    stopping the others.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers or os.cpu_count()
+        # Attached to the plots submitted next, e.g. the run they belong to.
+        self.tag = None
+        self.jobs: list[tuple[str, Callable[..., None], tuple]] = []
+        self.tags = []
+
+    def submit(self, label: str, plot: Callable[..., None], *args) -> None:
+        self.jobs.append((label, plot, args))
+        self.tags.append(self.tag)
+
+    def flush(self) -> list[tuple[object, str]]:
+        """Render all submitted plots, returning the tag and error of each failed one."""
+        jobs, tags = self.jobs, self.tags
+        self.jobs, self.tags = [], []
+        if self.workers <= 1 or len(jobs) <= 1:
+            errors = [render_job(*job) for job in jobs]
+        else:
+            workers = min(self.workers, len(jobs))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                errors = list(executor.map(render_job, *zip(*jobs)))
+        return [(tag, error) for tag, error in zip(tags, errors) if error is not None]
+
+
+def render_or_submit(
+    renderer: BatchRenderer | None, label: str, plot: Callable[..., None], *args
+) -> None:
+    """Call plot(*args) now, or queue it on renderer to be rendered with its batch."""
+    if renderer is None:
+        plot(*args)
+    else:
+        renderer.submit(label, plot, *args)
+
+
+def add_no_plot_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--no_plot",
+        action="store_true",
+        help="Only compute and write the metrics, skip plotting (matplotlib is not imported).",
+    )
@@ -0,0 +1,116 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Discovery and concurrent loading of result files.
+
+Directories are walked with os.scandir, reusing the file type information of
+each entry instead of stat-ing it again. An optional listing cache persists the
+entries of every directory together with the directory's mtime, so unchanged
+directories are not listed again, which matters on network filesystems.
+"""
+
+import fnmatch
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from compression import open_input, strip_compression
+from profiling import PROFILER
+
+
+class ListingCache:
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.listings: Dict[str, Dict] = {}
+        self.changed = False
+        if path and os.path.exists(path):
+            with open(path) as fin:
+                self.listings = json.load(fin)
+
+    def list_dir(self, directory: str) -> tuple[List[str], List[str]]:
+        """Return the (files, subdirectories) names of directory."""
+        mtime_ns = os.stat(directory).st_mtime_ns
+        cached = self.listings.get(directory)
+        if cached is not None and cached["mtime_ns"] == mtime_ns:
+            return cached["files"], cached["dirs"]
+
+        files, dirs = [], []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                (dirs if entry.is_dir() else files).append(entry.name)
+        files.sort()
+        dirs.sort()
+        self.listings[directory] = {"mtime_ns": mtime_ns, "files": files, "dirs": dirs}
+        self.changed = True
+        return files, dirs
+
+    def save(self) -> None:
+        if self.path and self.changed:
+            with open(self.path, "w") as fout:
+                json.dump(self.listings, fout)
+            self.changed = False
+
+
+def walk_files(directory: str, pattern: str, cache: ListingCache) -> List[str]:
+    output = []
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        files, dirs = cache.list_dir(current)
+        output.extend(
+            os.path.join(current, f)
+            for f in files
+            if fnmatch.fnmatch(strip_compression(f), pattern)
+        )
+        pending.extend(os.path.join(current, d) for d in reversed(dirs))
+    return output
+
+
+def discover_files(
+    paths: List[str], pattern: str = "*.json", cache_path: str = ""
+) -> List[str]:
+    """Expand files, directories and glob patterns into a deduplicated list of files.
+
+    Directories are searched recursively for files matching pattern, explicitly
+    given files are always kept. The order of first appearance is preserved.
+    """
+    cache = ListingCache(cache_path)
+    output = []
+    for p in paths:
+        candidates = glob.glob(p, recursive=True) if glob.has_magic(p) else [p]
+        for candidate in candidates:
+            if os.path.isdir(candidate):
+                output.extend(walk_files(os.path.normpath(candidate), pattern, cache))
+            else:
+                output.append(candidate)
+    cache.save()
+
+    seen = set()
+    unique = []
+    for p in output:
+        key = os.path.normpath(p)
+        if key not in seen:
+            seen.add(key)
+            unique.append(p)
+    return unique
+
+
+def load_json_files(paths: List[str], workers: Optional[int] = 8) -> List[Dict]:
+    """Load JSON files concurrently, returning their contents in the order of paths."""
+
+    def load(path: str) -> Dict:
+        with PROFILER.json_parse(path), open_input(path) as fin:
+            return json.load(fin)
+
+    if workers is not None and workers <= 1:
+        return [load(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(load, paths))
@@ -0,0 +1,201 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import json
+import re
+from typing import Any, Iterator, TextIO
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+STRUCTURAL_CHARACTER = re.compile(r'[{}\[\]"]')
+STRING_TAIL = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+SCALAR = re.compile(r"[^,}\]\s]+")
+# Characters of a leading array read before a file is taken for a JSON array
+# instead of JSON lines starting with an array, see iter_records.
+JSON_LINES_LOOKAHEAD = 1 << 20
+
+
+class JsonStream:
+    """Incremental reader over a JSON text file.
+
+    Values are decoded from a buffer that only holds the not yet consumed part of the
+    file, so members that are skipped are never materialised as Python objects and
+    reading can stop as soon as everything of interest has been found.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        # Characters dropped from the front of the buffer, see tell.
+        self.offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        """Read more data into the buffer, returning False at the end of the file."""
+        if self.eof:
+            return False
+        # Grow reads with the pending data so decoding large values stays linear.
+        chunk = self.f.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def tell(self) -> int:
+        """Number of characters of the file consumed so far."""
+        return self.offset + self.pos
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ("" at EOF)."""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, character: str) -> None:
+        found = self.peek()
+        if found != character:
+            raise json.JSONDecodeError(
+                f"Expecting {character!r}, found {found!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+
+    def decode_value(self) -> Any:
+        if self.peek() not in "{[\"":
+            # A scalar cut at the buffer boundary, e.g. 1. of 1.5, may decode as a
+            # shorter value, so read on until its end is buffered.
+            while (
+                SCALAR.match(self.buffer, self.pos).end() == len(self.buffer)
+                and self.fill()
+            ):
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self) -> None:
+        """Consume the next value without building it."""
+        if self.peek() not in "{[\"":
+            while True:
+                match = SCALAR.match(self.buffer, self.pos)
+                if match.end() < len(self.buffer) or not self.fill():
+                    self.pos = match.end()
+                    return
+
+        depth = 0
+        while True:
+            match = STRUCTURAL_CHARACTER.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self.fill():
+                    raise json.JSONDecodeError("Unterminated value", self.buffer, 0)
+                continue
+
+            character = match.group()
+            if character == '"':
+                tail = STRING_TAIL.match(self.buffer, match.end())
+                if tail is None:
+                    # The string continues past the buffer, retry once more is read.
+                    self.pos = match.start()
+                    if not self.fill():
+                        raise json.JSONDecodeError(
+                            "Unterminated string", self.buffer, self.pos
+                        )
+                    continue
+                self.pos = tail.end()
+            else:
+                self.pos = match.end()
+                depth += 1 if character in "{[" else -1
+
+            if depth == 0:
+                return
+
+
+def extract_members(f: TextIO, keys: set[str]) -> dict[str, Any]:
+    """Decode only the given members of the top-level JSON object in f.
+
+    Other members are skipped without being decoded and reading stops once all
+    requested members have been found. Missing members are absent from the result.
+    """
+    stream = JsonStream(f)
+    members = {}
+    stream.expect("{")
+    if stream.peek() == "}":
+        return members
+
+    while len(members) < len(keys):
+        key = stream.decode_value()
+        stream.expect(":")
+        if key in keys:
+            members[key] = stream.decode_value()
+        else:
+            stream.skip_value()
+
+        if stream.peek() == "}":
+            break
+        stream.expect(",")
+
+    return members
+
+
+def iter_records(f: TextIO) -> Iterator[Any]:
+    """Yield the records of f one at a time, the elements of a JSON array or JSON lines.
+
+    The format is decided by the first value and what follows it: an array
+    followed by another value is the first of JSON lines. The elements of a
+    leading array are held until it ends or exceeds JSON_LINES_LOOKAHEAD
+    characters, after which it is taken for a JSON array and streamed, so only
+    the records being decoded are held in memory.
+    """
+    stream = JsonStream(f)
+    if stream.peek() != "[":
+        yield from iter_values(stream)
+        return
+
+    start = stream.tell()
+    stream.expect("[")
+    elements = []
+    ended = stream.peek() == "]"
+    while not ended and stream.tell() - start <= JSON_LINES_LOOKAHEAD:
+        elements.append(stream.decode_value())
+        ended = stream.peek() == "]"
+        if not ended:
+            stream.expect(",")
+
+    if ended:
+        stream.expect("]")
+        if stream.peek():
+            yield elements
+            yield from iter_values(stream)
+        else:
+            yield from elements
+        return
+
+    yield from elements
+    elements.clear()
+    while True:
+        yield stream.decode_value()
+        if stream.peek() == "]":
+            return
+        stream.expect(",")
+
+
+def iter_values(stream: JsonStream) -> Iterator[Any]:
+    """Yield the remaining values of stream, e.g. the lines of JSON lines."""
+    while stream.peek():
+        yield stream.decode_value()
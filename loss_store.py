@@ -0,0 +1,73 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Packed, memory-mappable store of relearning loss trajectories.
+
+A store is a directory holding
+    losses.npy   all trajectories concatenated into one float32 array,
+    offsets.npy  int64 array of len(records) + 1, trajectory i being
+                 losses[offsets[i]:offsets[i + 1]],
+    records.json the per-trajectory metadata (model name, checkpoint, ...).
+Opening a store maps losses.npy instead of reading it, so trajectories are only
+paged in when touched and never exist as Python floats.
+"""
+
+import json
+import os
+from typing import Dict, List
+
+import numpy as np
+
+LOSSES_FILE_NAME = "losses.npy"
+OFFSETS_FILE_NAME = "offsets.npy"
+RECORDS_FILE_NAME = "records.json"
+
+
+class LossStore:
+    def __init__(self, path: str):
+        with open(os.path.join(path, RECORDS_FILE_NAME)) as fin:
+            self.records: List[Dict] = json.load(fin)
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE_NAME))
+        self.losses = np.load(os.path.join(path, LOSSES_FILE_NAME), mmap_mode="r")
+        assert len(self.offsets) == len(self.records) + 1
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def trajectory(self, i: int) -> np.ndarray:
+        """Return a read-only view of the i-th trajectory, backed by the mapped file."""
+        return self.losses[self.offsets[i] : self.offsets[i + 1]]
+
+
+def write_loss_store(path: str, records: List[Dict], losses: List[np.ndarray]) -> None:
+    assert len(records) == len(losses)
+    os.makedirs(path, exist_ok=True)
+
+    offsets = np.zeros(len(losses) + 1, dtype=np.int64)
+    np.cumsum([len(i) for i in losses], out=offsets[1:])
+    losses_path = os.path.join(path, LOSSES_FILE_NAME)
+    if offsets[-1] == 0:
+        # Empty files can not be mapped.
+        np.save(losses_path, np.zeros(0, dtype=np.float32))
+    else:
+        packed = np.lib.format.open_memmap(
+            losses_path, mode="w+", dtype=np.float32, shape=(int(offsets[-1]),)
+        )
+        for i, trajectory in enumerate(losses):
+            packed[offsets[i] : offsets[i + 1]] = trajectory
+        packed.flush()
+        del packed
+
+    np.save(os.path.join(path, OFFSETS_FILE_NAME), offsets)
+    with open(os.path.join(path, RECORDS_FILE_NAME), "w") as fout:
+        json.dump(records, fout)
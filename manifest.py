@@ -0,0 +1,44 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE_NAME = ".results_manifest.json"
+
+
+def file_signature(stat: os.stat_result) -> dict[str, int]:
+    """Cheap change detection for a file: its size and modification time."""
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """Return the stored manifest, or an empty one if it is missing or unreadable."""
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: dict) -> None:
+    # Write to a temporary file first so an interrupted run never leaves a torn manifest.
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
@@ -1,13 +1,27 @@
 import argparse
-import glob
-import json
 import os
+import time
 from dataclasses import dataclass
 from enum import Enum
 from typing import Dict, List
 
 import numpy as np
-from matplotlib import pyplot as plt
+
+from catalog import (
+    BATCH_FAMILY,
+    CONTINUOUS_FAMILY,
+    SCALED_LR_FAMILY,
+    SEQUENTIAL_FAMILY,
+    Catalog,
+    RunInfo,
+    checkpoint_of,
+    parse_run_name,
+)
+from figures import add_no_plot_argument, display_available, load_pyplot
+from file_discovery import discover_files, load_json_files
+from loss_store import LossStore, write_loss_store
+from profiling import PROFILER, add_profile_arguments, start_profiling
+from relearn_analysis import STOPPING_WINDOW, analyse, pack_losses, write_analysis_csv
 
 
 class ExperimentType(Enum):
@@ -21,91 +35,144 @@ class ExperimentType(Enum):
         return self.value
 
 
-@dataclass
+@dataclass(slots=True)
 class Result:
     dataset: str
     model_name: str
     checkpoint: int
-    losses: List[float]
+    # float32 array, a view into the mapped file when loaded from a loss store
+    losses: np.ndarray
     sample_count: int
+    target_loss: float = float("nan")
     label: str = ""
     experiment_type: ExperimentType = ExperimentType.UNKNOWN
+    run: RunInfo | None = None
 
 
-def expand_path(path: List[str]) -> List[str]:
-    output = []
-    for p in path:
-        if "*" in p:
-            output.extend(glob.glob(p, recursive=True))
-        if os.path.isdir(p):
-            output.extend(expand_path([os.path.join(p, f) for f in os.listdir(p)]))
-        else:
-            output.append(p)
-    return output
+def result_from_json(content: Dict) -> Result:
+    return Result(
+        dataset=content["dataset"],
+        model_name=content["unlearned_model"],
+        checkpoint=checkpoint_of(content["checkpoint"]),
+        losses=np.asarray(content["losses"], dtype=np.float32),
+        sample_count=content["sample_count"],
+        target_loss=content["target_loss"],
+    )
+
+
+def load_loss_store(path: str) -> List[Result]:
+    store = LossStore(path)
+    return [
+        Result(
+            dataset=record["dataset"],
+            model_name=record["model_name"],
+            checkpoint=record["checkpoint"],
+            losses=store.trajectory(i),
+            sample_count=record["sample_count"],
+            target_loss=record["target_loss"],
+        )
+        for i, record in enumerate(store.records)
+    ]
+
+
+def save_loss_store(path: str, results: List[Result]) -> None:
+    write_loss_store(
+        path,
+        [
+            {
+                "dataset": i.dataset,
+                "model_name": i.model_name,
+                "checkpoint": i.checkpoint,
+                "sample_count": i.sample_count,
+                "target_loss": i.target_loss,
+            }
+            for i in results
+        ],
+        [i.losses for i in results],
+    )
+
+
+EXPERIMENT_TYPES = {
+    BATCH_FAMILY: ExperimentType.BATCH_UNLEARNING,
+    SCALED_LR_FAMILY: ExperimentType.BATCH_UNLEARNING_SCALED_LR,
+    SEQUENTIAL_FAMILY: ExperimentType.SEQUENTIAL_UNLEARNING,
+    CONTINUOUS_FAMILY: ExperimentType.CONTINIOUS_UNLEARNING,
+}
 
 
 def get_label(result: Result):
-    if result.model_name.startswith("batch_size"):
-        sample_size = int(result.model_name.split("_")[2])
-        name = f"Batch Unlearning\non {sample_size} Samples"
-        if "lr" in result.model_name:
+    run = parse_run_name(result.model_name, "relearn")
+    assert run is not None, f"Unknown relearn model name {result.model_name}"
+    result.run = run
+    result.experiment_type = EXPERIMENT_TYPES[run.family]
+    if run.family in (BATCH_FAMILY, SCALED_LR_FAMILY):
+        name = f"Batch Unlearning\non {run.unlearned_samples} Samples"
+        if run.family == SCALED_LR_FAMILY:
             result.label = f"{name}\nwith Scaled LR"
-            result.experiment_type = ExperimentType.BATCH_UNLEARNING_SCALED_LR
         else:
-            result.experiment_type = ExperimentType.BATCH_UNLEARNING
             result.label = name
-    elif result.model_name.startswith("samples_count"):
-        sample_count = int(result.model_name.split("_")[2])
-        num_split = int(result.model_name.split("_")[-1])
-        result.label = (
-            f"Sequential Unlearning\non {sample_count} Samples in {num_split} Splits"
-        )
-        result.experiment_type = ExperimentType.SEQUENTIAL_UNLEARNING
+    elif run.family == SEQUENTIAL_FAMILY:
+        result.label = f"Sequential Unlearning\non {run.unlearned_samples} Samples in {run.splits} Splits"
     else:
-        result.experiment_type = ExperimentType.CONTINIOUS_UNLEARNING
-        result.label = f'Continious Unlearning\nwith seed {result.model_name.split("-")[-1].replace("real", "")}'
+        result.label = f"Continious Unlearning\nwith seed {run.seed}"
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Plotting the relearning data from given jsons."
-    )
-    parser.add_argument(
-        "--export_csv",
-        type=str,
-        default="",
-        help="Export full step number data to csv file.",
+def load_store_results(store: str) -> List[Result]:
+    # Import lazily, reading the store requires pyarrow.
+    from results_store import read_store, to_wide
+
+    relearn = to_wide(
+        read_store(
+            store,
+            columns=["run", "checkpoint", "metric", "value"],
+            filters=[("stage", "==", "relearn")],
+        )
     )
-    parser.add_argument("jsons", metavar="jsons", type=str, nargs="+")
+    return [
+        Result(
+            dataset="",
+            model_name=model_name,
+            checkpoint=checkpoint,
+            losses=np.zeros(0, dtype=np.float32),
+            sample_count=int(row["sample_count"]),
+            target_loss=row["target_loss"],
+        )
+        for (model_name, checkpoint), row in relearn.iterrows()
+    ]
 
-    args = parser.parse_args()
 
-    json_files = expand_path(args.jsons)
-    eval_results: List[Result] = []
-    for i in json_files:
-        with open(i) as fin:
-            content = json.load(fin)
-            eval_results.append(
-                Result(
-                    dataset=content["dataset"],
-                    model_name=content["unlearned_model"],
-                    checkpoint=int(content["checkpoint"].split("_")[-1]),
-                    losses=content["losses"],
-                    sample_count=content["sample_count"],
-                )
-            )
-    for i in eval_results:
-        get_label(i)
-    eval_results.sort(key=lambda x: (len(x.model_name), x.model_name))
+def plot_results(eval_results: List[Result], output_dir: str = "") -> None:
+    """Plot the relearn sample counts, showing every figure or saving them to output_dir.
+
+    Figures are saved as output_dir/<name>.png and closed when output_dir is set,
+    which needs no display.
+    """
+    plt = load_pyplot(headless=output_dir != "")
+    started = time.perf_counter()
+
+    def show_or_save(fig, name: str) -> None:
+        nonlocal started
+        if output_dir == "":
+            plt.show()
+            return
+        path = os.path.join(output_dir, f"{name}.png")
+        fig.savefig(path, bbox_inches="tight")
+        plt.close(fig)
+        # Each figure is plotted right after the previous one was saved.
+        PROFILER.emit("render", artifact=path, seconds=time.perf_counter() - started)
+        started = time.perf_counter()
+
+    catalog = Catalog([i.run for i in eval_results])
+
+    def select(**criteria) -> List[Result]:
+        return [eval_results[i] for i in catalog.positions(**criteria)]
 
     plt.rcParams.update({"font.size": 18})
     # NOTE: Start plotting from here!!!
 
     # NOTE: Batch Unlearning Results
     fig, ax = plt.subplots(figsize=(10, 8))
-    batch_unlearning_results = [
-        i for i in eval_results if i.experiment_type == ExperimentType.BATCH_UNLEARNING
-    ]
+    batch_unlearning_results = select(family=BATCH_FAMILY)
     bars = ax.bar(
         [i.label for i in batch_unlearning_results],
         [i.sample_count for i in batch_unlearning_results],
@@ -114,18 +181,13 @@ if __name__ == "__main__":
     plt.ylabel("Number of Samples Used for Relearning")
     # fig.autofmt_xdate()
     ax.set_title("Unlearning Sample Count for Batch Unlearning Models")
-    plt.show()
+    show_or_save(fig, "batch_unlearning_sample_count")
 
     # NOTE: Sequential Unlearning (512 samples) Results
     fig, ax = plt.subplots(figsize=(10, 8))
-    seq_unlearning_results = [
-        i
-        for i in eval_results
-        if (
-            "512" in i.model_name
-            and i.experiment_type != ExperimentType.BATCH_UNLEARNING_SCALED_LR
-        )
-    ]
+    seq_unlearning_results = select(
+        family=[BATCH_FAMILY, SEQUENTIAL_FAMILY], unlearned_samples=512
+    )
     bars = ax.bar(
         [i.label for i in seq_unlearning_results],
         [i.sample_count for i in seq_unlearning_results],
@@ -133,31 +195,18 @@ if __name__ == "__main__":
     ax.bar_label(bars, label_type="edge")
     plt.ylabel("Number of Samples Used for Relearning")
     ax.set_title("Unlearning Sample Count for Sequential Unlearning")
-    plt.show()
+    show_or_save(fig, "sequential_unlearning_512_sample_count")
 
     # NOTE: Sequential Unlearning (128, 512 and 1024 samples) Results
     fig, ax = plt.subplots(figsize=(10, 8))
     x = np.arange(3)
-    y_128 = [
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.SEQUENTIAL_UNLEARNING
-        and "128" in i.model_name
-    ]
-    y_512 = [
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.SEQUENTIAL_UNLEARNING
-        and "512" in i.model_name
-    ]
-    y_1024 = [
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.SEQUENTIAL_UNLEARNING
-        and "1024" in i.model_name
-    ]
-    for i in [y_128, y_512, y_1024]:
-        i.sort(key=lambda x: int(x.model_name.split("_")[-1]))
+    y_128, y_512, y_1024 = (
+        sorted(
+            select(family=SEQUENTIAL_FAMILY, unlearned_samples=samples),
+            key=lambda x: x.run.splits,
+        )
+        for samples in [128, 512, 1024]
+    )
     width = 0.2
     ax.bar_label(
         ax.bar(
@@ -185,22 +234,18 @@ if __name__ == "__main__":
     plt.ylabel("Number of Samples Used for Relearning")
     ax.set_title("Unlearning Sample Count for Sequential Unlearning")
     plt.legend()
-    plt.show()
+    show_or_save(fig, "sequential_unlearning_splits_sample_count")
 
     # NOTE: BATCH_UNLEARNING_SCALED_LR
     fig, ax = plt.subplots(figsize=(10, 8))
     x = np.arange(5)
-    ys: Dict[int, List[Result]] = {32: [], 128: [], 512: [], 1024: [], 2048: []}
-    for i in eval_results:
-        if i.experiment_type in (
-            ExperimentType.BATCH_UNLEARNING_SCALED_LR,
-            ExperimentType.BATCH_UNLEARNING,
-        ):
-            trained_sample = int(i.model_name.split("_")[2])
-            if trained_sample in ys:
-                ys[trained_sample].append(i)
-    for i in ys.values():
-        i.sort(key=lambda x: int(x.experiment_type))
+    ys: Dict[int, List[Result]] = {
+        samples: sorted(
+            select(family=[BATCH_FAMILY, SCALED_LR_FAMILY], unlearned_samples=samples),
+            key=lambda x: int(x.experiment_type),
+        )
+        for samples in [32, 128, 512, 1024, 2048]
+    }
 
     width = 0.4
     for i in range(2):
@@ -218,34 +263,13 @@ if __name__ == "__main__":
     plt.ylabel("Number of Samples Used for Relearning")
     ax.set_title("Unlearning Sample Count with Scaled Learning Rate")
     plt.legend()
-    plt.show()
+    show_or_save(fig, "scaled_lr_sample_count")
 
     # NOTE: Gradient Ascent vs batch vs sequential
     fig, ax = plt.subplots(figsize=(10, 8))
-    results = [
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.CONTINIOUS_UNLEARNING
-        and "42" in i.model_name
-    ]
-    results.extend(
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.BATCH_UNLEARNING_SCALED_LR
-        and "512" in i.model_name
-    )
-    results.extend(
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.BATCH_UNLEARNING
-        and "512" in i.model_name
-    )
-    results.extend(
-        i
-        for i in eval_results
-        if i.experiment_type == ExperimentType.SEQUENTIAL_UNLEARNING
-        and "512" in i.model_name
-    )
+    results = select(family=CONTINUOUS_FAMILY, seed=42)
+    for family in [SCALED_LR_FAMILY, BATCH_FAMILY, SEQUENTIAL_FAMILY]:
+        results.extend(select(family=family, unlearned_samples=512))
     x = np.arange(len(results))
     ax.bar_label(
         ax.bar(x, [i.sample_count for i in results]), [i.sample_count for i in results]
@@ -254,19 +278,158 @@ if __name__ == "__main__":
     ax.set_ylabel("Number of Samples Used for Relearning")
     ax.set_title("Unlearning Sample Count for Different Unlearning Methods")
     fig.autofmt_xdate()
-    plt.show()
+    show_or_save(fig, "unlearning_methods_sample_count")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Plotting the relearning data from given jsons."
+    )
+    parser.add_argument(
+        "--export_csv",
+        type=str,
+        default="",
+        help="Export full step number data to csv file.",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default="",
+        help="Read the relearn sample counts from this results store (see results_store.py) instead of jsons. Losses are not kept in the store.",
+    )
+    parser.add_argument(
+        "--loss_store",
+        type=str,
+        default="",
+        help="Read results, including loss trajectories, from this packed loss store (see loss_store.py).",
+    )
+    parser.add_argument(
+        "--build_loss_store",
+        type=str,
+        default="",
+        help="Pack the loaded results and their loss trajectories into a loss store at this path.",
+    )
+    parser.add_argument(
+        "--export_analysis_csv",
+        type=str,
+        default="",
+        help="Export relearning curve metrics (crossings of target_loss, slope, area above target) recomputed from the losses to csv file.",
+    )
+    parser.add_argument(
+        "--target_scales",
+        type=float,
+        nargs="+",
+        default=[1.0],
+        help="Multipliers of each run's target_loss to compute the crossings for in --export_analysis_csv.",
+    )
+    parser.add_argument(
+        "--smoothing_window",
+        type=int,
+        default=STOPPING_WINDOW,
+        help="Window of the trailing mean used for the smoothed crossing and the recomputed sample count in --export_analysis_csv.",
+    )
+    parser.add_argument(
+        "--samples_per_step",
+        type=int,
+        default=None,
+        help="Relearning samples consumed per logged loss, i.e. the relearning batch size (4 for the provided runs). Required by --export_analysis_csv.",
+    )
+    parser.add_argument(
+        "--listing_cache",
+        type=str,
+        default="",
+        help="Persist directory listings to this file and reuse them for directories whose mtime did not change.",
+    )
+    parser.add_argument(
+        "--load_workers",
+        type=int,
+        default=8,
+        help="Number of threads loading the jsons concurrently.",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Save the figures to --output_dir instead of showing them, using the non-interactive Agg backend. Implied when no display is available.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=".",
+        help="Directory the figures are saved to in headless mode.",
+    )
+    add_no_plot_argument(parser)
+    add_profile_arguments(parser)
+    parser.add_argument("jsons", metavar="jsons", type=str, nargs="*")
+
+    args = parser.parse_args()
+    if not args.jsons and args.store == "" and args.loss_store == "":
+        parser.error("either jsons, --store or --loss_store is required")
+    if args.export_analysis_csv != "" and args.samples_per_step is None:
+        parser.error("--export_analysis_csv requires --samples_per_step")
+    start_profiling("plot_relearn_results", args)
+
+    with PROFILER.phase("discover"):
+        json_files = discover_files(args.jsons, "*.json", args.listing_cache)
+    eval_results: List[Result] = []
+    with PROFILER.phase("parse"):
+        if args.store != "":
+            eval_results.extend(load_store_results(args.store))
+        if args.loss_store != "":
+            eval_results.extend(load_loss_store(args.loss_store))
+        eval_results.extend(
+            result_from_json(content)
+            for content in load_json_files(json_files, args.load_workers)
+        )
+    if args.build_loss_store != "":
+        with PROFILER.phase("write", output=args.build_loss_store):
+            save_loss_store(args.build_loss_store, eval_results)
+    with PROFILER.phase("compute"):
+        for i in eval_results:
+            get_label(i)
+        eval_results.sort(key=lambda x: (len(x.model_name), x.model_name))
+
+    if not args.no_plot:
+        if args.headless or not display_available():
+            os.makedirs(args.output_dir, exist_ok=True)
+            plot_results(eval_results, args.output_dir)
+        else:
+            plot_results(eval_results)
 
     if args.export_csv != "" and str(args.export_csv).endswith(".csv"):
-        with open(args.export_csv, "w") as fin:
-            fin.writelines(["model_name,label,step_number,experiment_type\n"])
-            fin.writelines(
+        with PROFILER.phase("write", output=args.export_csv):
+            with open(args.export_csv, "w") as fin:
+                fin.writelines(["model_name,label,step_number,experiment_type\n"])
+                fin.writelines(
+                    [
+                        "{},{},{},{}\n".format(
+                            i.model_name,
+                            i.label.replace("\n", " "),
+                            i.sample_count,
+                            str(i.experiment_type).split(".")[-1],
+                        )
+                        for i in eval_results
+                    ]
+                )
+
+    if args.export_analysis_csv != "" and str(args.export_analysis_csv).endswith(".csv"):
+        with PROFILER.phase("compute", output=args.export_analysis_csv):
+            losses, offsets = pack_losses([i.losses for i in eval_results])
+            write_analysis_csv(
+                args.export_analysis_csv,
                 [
-                    "{},{},{},{}\n".format(
-                        i.model_name,
-                        i.label.replace("\n", " "),
-                        i.sample_count,
-                        str(i.experiment_type).split(".")[-1],
-                    )
+                    {
+                        "model_name": i.model_name,
+                        "checkpoint": i.checkpoint,
+                        "sample_count": i.sample_count,
+                    }
                     for i in eval_results
-                ]
+                ],
+                analyse(
+                    losses,
+                    offsets,
+                    np.array([i.target_loss for i in eval_results]),
+                    args.samples_per_step,
+                    args.target_scales,
+                    args.smoothing_window,
+                ),
             )
@@ -0,0 +1,179 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Iterator
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is then not reported.
+    resource = None
+
+PROFILE_ENV = "SNLP_PROFILE"
+PROFILE_STATS_ENV = "SNLP_PROFILE_STATS"
+COUNTERS = ["files_read", "bytes_read", "json_parse_seconds"]
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+class Profiler:
+    """Opt-in instrumentation of the scripts, emitting JSON lines events.
+
+    Disabled until start is called with an output path, every method is then a
+    cheap no-op. Events are appended to the output one line at a time, so worker
+    processes forked by eval_all add theirs to the same file:
+        phase    wall time of a phase of a script, with the files and bytes
+                 read and the JSON parse time within it,
+        render   wall time of plotting and saving one figure,
+        summary  totals and peak RSS of the process, when it exits.
+    """
+
+    def __init__(self):
+        self.path: str | None = None
+        self.script = ""
+        self.started = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.lock = threading.Lock()
+        self.stats_path: str | None = None
+        self.cprofile = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def start(self, script: str, path: str | None = None, stats_path: str | None = None) -> None:
+        """Enable profiling, path "-" writing the events to stderr.
+
+        Without arguments, the outputs are taken from the SNLP_PROFILE and
+        SNLP_PROFILE_STATS environment variables, leaving profiling disabled if
+        they are unset.
+        """
+        self.path = path or os.environ.get(PROFILE_ENV) or None
+        self.stats_path = stats_path or os.environ.get(PROFILE_STATS_ENV) or None
+        self.script = script
+        self.started = time.perf_counter()
+        if self.stats_path is not None:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        if self.enabled or self.cprofile is not None:
+            atexit.register(self.finish)
+
+    def emit(self, event: str, **fields) -> None:
+        if not self.enabled:
+            return
+        line = json.dumps(
+            {"event": event, "script": self.script, "pid": os.getpid(), "time": time.time(), **fields}
+        )
+        if self.path == "-":
+            print(line, file=sys.stderr)
+            return
+        with self.lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    @contextlib.contextmanager
+    def phase(self, name: str, **fields) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        before = dict(self.counters)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.emit(
+                "phase",
+                phase=name,
+                seconds=seconds,
+                **{key: self.counters[key] - before[key] for key in COUNTERS},
+                **fields,
+            )
+
+    @contextlib.contextmanager
+    def render(self, artifact: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit("render", artifact=artifact, seconds=time.perf_counter() - start)
+
+    def record_read(self, path: str, parse_seconds: float = 0.0) -> None:
+        if not self.enabled:
+            return
+        size = os.path.getsize(path)
+        with self.lock:
+            self.counters["files_read"] += 1
+            self.counters["bytes_read"] += size
+            self.counters["json_parse_seconds"] += parse_seconds
+
+    @contextlib.contextmanager
+    def json_parse(self, path: str) -> Iterator[None]:
+        """Count reading and parsing the JSON file at path, timing the block."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_read(path, time.perf_counter() - start)
+
+    def finish(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.stats_path)
+            self.cprofile = None
+        if self.enabled:
+            self.emit(
+                "summary",
+                seconds=time.perf_counter() - self.started,
+                peak_rss_mb=peak_rss_mb(),
+                **self.counters,
+            )
+            self.path = None
+
+
+PROFILER = Profiler()
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default=None,
+        help=f"Append JSON lines with the wall time of each phase, files and bytes read, JSON parse time, render time of each figure and peak RSS to this file, - for stderr. Defaults to ${PROFILE_ENV}.",
+    )
+    parser.add_argument(
+        "--profile_stats",
+        type=str,
+        default=None,
+        help=f"Run under cProfile and dump its pstats to this file. Defaults to ${PROFILE_STATS_ENV}.",
+    )
+
+
+def start_profiling(script: str, args: argparse.Namespace) -> None:
+    PROFILER.start(script, args.profile, args.profile_stats)
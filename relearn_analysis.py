@@ -0,0 +1,180 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Vectorised analysis of relearning loss curves.
+
+All runs are analysed at once on a NaN-padded (runs x steps) loss matrix, and
+every metric is computed for a whole sweep of target losses, one target at a
+time so no (runs x targets x steps) intermediate is built.
+"""
+
+import argparse
+import csv
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from loss_store import LossStore
+from smoothing import rolling_mean
+
+# Relearning stops at the first step where the mean of the last STOPPING_WINDOW
+# losses is at or below target_loss. This reproduces the sample_count of every
+# provided run from its losses.
+STOPPING_WINDOW = 10
+NOT_CROSSED = -1
+
+
+def pad_losses(losses: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Scatter ragged trajectories (packed as in a LossStore) into a NaN-padded matrix."""
+    lengths = np.diff(offsets)
+    matrix = np.full((len(lengths), int(lengths.max(initial=0))), np.nan, dtype=np.float32)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(int(offsets[-1])) - np.repeat(offsets[:-1], lengths)
+    matrix[rows, columns] = losses[offsets[0] : offsets[-1]]
+    return matrix
+
+
+def pack_losses(trajectories: Sequence[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(trajectories) + 1, dtype=np.int64)
+    np.cumsum([len(i) for i in trajectories], out=offsets[1:])
+    if not len(trajectories):
+        return np.zeros(0, dtype=np.float32), offsets
+    return np.concatenate(trajectories).astype(np.float32, copy=False), offsets
+
+
+def first_crossing(matrix: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Index of the first step at or below target, per run and target (NOT_CROSSED if never).
+
+    matrix is (runs, steps) and targets (runs, n_targets); the result is (runs, n_targets).
+    Targets are compared one at a time, so memory stays that of one (runs, steps) mask.
+    """
+    crossings = np.full(targets.shape, NOT_CROSSED, dtype=np.int64)
+    for j in range(targets.shape[1]):
+        below = matrix <= targets[:, j, None]
+        crossed = below.any(axis=1)
+        crossings[crossed, j] = below[crossed].argmax(axis=1)
+    return crossings
+
+
+def area_above_target(matrix: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Sum of the losses' excess over target (one unit per step), per run and target."""
+    areas = np.empty(targets.shape, dtype=np.float64)
+    for j in range(targets.shape[1]):
+        excess = matrix - targets[:, j, None]
+        np.clip(excess, 0.0, None, out=excess)
+        areas[:, j] = np.nansum(excess, axis=1)
+    return areas
+
+
+def step_slopes(matrix: np.ndarray) -> np.ndarray:
+    """Per-step loss change, (runs, steps - 1), NaN past the end of a run."""
+    return np.diff(matrix, axis=1)
+
+
+def analyse(
+    losses: np.ndarray,
+    offsets: np.ndarray,
+    target_losses: np.ndarray,
+    samples_per_step: int,
+    target_scales: Sequence[float] = (1.0,),
+    smoothing_window: int = STOPPING_WINDOW,
+) -> Dict[str, np.ndarray]:
+    """Compute the relearning metrics of every run for every scaled target loss.
+
+    samples_per_step is the number of relearning samples consumed per logged
+    loss, i.e. the relearning batch size. recomputed_sample_count is the number
+    of samples consumed until the smoothed loss crossed the target, NaN if it
+    never did. Returns arrays of shape (runs, len(target_scales)) keyed by
+    metric name.
+    """
+    matrix = pad_losses(losses, offsets)
+    lengths = np.diff(offsets)
+    targets = np.asarray(target_losses, dtype=np.float64)[:, None] * np.asarray(
+        target_scales, dtype=np.float64
+    )
+    shape = targets.shape
+
+    with np.errstate(invalid="ignore"):
+        slopes = step_slopes(matrix)
+        has_slope = (~np.isnan(slopes)).any(axis=1)
+        mean_slope = np.full(len(lengths), np.nan)
+        mean_slope[has_slope] = np.nanmean(slopes[has_slope], axis=1)
+
+    # Trailing mean along the steps, NaN until a run has window losses.
+    smoothed_crossing = first_crossing(rolling_mean(matrix.T, smoothing_window).T, targets)
+    recomputed_sample_count = np.where(
+        smoothed_crossing == NOT_CROSSED, np.nan, (smoothed_crossing + 1.0) * samples_per_step
+    )
+
+    return {
+        "target_scale": np.broadcast_to(np.asarray(target_scales, dtype=np.float64), shape),
+        "target_loss": targets,
+        "steps": np.broadcast_to(lengths[:, None], shape),
+        "recomputed_sample_count": recomputed_sample_count,
+        "first_crossing_step": first_crossing(matrix, targets),
+        "smoothed_crossing_step": smoothed_crossing,
+        "mean_slope": np.broadcast_to(mean_slope[:, None], shape),
+        "area_above_target": area_above_target(matrix, targets),
+    }
+
+
+def write_analysis_csv(
+    path: str, records: List[Dict], metrics: Dict[str, np.ndarray]
+) -> None:
+    """Write one row per (run, target scale), the run described by its record."""
+    record_columns = ["model_name", "checkpoint", "sample_count"]
+    with open(path, "w", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(record_columns + list(metrics))
+        n_scales = next(iter(metrics.values())).shape[1] if metrics else 0
+        for i, record in enumerate(records):
+            for j in range(n_scales):
+                writer.writerow(
+                    [record[c] for c in record_columns]
+                    + [metrics[m][i, j] for m in metrics]
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Analyse the relearning loss curves of a loss store."
+    )
+    parser.add_argument("loss_store", type=str, help="Path to a loss store (see loss_store.py).")
+    parser.add_argument(
+        "--target_scales",
+        type=float,
+        nargs="+",
+        default=[1.0],
+        help="Multipliers of each run's target loss to analyse the crossings for.",
+    )
+    parser.add_argument(
+        "--smoothing_window",
+        type=int,
+        default=STOPPING_WINDOW,
+        help="Window of the trailing mean used for the smoothed crossing and the recomputed sample count.",
+    )
+    parser.add_argument(
+        "--samples_per_step",
+        type=int,
+        required=True,
+        help="Relearning samples consumed per logged loss, i.e. the relearning batch size (4 for the provided runs).",
+    )
+    parser.add_argument("--export_csv", type=str, required=True, help="Output CSV path.")
+    args = parser.parse_args()
+
+    store = LossStore(args.loss_store)
+    metrics = analyse(
+        store.losses,
+        store.offsets,
+        np.array([i["target_loss"] for i in store.records]),
+        args.samples_per_step,
+        args.target_scales,
+        args.smoothing_window,
+    )
+    write_analysis_csv(args.export_csv, store.records, metrics)
@@ -0,0 +1,326 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Consolidated Parquet store of the per-checkpoint metrics of every eval stage.
+
+Metrics are kept in long format, one row per (family, run, stage, checkpoint,
+metric), hive-partitioned on disk as <store>/family=<family>/run=<run>/. Each
+partition is sorted by stage and checkpoint so checkpoint predicates prune row
+groups. Reading goes through pandas' Parquet support (pyarrow), which provides
+column projection and predicate pushdown.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+
+import pandas as pd
+
+import eval_framework
+from catalog import (
+    CONTINUOUS_FAMILY,
+    Catalog,
+    RunInfo,
+    checkpoint_of,
+    load_catalog,
+    parse_run_name,
+)
+from compression import open_input, strip_compression
+
+STORE_COLUMNS = ["family", "run", "stage", "checkpoint", "metric", "value"]
+PARTITION_FILE_NAME = "part-0.parquet"
+# Values of the "stage" column written by each ingested stage
+STORE_STAGES = {
+    "framework": ["framework"],
+    "harmfulness": ["harmfulness"],
+    "relearn": ["relearn"],
+    "mink": ["mink_badloss_mink", "mink_safety"],
+}
+MINK_FILE_PATTERN = re.compile(r"continuous_unlearning_(\d+)_(badloss_mink|safety)\.csv")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Ingest the metrics of all eval stages into a partitioned Parquet store, or query it."
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default="results_store",
+        help="Root directory of the Parquet store.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="(Re)write the store from the result trees.")
+    ingest.add_argument(
+        "--base_path",
+        type=str,
+        default=os.getcwd(),
+        help="Toplevel directory containing the eval_* result trees.",
+    )
+    ingest.add_argument(
+        "--stages",
+        type=str,
+        nargs="+",
+        choices=list(STORE_STAGES),
+        default=list(STORE_STAGES),
+        help="Stages to ingest.",
+    )
+    eval_framework.add_metric_arguments(ingest)
+
+    query = subparsers.add_parser("query", help="Print (a subset of) the store.")
+    for column in ["family", "run", "stage", "metric"]:
+        query.add_argument(f"--{column}", type=str, nargs="+", default=None)
+    query.add_argument(
+        "--wide",
+        action="store_true",
+        help="Print one column per metric instead of one row per metric.",
+    )
+
+    args = parser.parse_args()
+    return args
+
+
+def to_long(df: pd.DataFrame, family: str, run: str, stage: str) -> pd.DataFrame:
+    """Convert a frame indexed by checkpoint with one column per metric to store rows."""
+    long = df.rename_axis("checkpoint").reset_index().melt(
+        id_vars="checkpoint", var_name="metric", value_name="value"
+    )
+    long["family"] = family
+    long["run"] = run
+    long["stage"] = stage
+    long["checkpoint"] = long["checkpoint"].astype("int64")
+    long["value"] = long["value"].astype("float64")
+    return long[STORE_COLUMNS]
+
+
+def framework_metrics(
+    run_dir: str, extractor: eval_framework.MetricExtractor
+) -> pd.DataFrame:
+    log_data = eval_framework.fetch_log_data(
+        os.path.join(run_dir, "eval_results"), extractor
+    )
+    return pd.DataFrame.from_dict(
+        eval_framework.filter_json_logs(log_data, extractor)
+    ).transpose()
+
+
+def harmfulness_metrics(run_dir: str) -> pd.DataFrame:
+    df = pd.read_csv(os.path.join(run_dir, "flagged_ratio.csv"), index_col=False)
+    df.index = [checkpoint_of(model_name) for model_name in df.pop("model_name")]
+    return df
+
+
+def partition_of(catalog: Catalog, run: RunInfo | None, name: str) -> tuple[str, str]:
+    """(family, run) partition of the results of a model, that of its evaluation run.
+
+    Relearn and mink results are thus stored with the framework and harmfulness
+    results of the same model. Results of models without an evaluation run keep
+    their own name.
+    """
+    if run is None:
+        return CONTINUOUS_FAMILY, name
+    evaluation = catalog.evaluation_of(run)
+    return run.family, name if evaluation is None else evaluation.name
+
+
+def ingest_framework(
+    base_path: str, extractor: eval_framework.MetricExtractor
+) -> dict[tuple[str, str], list[pd.DataFrame]]:
+    partitions = {}
+    for log_dir in sorted(
+        glob.glob(os.path.join(base_path, "eval_framework_tasks", "*", "*", "eval_results"))
+    ):
+        run_dir = os.path.dirname(log_dir)
+        family, run = run_dir.split(os.sep)[-2:]
+        partitions.setdefault((family, run), []).append(
+            to_long(framework_metrics(run_dir, extractor), family, run, "framework")
+        )
+    return partitions
+
+
+def ingest_harmfulness(base_path: str) -> dict[tuple[str, str], list[pd.DataFrame]]:
+    partitions = {}
+    for csv_path in sorted(
+        glob.glob(os.path.join(base_path, "eval_harmfulness", "*", "*", "flagged_ratio.csv"))
+    ):
+        run_dir = os.path.dirname(csv_path)
+        family, run = run_dir.split(os.sep)[-2:]
+        partitions.setdefault((family, run), []).append(
+            to_long(harmfulness_metrics(run_dir), family, run, "harmfulness")
+        )
+    return partitions
+
+
+def ingest_relearn(
+    base_path: str, catalog: Catalog
+) -> dict[tuple[str, str], list[pd.DataFrame]]:
+    rows: dict[str, dict[int, dict]] = {}
+    for json_path in sorted(
+        glob.glob(os.path.join(base_path, "eval_relearn", "data", "*", "idx_*.json*"))
+    ):
+        with open_input(json_path) as f:
+            content = json.load(f)
+        rows.setdefault(content["unlearned_model"], {})[
+            checkpoint_of(content["checkpoint"])
+        ] = {
+            "sample_count": content["sample_count"],
+            "target_loss": content["target_loss"],
+            "relearn_steps": len(content["losses"]),
+        }
+
+    partitions = {}
+    for model_name, checkpoints in rows.items():
+        family, run = partition_of(
+            catalog, parse_run_name(model_name, "relearn"), model_name
+        )
+        partitions.setdefault((family, run), []).append(
+            to_long(
+                pd.DataFrame.from_dict(checkpoints, orient="index"), family, run, "relearn"
+            )
+        )
+    return partitions
+
+
+def ingest_mink(base_path: str, catalog: Catalog) -> dict[tuple[str, str], list[pd.DataFrame]]:
+    partitions = {}
+    for csv_path in sorted(glob.glob(os.path.join(base_path, "eval_mink", "*.csv*"))):
+        match = MINK_FILE_PATTERN.fullmatch(strip_compression(os.path.basename(csv_path)))
+        if match is None:
+            continue
+        seed, kind = match.groups()
+        name = f"continuous_unlearning_{seed}"
+        family, run = partition_of(
+            catalog,
+            RunInfo(stage=f"mink_{kind}", family=CONTINUOUS_FAMILY, name=name, seed=int(seed)),
+            name,
+        )
+        df = pd.read_csv(csv_path).set_index("Step")
+        partitions.setdefault((family, run), []).append(
+            to_long(df, family, run, f"mink_{kind}")
+        )
+    return partitions
+
+
+def write_partitions(
+    store: str, partitions: dict[tuple[str, str], list[pd.DataFrame]], stages: list[str]
+) -> None:
+    """Write the given stages of each (family, run) partition, keeping its other stages."""
+    for (family, run), frames in partitions.items():
+        partition_dir = os.path.join(store, f"family={family}", f"run={run}")
+        partition_path = os.path.join(partition_dir, PARTITION_FILE_NAME)
+        if os.path.exists(partition_path):
+            kept = pd.read_parquet(partition_path)
+            frames = [kept[~kept["stage"].isin(stages)], *frames]
+            shutil.rmtree(partition_dir)
+        os.makedirs(partition_dir)
+
+        df = pd.concat(frames, ignore_index=True).sort_values(
+            ["stage", "checkpoint"], kind="stable"
+        )
+        # Partition keys are encoded in the path only.
+        df.drop(columns=["family", "run"]).to_parquet(partition_path, index=False)
+
+
+def ingest(
+    base_path: str,
+    store: str,
+    stages: list[str],
+    extractor: eval_framework.MetricExtractor = eval_framework.DEFAULT_EXTRACTOR,
+) -> None:
+    catalog = load_catalog(base_path)
+    stage_partitions = {
+        "framework": lambda: ingest_framework(base_path, extractor),
+        "harmfulness": lambda: ingest_harmfulness(base_path),
+        "relearn": lambda: ingest_relearn(base_path, catalog),
+        "mink": lambda: ingest_mink(base_path, catalog),
+    }
+    partitions: dict[tuple[str, str], list[pd.DataFrame]] = {}
+    for stage in stages:
+        for key, frames in stage_partitions[stage]().items():
+            partitions.setdefault(key, []).extend(frames)
+
+    write_partitions(
+        store, partitions, [name for stage in stages for name in STORE_STAGES[stage]]
+    )
+
+
+def read_store(
+    store: str,
+    columns: list[str] | None = None,
+    filters: list[tuple] | None = None,
+) -> pd.DataFrame:
+    """Read the store, projecting columns and pushing filters down to the Parquet scan.
+
+    filters use the pandas/pyarrow DNF form, e.g. [("stage", "==", "framework"),
+    ("checkpoint", ">=", 100)]; filters on family and run only open matching partitions.
+    """
+    df = pd.read_parquet(store, columns=columns, filters=filters)
+    for column in ["family", "run"]:
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+    return df
+
+
+def read_run_metrics(store: str, family: str, run: str, stage: str) -> pd.DataFrame:
+    """Return the metrics of one stage of a run as a frame indexed by checkpoint."""
+    df = read_store(
+        store,
+        columns=["checkpoint", "metric", "value"],
+        filters=[("family", "==", family), ("run", "==", run), ("stage", "==", stage)],
+    )
+    return to_wide(df)
+
+
+def read_stage_runs(store: str, family: str, stage: str) -> dict[str, pd.DataFrame]:
+    """Return the metrics of one stage for every run of a family, indexed by checkpoint."""
+    df = read_store(
+        store,
+        columns=["run", "checkpoint", "metric", "value"],
+        filters=[("family", "==", family), ("stage", "==", stage)],
+    )
+    return {
+        run: to_wide(run_df.drop(columns="run"))
+        for run, run_df in df.groupby("run", sort=True)
+    }
+
+
+def to_wide(df: pd.DataFrame) -> pd.DataFrame:
+    """Pivot store rows to one column per metric, keeping the metrics in stored order."""
+    index = [c for c in ["family", "run", "stage", "checkpoint"] if c in df.columns]
+    wide = df.groupby(index + ["metric"], sort=True)["value"].first().unstack("metric")
+    wide = wide[[m for m in pd.unique(df["metric"]) if m in wide.columns]]
+    wide.columns.name = None
+    return wide
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.command == "ingest":
+        ingest(
+            args.base_path,
+            args.store,
+            args.stages,
+            eval_framework.extractor_from_args(args),
+        )
+        return
+
+    filters = [
+        (column, "in", values)
+        for column in ["family", "run", "stage", "metric"]
+        if (values := getattr(args, column)) is not None
+    ]
+    df = read_store(args.store, filters=filters or None)
+    print(to_wide(df) if args.wide else df)
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,182 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Aggregation of per-seed metric CSVs over any number of seeds.
+
+The CSVs of every seed are stacked into a single (seeds x steps x columns)
+array aligned on Step, NaN where a seed did not log a step, and the mean,
+standard deviation and bootstrap confidence interval over seeds are computed
+for every step and column at once.
+"""
+
+import argparse
+import os
+import re
+import warnings
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from compression import strip_compression
+
+SEED_FILE_PATTERN = re.compile(r"continuous_unlearning_(\d+)_(.+)\.csv")
+STEP_COLUMN = "Step"
+
+
+def classify_seed_files(paths: Sequence[str]) -> Dict[str, Dict[int, str]]:
+    """Group continuous_unlearning_<seed>_<kind>.csv paths as {kind: {seed: path}}, seeds sorted.
+
+    Paths with other names are ignored.
+    """
+    files: Dict[str, Dict[int, str]] = {}
+    for path in paths:
+        match = SEED_FILE_PATTERN.fullmatch(strip_compression(os.path.basename(path)))
+        if match is None:
+            continue
+        seeds = files.setdefault(match.group(2), {})
+        seed = int(match.group(1))
+        assert seed not in seeds, f"Seed {seed} given twice: {seeds.get(seed)} and {path}"
+        seeds[seed] = path
+    return {kind: dict(sorted(seeds.items())) for kind, seeds in sorted(files.items())}
+
+
+def discover_seed_files(directory: str) -> Dict[str, Dict[int, str]]:
+    """Return {kind: {seed: path}} of the continuous_unlearning_<seed>_<kind>.csv files in directory."""
+    with os.scandir(directory) as entries:
+        return classify_seed_files([e.path for e in entries if e.is_file()])
+
+
+def stack_on_step(
+    frames: Sequence[pd.DataFrame], columns: Optional[List[str]] = None
+) -> tuple[np.ndarray, np.ndarray, List[str]]:
+    """Stack per-seed frames into (steps, values, columns).
+
+    steps is the sorted union of all seeds' steps and values a float64 array of
+    shape (seeds, steps, columns), NaN where a seed has no row for a step. Rows
+    of a seed repeating a step are averaged.
+    """
+    assert len(frames) > 0, "No seeds to aggregate"
+    if columns is None:
+        columns = [c for c in frames[0].columns if c != STEP_COLUMN]
+    # A seed logging a step more than once contributes the mean of its rows.
+    frames = [
+        f.groupby(STEP_COLUMN, as_index=False)[columns].mean()
+        if f[STEP_COLUMN].duplicated().any()
+        else f
+        for f in frames
+    ]
+    seed_steps = [f[STEP_COLUMN].to_numpy() for f in frames]
+    steps = np.unique(np.concatenate(seed_steps))
+
+    values = np.full((len(frames), len(steps), len(columns)), np.nan)
+    for i, (frame, frame_steps) in enumerate(zip(frames, seed_steps)):
+        values[i, np.searchsorted(steps, frame_steps)] = frame[columns].to_numpy(
+            dtype=np.float64
+        )
+    return steps, values, columns
+
+
+def bootstrap_mean_interval(
+    values: np.ndarray,
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap interval of the mean over axis 0, ignoring NaNs.
+
+    Resamples are drawn as multinomial counts per seed, so every resample's
+    mean is one weighted sum and all of them come out of a single matrix
+    product instead of materialising the resampled arrays.
+    """
+    n_seeds = values.shape[0]
+    flat = values.reshape(n_seeds, -1)
+    valid = ~np.isnan(flat)
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(n_seeds, np.full(n_seeds, 1.0 / n_seeds), size=n_resamples)
+
+    alpha = (1.0 - confidence) / 2
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Resamples drawing only seeds without a step have no mean for it.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        means = (counts @ np.where(valid, flat, 0.0)) / (counts @ valid)
+        low, high = np.nanquantile(means, [alpha, 1.0 - alpha], axis=0)
+    return low.reshape(values.shape[1:]), high.reshape(values.shape[1:])
+
+
+def aggregate_seeds(
+    frames: Sequence[pd.DataFrame],
+    columns: Optional[List[str]] = None,
+    n_resamples: int = 1000,
+    confidence: float = 0.95,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Aggregate per-seed frames into one row per step.
+
+    Each metric column holds the mean over seeds, as the plots expect, next to
+    <column>_std, <column>_ci_low and <column>_ci_high; seeds counts the seeds
+    contributing to a step.
+    """
+    steps, values, columns = stack_on_step(frames, columns)
+    with warnings.catch_warnings():
+        # Steps logged by no seed (or a single one) have no mean (or std).
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=0)
+        std = np.nanstd(values, axis=0, ddof=1)
+    if n_resamples > 0:
+        low, high = bootstrap_mean_interval(values, n_resamples, confidence, seed)
+    else:
+        low = high = np.full(mean.shape, np.nan)
+
+    output = {STEP_COLUMN: steps}
+    for j, column in enumerate(columns):
+        output[column] = mean[:, j]
+        output[f"{column}_std"] = std[:, j]
+        output[f"{column}_ci_low"] = low[:, j]
+        output[f"{column}_ci_high"] = high[:, j]
+    output["seeds"] = (~np.isnan(values)).any(axis=2).sum(axis=0)
+    return pd.DataFrame(output)
+
+
+def aggregate_seed_files(paths: Sequence[str], **kwargs) -> pd.DataFrame:
+    return aggregate_seeds([pd.read_csv(p) for p in paths], **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Aggregate the continuous_unlearning_<seed>_<kind>.csv files of a directory over seeds."
+    )
+    parser.add_argument("directory", type=str, help="Directory holding the per-seed CSVs.")
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Where to write continuous_unlearning_aggregated_<kind>.csv, defaults to directory.",
+    )
+    parser.add_argument(
+        "--n_resamples",
+        type=int,
+        default=1000,
+        help="Bootstrap resamples for the confidence interval, 0 to skip it.",
+    )
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the interval.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the bootstrap resampling.")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or args.directory
+    for kind, seed_files in discover_seed_files(args.directory).items():
+        aggregated = aggregate_seed_files(
+            list(seed_files.values()),
+            n_resamples=args.n_resamples,
+            confidence=args.confidence,
+            seed=args.seed,
+        )
+        output_path = os.path.join(output_dir, f"continuous_unlearning_aggregated_{kind}.csv")
+        aggregated.to_csv(output_path, index=False)
+        print(f"{kind}: {len(seed_files)} seeds, {len(aggregated)} steps -> {output_path}")
@@ -0,0 +1,259 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Streaming smoothing and normalisation of step series, using NumPy only.
+
+Every transform consumes a series in chunks of rows, (rows,) or (rows, columns)
+arrays, and carries the state needed to continue with the next chunk. Feeding a
+series in any chunking gives the same output as feeding it at once, so series
+too long to hold in memory can be processed from a file:
+    RollingMean              trailing mean over window rows, like pandas
+                             rolling(window).mean(): NaN until window rows were
+                             seen and wherever the window holds a NaN.
+    ExponentialMovingAverage y_t = alpha * x_t + (1 - alpha) * y_(t-1), like
+                             pandas ewm(alpha=alpha, adjust=False).mean(),
+                             starting at the first row without NaNs.
+    MinMaxNormaliser         (x - min) / (max - min), fitted with partial_fit.
+    ZScoreNormaliser         (x - mean) / std, fitted with partial_fit.
+NaNs are ignored when fitting the normalisers and stay NaN when transforming.
+"""
+
+import argparse
+import csv
+import math
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from compression import open_input
+
+
+class RollingMean:
+    def __init__(self, window: int):
+        assert window >= 1
+        self.window = window
+        self.tail: Optional[np.ndarray] = None
+
+    def update(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if self.tail is None:
+            # Rows before the series start count as missing.
+            self.tail = np.full((self.window - 1,) + chunk.shape[1:], np.nan)
+        values = np.concatenate([self.tail, chunk])
+        self.tail = values[len(values) - (self.window - 1) :]
+
+        missing = np.isnan(values)
+        sums = np.cumsum(np.where(missing, 0.0, values), axis=0)
+        counts = np.cumsum(missing, axis=0)
+        zero = np.zeros((1,) + chunk.shape[1:])
+        sums = np.concatenate([zero, sums])
+        counts = np.concatenate([zero, counts])
+        window_sums = sums[self.window :] - sums[: -self.window]
+        window_missing = counts[self.window :] - counts[: -self.window]
+        return np.where(window_missing > 0, np.nan, window_sums / self.window)
+
+
+class ExponentialMovingAverage:
+    # Largest power of 1 / (1 - alpha) allowed within one block of the closed form.
+    MAX_GROWTH = 1e8
+
+    def __init__(self, alpha: Optional[float] = None, span: Optional[float] = None):
+        assert (alpha is None) != (span is None), "Give exactly one of alpha and span"
+        self.alpha = alpha if alpha is not None else 2.0 / (span + 1.0)
+        assert 0.0 < self.alpha <= 1.0
+        self.state: Optional[np.ndarray] = None
+        decay = 1.0 - self.alpha
+        self.block = (
+            max(1, int(math.log(self.MAX_GROWTH) / -math.log(decay))) if decay > 0 else 1 << 30
+        )
+
+    def update(self, chunk: np.ndarray) -> np.ndarray:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        output = np.full(chunk.shape, np.nan)
+        start = 0
+        if self.state is None:
+            # Skip leading missing rows, e.g. the warm-up of a preceding rolling mean.
+            missing = np.isnan(chunk).reshape(len(chunk), -1).any(axis=1)
+            start = int(missing.argmin()) if not missing.all() else len(chunk)
+        assert not np.isnan(chunk[start:]).any(), "ExponentialMovingAverage only skips leading NaNs"
+        for start in range(start, len(chunk), self.block):
+            output[start : start + self.block] = self._update_block(
+                chunk[start : start + self.block]
+            )
+        return output
+
+    def _update_block(self, block: np.ndarray) -> np.ndarray:
+        # Closed form y_t = d^t * (y_0 + sum_k alpha * x_k * d^-k) over a block short
+        # enough for d^-k to stay well inside float64, d being 1 - alpha.
+        if self.state is None:
+            self.state = block[0]
+        decay = 1.0 - self.alpha
+        if decay == 0.0:
+            self.state = block[-1]
+            return block.copy()
+        powers = decay ** np.arange(1, len(block) + 1, dtype=np.float64)
+        if block.ndim > 1:
+            powers = powers[:, None]
+        output = powers * (self.state + np.cumsum(self.alpha * block / powers, axis=0))
+        self.state = output[-1]
+        return output
+
+
+class MinMaxNormaliser:
+    def __init__(self):
+        self.minimum: Optional[np.ndarray] = None
+        self.maximum: Optional[np.ndarray] = None
+
+    def partial_fit(self, chunk: np.ndarray) -> "MinMaxNormaliser":
+        chunk = np.asarray(chunk, dtype=np.float64)
+        valid = ~np.isnan(chunk)
+        minimum = np.min(chunk, axis=0, initial=np.inf, where=valid)
+        maximum = np.max(chunk, axis=0, initial=-np.inf, where=valid)
+        if self.minimum is None:
+            self.minimum, self.maximum = minimum, maximum
+        else:
+            self.minimum = np.minimum(self.minimum, minimum)
+            self.maximum = np.maximum(self.maximum, maximum)
+        return self
+
+    def transform(self, chunk: np.ndarray) -> np.ndarray:
+        assert self.minimum is not None, "partial_fit was never called"
+        value_range = self.maximum - self.minimum
+        # A constant column maps to 0 rather than dividing by zero.
+        value_range = np.where(value_range > 0, value_range, 1.0)
+        return (np.asarray(chunk, dtype=np.float64) - self.minimum) / value_range
+
+
+class ZScoreNormaliser:
+    def __init__(self):
+        self.count: Optional[np.ndarray] = None
+        self.mean: Optional[np.ndarray] = None
+        self.m2: Optional[np.ndarray] = None
+
+    def partial_fit(self, chunk: np.ndarray) -> "ZScoreNormaliser":
+        # Chan et al.'s pairwise update of the count, mean and sum of squared deviations.
+        chunk = np.asarray(chunk, dtype=np.float64)
+        valid = ~np.isnan(chunk)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, chunk, 0.0).sum(axis=0) / count
+            m2 = np.where(valid, (chunk - mean) ** 2, 0.0).sum(axis=0)
+        mean = np.where(count > 0, mean, 0.0)
+
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+            return self
+        total = self.count + count
+        safe_total = np.where(total > 0, total, 1)
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + delta**2 * self.count * count / safe_total
+        self.mean = self.mean + delta * count / safe_total
+        self.count = total
+        return self
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2 / self.count)
+
+    def transform(self, chunk: np.ndarray) -> np.ndarray:
+        assert self.count is not None, "partial_fit was never called"
+        std = self.std
+        std = np.where(std > 0, std, 1.0)
+        return (np.asarray(chunk, dtype=np.float64) - self.mean) / std
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    return RollingMean(window).update(values)
+
+
+def min_max_normalise(values: np.ndarray) -> np.ndarray:
+    return MinMaxNormaliser().partial_fit(values).transform(values)
+
+
+def read_csv_chunks(
+    path: str, columns: Sequence[str], chunk_size: int = 100_000
+) -> Iterator[tuple[List[List[str]], np.ndarray]]:
+    """Yield (rows, values) chunks of a CSV, values holding the given columns as floats."""
+    with open_input(path, newline="") as fin:
+        reader = csv.reader(fin)
+        header = next(reader)
+        indices = [header.index(c) for c in columns]
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) == chunk_size:
+                yield rows, to_values(rows, indices)
+                rows = []
+        if rows:
+            yield rows, to_values(rows, indices)
+
+
+def to_values(rows: List[List[str]], indices: List[int]) -> np.ndarray:
+    return np.array(
+        [[float(row[i]) if row[i] else np.nan for i in indices] for row in rows]
+    )
+
+
+def csv_header(path: str) -> List[str]:
+    with open_input(path, newline="") as fin:
+        return next(csv.reader(fin))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Smooth and normalise columns of a step series CSV, streaming it in chunks."
+    )
+    parser.add_argument("csv", type=str, help="Input CSV file.")
+    parser.add_argument("--columns", type=str, nargs="+", required=True, help="Columns to transform.")
+    parser.add_argument("--window", type=int, default=10, help="Window of the rolling mean, 1 to skip it.")
+    parser.add_argument(
+        "--ema_alpha",
+        type=float,
+        default=None,
+        help="Apply an exponential moving average with this smoothing factor after the rolling mean.",
+    )
+    parser.add_argument(
+        "--normalise",
+        choices=["none", "minmax", "zscore"],
+        default="minmax",
+        help="Normalisation applied to the smoothed columns, fitted on the whole series.",
+    )
+    parser.add_argument("--chunk_size", type=int, default=100_000, help="Rows per chunk.")
+    parser.add_argument("--output", type=str, required=True, help="Output CSV file.")
+    args = parser.parse_args()
+
+    def smoothed_chunks() -> Iterator[tuple[List[List[str]], np.ndarray]]:
+        rolling = RollingMean(args.window)
+        ema = None if args.ema_alpha is None else ExponentialMovingAverage(args.ema_alpha)
+        for rows, values in read_csv_chunks(args.csv, args.columns, args.chunk_size):
+            values = rolling.update(values)
+            if ema is not None:
+                values = ema.update(values)
+            yield rows, values
+
+    normaliser = {"minmax": MinMaxNormaliser, "zscore": ZScoreNormaliser}.get(args.normalise)
+    if normaliser is not None:
+        # The normalisation needs statistics of the whole series, so smooth it twice.
+        normaliser = normaliser()
+        for _, values in smoothed_chunks():
+            normaliser.partial_fit(values)
+
+    header = csv_header(args.csv)
+    indices = [header.index(c) for c in args.columns]
+    with open(args.output, "w", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(header)
+        for rows, values in smoothed_chunks():
+            if normaliser is not None:
+                values = normaliser.transform(values)
+            for row, row_values in zip(rows, values):
+                for i, value in zip(indices, row_values):
+                    row[i] = "" if np.isnan(value) else repr(float(value))
+                writer.writerow(row)
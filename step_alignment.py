@@ -0,0 +1,162 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+"""Alignment of step-indexed series logged at different cadences.
+
+Every series is a pair of (steps, values) arrays with increasing steps. They can
+be resampled onto a common grid of steps by
+    nearest  the value at the closest logged step,
+    linear   linear interpolation between the surrounding logged steps,
+    asof     the last value logged at or before the step,
+all located with one np.searchsorted per series. Grid steps outside a series'
+logged range are NaN. Long series can be downsampled into a fixed number of
+buckets before plotting.
+"""
+
+import argparse
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+ALIGN_METHODS = ["nearest", "linear", "asof"]
+DOWNSAMPLE_METHODS = ["mean", "minmax"]
+
+
+def common_grid(steps: Sequence[np.ndarray], mode: str = "union") -> np.ndarray:
+    """Union of all steps, the steps shared by every series or those of the coarsest one."""
+    if mode == "union":
+        return np.unique(np.concatenate(steps))
+    if mode == "intersection":
+        grid = np.unique(steps[0])
+        for s in steps[1:]:
+            grid = np.intersect1d(grid, s)
+        return grid
+    if mode == "coarsest":
+        return np.unique(min(steps, key=len))
+    raise ValueError(f"Unknown grid mode {mode}")
+
+
+def align(
+    steps: np.ndarray, values: np.ndarray, grid: np.ndarray, method: str = "nearest"
+) -> np.ndarray:
+    """Resample values logged at steps onto grid, values being (steps,) or (steps, columns)."""
+    steps = np.asarray(steps)
+    values = np.asarray(values, dtype=np.float64)
+    grid = np.asarray(grid)
+    output = np.full((len(grid),) + values.shape[1:], np.nan)
+    if not len(steps):
+        return output
+
+    inside = (grid >= steps[0]) & (grid <= steps[-1])
+    target = grid[inside]
+    # Index of the first logged step >= each grid step.
+    right = np.searchsorted(steps, target, side="left")
+    exact = steps[np.minimum(right, len(steps) - 1)] == target
+
+    if method == "asof":
+        index = np.where(exact, right, right - 1)
+        output[inside] = values[index]
+    elif method == "nearest":
+        left = np.maximum(right - 1, 0)
+        right = np.minimum(right, len(steps) - 1)
+        # Ties go to the earlier step.
+        closer_left = (target - steps[left]) <= (steps[right] - target)
+        output[inside] = values[np.where(closer_left, left, right)]
+    elif method == "linear":
+        right = np.minimum(right, len(steps) - 1)
+        left = np.where(exact, right, np.maximum(right - 1, 0))
+        span = (steps[right] - steps[left]).astype(np.float64)
+        weight = np.divide(
+            target - steps[left], span, out=np.zeros(len(target)), where=span > 0
+        )
+        if values.ndim > 1:
+            weight = weight[:, None]
+        output[inside] = values[left] + weight * (values[right] - values[left])
+    else:
+        raise ValueError(f"Unknown alignment method {method}")
+    return output
+
+
+def align_frames(
+    frames: Dict[str, pd.DataFrame],
+    step_column: str = "Step",
+    grid_mode: str = "union",
+    method: str = "nearest",
+) -> pd.DataFrame:
+    """Join step-indexed frames on a common grid, prefixing columns with the frame's name on clashes."""
+    grid = common_grid([f[step_column].to_numpy() for f in frames.values()], grid_mode)
+    output = {step_column: grid}
+    for name, frame in frames.items():
+        columns = [c for c in frame.columns if c != step_column]
+        aligned = align(
+            frame[step_column].to_numpy(), frame[columns].to_numpy(), grid, method
+        )
+        for j, column in enumerate(columns):
+            output[f"{name}/{column}" if column in output else column] = aligned[:, j]
+    return pd.DataFrame(output)
+
+
+def downsample(
+    steps: np.ndarray, values: np.ndarray, max_points: int, method: str = "mean"
+) -> tuple[np.ndarray, np.ndarray]:
+    """Reduce a series to about max_points points using buckets of equally many points.
+
+    mean keeps each bucket's mean step and value. minmax keeps each bucket's
+    minimum and maximum at their own steps, in step order, so peaks survive in a
+    line plot; it returns up to max_points points too.
+    """
+    steps = np.asarray(steps)
+    values = np.asarray(values, dtype=np.float64)
+    n_buckets = max_points if method == "mean" else max_points // 2
+    if n_buckets <= 0 or len(steps) <= max_points:
+        return steps, values
+
+    starts = np.linspace(0, len(steps), n_buckets, endpoint=False).astype(np.int64)
+    if method == "mean":
+        valid = ~np.isnan(values)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        sizes = np.diff(np.append(starts, len(steps)))
+        mean_steps = np.add.reduceat(steps.astype(np.float64), starts) / sizes
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return mean_steps, sums / counts
+    if method == "minmax":
+        bucket = np.repeat(np.arange(n_buckets), np.diff(np.append(starts, len(steps))))
+        # NaNs never win the comparisons below.
+        low = np.where(np.isnan(values), np.inf, values)
+        high = np.where(np.isnan(values), -np.inf, values)
+        order_low = np.lexsort((low, bucket))
+        order_high = np.lexsort((-high, bucket))
+        index = np.concatenate([order_low[starts], order_high[starts]])
+        index = np.unique(index)
+        return steps[index], values[index]
+    raise ValueError(f"Unknown downsampling method {method}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Align step-indexed CSVs (with a Step column) on a common grid of steps."
+    )
+    parser.add_argument("csvs", type=str, nargs="+", help="CSV files to align.")
+    parser.add_argument("--method", choices=ALIGN_METHODS, default="nearest", help="Resampling method.")
+    parser.add_argument(
+        "--grid",
+        choices=["union", "intersection", "coarsest"],
+        default="coarsest",
+        help="Grid of steps to align on: all steps, the steps of every file or those of the sparsest file.",
+    )
+    parser.add_argument("--export_csv", type=str, required=True, help="Output CSV path.")
+    args = parser.parse_args()
+
+    aligned = align_frames(
+        {p: pd.read_csv(p) for p in args.csvs}, grid_mode=args.grid, method=args.method
+    )
+    aligned.to_csv(args.export_csv, index=False)
+    print(aligned.corr(numeric_only=True))
@@ -0,0 +1,140 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import importlib.util
+import os
+
+from build_graph import BUILD_STATE_FILE_NAME, Target, build, record_build, source_version
+from manifest import load_manifest, save_manifest
+
+
+class Action:
+    """Build action writing the concatenated inputs of a target to its output."""
+
+    def __init__(self, target: Target):
+        self.target = target
+        self.runs = 0
+
+    def __call__(self) -> None:
+        self.runs += 1
+        with open(self.target.outputs[0], "w") as fout:
+            for path in self.target.inputs:
+                with open(path) as fin:
+                    fout.write(fin.read())
+
+
+def make_target(tmp_path, **config) -> Target:
+    (tmp_path / "in").mkdir(exist_ok=True)
+    (tmp_path / "out").mkdir(exist_ok=True)
+    for name in ["a.json", "b.json"]:
+        if not (tmp_path / "in" / name).exists():
+            (tmp_path / "in" / name).write_text(name)
+    return Target(
+        name="concat",
+        inputs=[str(tmp_path / "in" / "a.json"), str(tmp_path / "in" / "b.json")],
+        outputs=[str(tmp_path / "out" / "ab.txt")],
+        version="1",
+        config=config,
+    )
+
+
+def touch(path) -> None:
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_build_skips_unchanged_and_touched_targets(tmp_path):
+    target = make_target(tmp_path)
+    action = Action(target)
+    assert build(target, action) and action.runs == 1
+    assert os.path.exists(tmp_path / "out" / BUILD_STATE_FILE_NAME)
+    assert not build(target, action)
+
+    # Touching a file without changing its content does not make it stale.
+    touch(target.inputs[0])
+    touch(target.outputs[0])
+    assert not build(target, action) and action.runs == 1
+    assert build(target, action, force=True) and action.runs == 2
+
+
+def test_build_reruns_on_changed_inputs_recipe_and_outputs(tmp_path):
+    target = make_target(tmp_path)
+    action = Action(target)
+    build(target, action)
+
+    (tmp_path / "in" / "b.json").write_text("changed")
+    assert build(target, action)
+    assert (tmp_path / "out" / "ab.txt").read_text() == "a.jsonchanged"
+
+    target.config = {"dpi": 300}
+    assert build(target, action)
+    target.version = "2"
+    assert build(target, action)
+    assert not build(target, action)
+
+    # Outputs deleted or overwritten since the build are rebuilt.
+    os.remove(target.outputs[0])
+    assert build(target, action)
+    (tmp_path / "out" / "ab.txt").write_text("edited")
+    assert build(target, action)
+    assert (tmp_path / "out" / "ab.txt").read_text() == "a.jsonchanged"
+    assert action.runs == 6
+
+
+def test_unrecorded_build_stays_out_of_date_until_recorded(tmp_path):
+    target = make_target(tmp_path)
+    # The action only queues its output, as deferred plots do.
+    assert build(target, lambda: None, record=False)
+    assert build(target, lambda: None, record=False)
+
+    Action(target)()
+    record_build(target)
+    assert not build(target, Action(target))
+
+
+def test_targets_share_the_state_file_of_their_output_directory(tmp_path):
+    first = make_target(tmp_path)
+    second = make_target(tmp_path)
+    second.name = "copy"
+    second.outputs = [str(tmp_path / "out" / "copy.txt")]
+    build(first, Action(first))
+    build(second, Action(second))
+    assert set(load_manifest(first.state_path)) == {"concat", "copy"}
+    assert not build(first, Action(first)) and not build(second, Action(second))
+
+
+def import_file(path):
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_source_version_follows_local_imports(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    (tmp_path / "helper_for_version.py").write_text("SCALE = 1\n")
+    (tmp_path / "script_for_version.py").write_text(
+        "import os\n\ndef main():\n    from helper_for_version import SCALE\n"
+    )
+    script = import_file(tmp_path / "script_for_version.py")
+    version = source_version(script)
+    assert source_version(script) == version
+
+    (tmp_path / "helper_for_version.py").write_text("SCALE = 2\n")
+    assert source_version(script) != version
+
+
+def test_manifest_round_trip_and_unreadable_manifests(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    assert load_manifest(path) == {}
+    save_manifest(path, {"a": {"size": 1}})
+    assert load_manifest(path) == {"a": {"size": 1}}
+    assert not os.path.exists(path + ".tmp")
+    (tmp_path / "manifest.json").write_text('{"a": ')
+    assert load_manifest(path) == {}
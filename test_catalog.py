@@ -0,0 +1,135 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import os
+
+import pytest
+
+from catalog import (
+    BATCH_FAMILY,
+    CONTINUOUS_FAMILY,
+    SCALED_LR_FAMILY,
+    SEQUENTIAL_FAMILY,
+    Catalog,
+    load_catalog,
+    parse_run_name,
+)
+
+
+@pytest.mark.parametrize(
+    "name, stage, expected",
+    [
+        ("batch-128-eval1", "framework", dict(family=BATCH_FAMILY, unlearned_samples=128, batch_size=128, splits=1, eval_id=1)),
+        ("batch-128-lr1.132e-05-eval2", "combined", dict(family=SCALED_LR_FAMILY, batch_size=128, lr=1.132e-05, eval_id=2)),
+        ("seq-64-512-eval1", "harmfulness", dict(family=SEQUENTIAL_FAMILY, unlearned_samples=512, batch_size=8, splits=64)),
+        ("opt1.3b_unlearned_harmful-for-real42-eval1", "framework", dict(family=CONTINUOUS_FAMILY, seed=42, batch_size=None)),
+        ("batch_size_128", "relearn", dict(family=BATCH_FAMILY, unlearned_samples=128, eval_id=None)),
+        ("batch_size_128_lr1.132e-05", "relearn", dict(family=SCALED_LR_FAMILY, lr=1.132e-05)),
+        ("samples_count_512_split_64", "relearn", dict(family=SEQUENTIAL_FAMILY, unlearned_samples=512, splits=64)),
+        ("opt1.3b_unlearned_harmful-for-real7", "relearn", dict(family=CONTINUOUS_FAMILY, seed=7)),
+    ],
+)
+def test_parse_run_name(name, stage, expected):
+    run = parse_run_name(name, stage)
+    assert run.name == name and run.stage == stage
+    assert {key: getattr(run, key) for key in expected} == expected
+
+
+def test_parse_run_name_rejects_unknown_schemes():
+    assert parse_run_name("batch-128", "framework") is None
+    assert parse_run_name("batch-128-eval1", "relearn") is None
+    assert parse_run_name("plots", "framework") is None
+
+
+def catalog() -> Catalog:
+    return Catalog(
+        [
+            parse_run_name("batch-128-eval2", "framework"),
+            parse_run_name("batch-128-eval1", "framework"),
+            parse_run_name("seq-64-512-eval1", "framework"),
+            parse_run_name("seq-64-512-eval1", "harmfulness"),
+            parse_run_name("batch-128-lr1.132e-05-eval1", "framework"),
+            parse_run_name("opt1.3b_unlearned_harmful-for-real42-eval1", "combined"),
+        ]
+    )
+
+
+def test_select_matches_all_criteria_in_run_order():
+    runs = catalog()
+    assert [r.name for r in runs.select(family=BATCH_FAMILY)] == ["batch-128-eval2", "batch-128-eval1"]
+    assert [r.stage for r in runs.select(unlearned_samples=512, stage=["harmfulness", "relearn"])] == ["harmfulness"]
+    assert runs.select(family=SEQUENTIAL_FAMILY, stage="combined") == []
+    assert len(runs.select()) == len(runs.runs)
+    with pytest.raises(AssertionError):
+        runs.select(model="opt")
+
+
+def test_evaluation_of_relearn_and_mink_runs():
+    runs = catalog()
+    assert runs.evaluation_of(parse_run_name("batch_size_128", "relearn")).name == "batch-128-eval1"
+    assert runs.evaluation_of(parse_run_name("batch_size_128_lr1.132e-05", "relearn")).name == "batch-128-lr1.132e-05-eval1"
+    assert runs.evaluation_of(parse_run_name("samples_count_512_split_64", "relearn")).name == "seq-64-512-eval1"
+    seed = parse_run_name("opt1.3b_unlearned_harmful-for-real42", "relearn")
+    assert runs.evaluation_of(seed).name == "opt1.3b_unlearned_harmful-for-real42-eval1"
+    assert runs.evaluation_of(parse_run_name("batch_size_256", "relearn")) is None
+
+
+def make_tree(base_path) -> None:
+    for path in [
+        "eval_framework_tasks/batch_unlearning/batch-128-eval1",
+        "eval_harmfulness/sequential_unlearning/seq-64-512-eval1",
+        "eval_relearn/data/batch_size_128",
+        "eval_mink",
+    ]:
+        os.makedirs(base_path / path)
+    (base_path / "eval_mink" / "continuous_unlearning_42_safety.csv.gz").write_bytes(b"")
+
+
+def bump_mtime(path) -> None:
+    # Directory mtimes may not advance between two quick changes.
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def test_load_catalog_scans_every_tree(tmp_path):
+    make_tree(tmp_path)
+    runs = load_catalog(str(tmp_path))
+    assert [(r.stage, r.name) for r in runs.runs] == [
+        ("framework", "batch-128-eval1"),
+        ("harmfulness", "seq-64-512-eval1"),
+        ("relearn", "batch_size_128"),
+        ("mink_safety", "continuous_unlearning_42"),
+    ]
+    assert runs.select(stage="mink_safety")[0].path == os.path.join("eval_mink", "continuous_unlearning_42_safety.csv.gz")
+
+
+def test_load_catalog_reuses_the_index_until_a_directory_changes(tmp_path):
+    make_tree(tmp_path)
+    index_path = str(tmp_path / "index.json")
+    assert len(load_catalog(str(tmp_path), index_path).runs) == 4
+
+    # A change hidden from the directory mtimes is not seen: the index is reused.
+    family = tmp_path / "eval_framework_tasks" / "batch_unlearning"
+    stat = os.stat(family)
+    os.rmdir(family / "batch-128-eval1")
+    os.utime(family, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(load_catalog(str(tmp_path), index_path).runs) == 4
+
+    bump_mtime(family)
+    assert len(load_catalog(str(tmp_path), index_path).runs) == 3
+
+    # New families are found through the mtime of their tree.
+    os.makedirs(tmp_path / "eval_combined" / "batch_unlearning" / "batch-64-eval1")
+    bump_mtime(tmp_path / "eval_combined")
+    assert load_catalog(str(tmp_path), index_path).select(stage="combined")[0].unlearned_samples == 64
+
+    # An empty index path rescans without persisting.
+    os.remove(index_path)
+    load_catalog(str(tmp_path), "")
+    assert not os.path.exists(index_path)
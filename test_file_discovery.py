@@ -0,0 +1,73 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import gzip
+import json
+import os
+
+from file_discovery import ListingCache, discover_files, load_json_files
+
+
+def write_json(path, value) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt") as fout:
+        json.dump(value, fout)
+
+
+def make_results(base_path) -> list[str]:
+    paths = [
+        base_path / "run" / "eval_results" / "idx_1.json",
+        base_path / "run" / "eval_results" / "idx_2.json.gz",
+        base_path / "run" / "nested" / "deeper" / "idx_3.json",
+    ]
+    for i, path in enumerate(paths):
+        write_json(path, {"idx": i})
+    (base_path / "run" / "flagged_ratio.csv").write_text("")
+    return [str(p) for p in paths]
+
+
+def test_discover_files_recurses_and_matches_compressed_names(tmp_path):
+    paths = make_results(tmp_path)
+    assert discover_files([str(tmp_path / "run")]) == paths
+    assert discover_files([str(tmp_path / "run")], pattern="*.csv") == [
+        str(tmp_path / "run" / "flagged_ratio.csv")
+    ]
+    # Files given explicitly, or found twice, are listed once in order of appearance.
+    assert discover_files([paths[2], str(tmp_path / "run" / "")]) == [paths[2]] + paths[:2]
+    # Glob matches are kept as files, whatever their name.
+    assert sorted(discover_files([str(tmp_path / "run" / "*" / "idx_*")])) == paths[:2]
+
+
+def test_listing_cache_relists_only_changed_directories(tmp_path):
+    paths = make_results(tmp_path)
+    cache_path = str(tmp_path / "listing.json")
+    assert discover_files([str(tmp_path / "run")], cache_path=cache_path) == paths
+
+    # Listings of directories with an unchanged mtime come from the cache.
+    results = tmp_path / "run" / "eval_results"
+    stat = os.stat(results)
+    write_json(results / "idx_4.json", {})
+    os.utime(results, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert discover_files([str(tmp_path / "run")], cache_path=cache_path) == paths
+
+    os.utime(results, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert discover_files([str(tmp_path / "run")], cache_path=cache_path) == paths[:2] + [
+        str(results / "idx_4.json"),
+        paths[2],
+    ]
+    cache = ListingCache(cache_path)
+    assert cache.listings[str(results)]["files"] == ["idx_1.json", "idx_2.json.gz", "idx_4.json"]
+
+
+def test_load_json_files_keeps_the_order_of_paths(tmp_path):
+    paths = make_results(tmp_path)[::-1]
+    expected = [{"idx": 2}, {"idx": 1}, {"idx": 0}]
+    assert load_json_files(paths) == expected
+    assert load_json_files(paths, workers=1) == expected
@@ -0,0 +1,49 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import io
+import json
+
+import json_stream
+from json_stream import extract_members, iter_records
+
+
+class ShortReads(io.StringIO):
+    """Text file returning at most size characters per read, cutting values anywhere."""
+
+    def __init__(self, text: str, size: int):
+        super().__init__(text)
+        self.size = size
+
+    def read(self, n: int = -1) -> str:
+        return super().read(self.size if n < 0 else min(n, self.size))
+
+
+def test_extract_members_numbers_cut_at_every_chunk_size():
+    members = {"lr": 1.132e-05, "acc": 0.25, "count": 1234, "neg": -7.5E+2, "last": 42}
+    text = json.dumps({"skipped": [3.5, {"x": 1e3}], **members})
+    for size in range(1, len(text) + 1):
+        assert extract_members(ShortReads(text, size), set(members)) == members, size
+
+
+def test_iter_records_json_array_and_json_lines():
+    records = [{"model": "idx_1", "response": "a, b]"}, [1, 2.5], "x", None]
+    array = json.dumps(records, indent=4)
+    # JSON lines starting with an array record.
+    lines_records = records[1:] + records[:1]
+    lines = "".join(json.dumps(record) + "\n" for record in lines_records)
+    for size in [1, 7, 1 << 16]:
+        assert list(iter_records(ShortReads(array, size))) == records
+        assert list(iter_records(ShortReads(lines, size))) == lines_records
+
+
+def test_iter_records_streams_arrays_longer_than_the_lookahead(monkeypatch):
+    monkeypatch.setattr(json_stream, "JSON_LINES_LOOKAHEAD", 8)
+    records = list(range(100))
+    assert list(iter_records(io.StringIO(json.dumps(records)))) == records
@@ -0,0 +1,33 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import numpy as np
+
+from loss_store import LossStore, write_loss_store
+
+
+def test_loss_store_round_trip(tmp_path):
+    records = [{"model": "batch_size_128", "checkpoint": i} for i in range(3)]
+    losses = [np.linspace(3.0, 1.0, 50), np.zeros(0), np.arange(7, dtype=np.float64)]
+    write_loss_store(str(tmp_path), records, losses)
+
+    store = LossStore(str(tmp_path))
+    assert len(store) == 3 and store.records == records
+    np.testing.assert_array_equal(store.lengths, [50, 0, 7])
+    for i, trajectory in enumerate(losses):
+        np.testing.assert_array_equal(store.trajectory(i), trajectory.astype(np.float32))
+    # Trajectories are read-only views of the mapped file.
+    assert isinstance(store.losses, np.memmap)
+    assert not store.trajectory(0).flags.writeable
+
+
+def test_empty_loss_store(tmp_path):
+    write_loss_store(str(tmp_path), [{"model": "a"}], [np.zeros(0)])
+    store = LossStore(str(tmp_path))
+    assert len(store) == 1 and len(store.trajectory(0)) == 0
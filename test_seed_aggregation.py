@@ -0,0 +1,83 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import numpy as np
+import pandas as pd
+
+from seed_aggregation import aggregate_seeds, bootstrap_mean_interval, classify_seed_files
+
+
+def seed_frames(n_seeds: int = 5, steps: int = 20) -> list[pd.DataFrame]:
+    rng = np.random.default_rng(0)
+    return [
+        pd.DataFrame({"Step": np.arange(steps) * 8, "loss": rng.normal(5.0, 1.0, steps)})
+        for _ in range(n_seeds)
+    ]
+
+
+def test_bootstrap_interval_brackets_the_mean_and_is_seeded():
+    values = np.random.default_rng(1).normal(size=(8, 30, 2))
+    low, high = bootstrap_mean_interval(values, n_resamples=2000)
+    mean = values.mean(axis=0)
+    assert np.all(low <= mean) and np.all(mean <= high)
+    # The interval narrows with the confidence and repeats with the seed.
+    narrow_low, narrow_high = bootstrap_mean_interval(values, n_resamples=2000, confidence=0.5)
+    assert np.all(high - low >= narrow_high - narrow_low)
+    again_low, again_high = bootstrap_mean_interval(values, n_resamples=2000)
+    np.testing.assert_array_equal(low, again_low)
+    np.testing.assert_array_equal(high, again_high)
+
+
+def test_bootstrap_interval_matches_resampling_seeds():
+    values = np.random.default_rng(2).normal(size=(6, 4))
+    rng = np.random.default_rng(3)
+    resampled = values[rng.integers(0, 6, size=(20000, 6))].mean(axis=1)
+    expected = np.quantile(resampled, [0.025, 0.975], axis=0)
+    low, high = bootstrap_mean_interval(values, n_resamples=20000)
+    np.testing.assert_allclose([low, high], expected, atol=0.05)
+
+
+def test_bootstrap_interval_collapses_for_identical_seeds():
+    values = np.tile(np.linspace(0.0, 1.0, 10), (4, 1))
+    low, high = bootstrap_mean_interval(values)
+    np.testing.assert_allclose(low, values[0])
+    np.testing.assert_allclose(high, values[0])
+
+
+def test_aggregate_seeds_aligns_steps_and_averages_repeated_steps():
+    frames = [
+        pd.DataFrame({"Step": [0, 8, 16], "loss": [1.0, 2.0, 3.0]}),
+        # A repeated step, e.g. from a resumed run, counts once with its mean.
+        pd.DataFrame({"Step": [0, 8, 8, 24], "loss": [3.0, 2.0, 6.0, 5.0]}),
+    ]
+    aggregated = aggregate_seeds(frames, n_resamples=0)
+    np.testing.assert_array_equal(aggregated["Step"], [0, 8, 16, 24])
+    np.testing.assert_array_equal(aggregated["loss"], [2.0, 3.0, 3.0, 5.0])
+    np.testing.assert_array_equal(aggregated["seeds"], [2, 2, 1, 1])
+    assert np.isnan(aggregated["loss_std"].iloc[2])
+
+
+def test_aggregate_seeds_interval_brackets_the_mean():
+    aggregated = aggregate_seeds(seed_frames())
+    assert np.all(aggregated["loss_ci_low"] <= aggregated["loss"])
+    assert np.all(aggregated["loss"] <= aggregated["loss_ci_high"])
+
+
+def test_classify_seed_files():
+    paths = [
+        "a/continuous_unlearning_42_safety.csv",
+        "a/continuous_unlearning_7_safety.csv.gz",
+        "a/continuous_unlearning_7_badloss_mink.csv",
+        "a/flagged_ratio.csv",
+    ]
+    assert classify_seed_files(paths) == {
+        "badloss_mink": {7: paths[2]},
+        "safety": {7: paths[1], 42: paths[0]},
+    }
+    assert list(classify_seed_files(paths)["safety"]) == [7, 42]
@@ -0,0 +1,87 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from smoothing import (
+    ExponentialMovingAverage,
+    MinMaxNormaliser,
+    RollingMean,
+    ZScoreNormaliser,
+)
+
+
+def series(rows: int = 500, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(rows, 3)).cumsum(axis=0)
+
+
+def chunkings(rows: int, seed: int = 0) -> list[list[int]]:
+    """Chunk boundaries: the whole series, single rows and random cuts."""
+    rng = np.random.default_rng(seed)
+    random_cuts = sorted(rng.choice(np.arange(1, rows), size=20, replace=False).tolist())
+    return [[], list(range(1, rows)), random_cuts]
+
+
+def feed(transform, values: np.ndarray, cuts: list[int]) -> np.ndarray:
+    return np.concatenate([transform.update(chunk) for chunk in np.split(values, cuts)])
+
+
+@pytest.mark.parametrize("window", [1, 10, 64])
+def test_rolling_mean_any_chunking_matches_pandas(window):
+    values = series()
+    values[100:103, 1] = np.nan
+    expected = pd.DataFrame(values).rolling(window).mean().to_numpy()
+    for cuts in chunkings(len(values)):
+        np.testing.assert_allclose(feed(RollingMean(window), values, cuts), expected, atol=1e-9)
+
+
+@pytest.mark.parametrize("alpha", [1.0, 0.5, 0.1, 0.001])
+def test_exponential_moving_average_any_chunking_matches_pandas(alpha):
+    # Leading NaNs, as left by the warm-up of a preceding rolling mean, and a series
+    # long enough to span several closed-form blocks for small alphas.
+    values = series(rows=5000)
+    values[:7] = np.nan
+    expected = pd.DataFrame(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    for cuts in chunkings(len(values)):
+        np.testing.assert_allclose(
+            feed(ExponentialMovingAverage(alpha=alpha), values, cuts), expected, rtol=1e-9
+        )
+
+
+def test_exponential_moving_average_span_and_one_dimensional_series():
+    values = series()[:, 0]
+    expected = pd.Series(values).ewm(span=20, adjust=False).mean().to_numpy()
+    np.testing.assert_allclose(ExponentialMovingAverage(span=20).update(values), expected)
+
+
+@pytest.mark.parametrize("normaliser", [MinMaxNormaliser, ZScoreNormaliser])
+def test_normalisers_fitted_in_chunks_match_a_single_fit(normaliser):
+    values = series()
+    values[::17, 2] = np.nan
+    whole = normaliser().partial_fit(values).transform(values)
+    for cuts in chunkings(len(values))[1:]:
+        fitted = normaliser()
+        for chunk in np.split(values, cuts):
+            fitted.partial_fit(chunk)
+        np.testing.assert_allclose(fitted.transform(values), whole, atol=1e-9)
+
+
+def test_normalisers_match_pandas():
+    frame = pd.DataFrame(series())
+    np.testing.assert_allclose(
+        MinMaxNormaliser().partial_fit(frame.to_numpy()).transform(frame.to_numpy()),
+        ((frame - frame.min()) / (frame.max() - frame.min())).to_numpy(),
+    )
+    np.testing.assert_allclose(
+        ZScoreNormaliser().partial_fit(frame.to_numpy()).transform(frame.to_numpy()),
+        ((frame - frame.mean()) / frame.std(ddof=0)).to_numpy(),
+    )
@@ -0,0 +1,89 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from step_alignment import ALIGN_METHODS, align, align_frames, common_grid, downsample
+
+STEPS = np.array([10, 20, 40])
+VALUES = np.array([1.0, 2.0, 6.0])
+
+
+@pytest.mark.parametrize("method", ALIGN_METHODS)
+def test_align_is_nan_outside_and_exact_at_the_edges(method):
+    grid = np.array([0, 9, 10, 40, 41, 100])
+    aligned = align(STEPS, VALUES, grid, method)
+    np.testing.assert_array_equal(aligned, [np.nan, np.nan, 1.0, 6.0, np.nan, np.nan])
+
+
+def test_align_between_logged_steps():
+    grid = np.array([14, 15, 16, 30, 39])
+    np.testing.assert_array_equal(align(STEPS, VALUES, grid, "nearest"), [1.0, 1.0, 2.0, 2.0, 6.0])
+    np.testing.assert_array_equal(align(STEPS, VALUES, grid, "asof"), [1.0, 1.0, 1.0, 2.0, 2.0])
+    np.testing.assert_allclose(align(STEPS, VALUES, grid, "linear"), np.interp(grid, STEPS, VALUES))
+
+
+def test_align_matches_merge_asof():
+    rng = np.random.default_rng(0)
+    steps = np.unique(rng.integers(0, 1000, 50))
+    values = rng.random(len(steps))
+    grid = np.arange(steps[0], steps[-1] + 1)
+    expected = pd.merge_asof(
+        pd.DataFrame({"Step": grid}), pd.DataFrame({"Step": steps, "v": values}), on="Step"
+    )["v"]
+    np.testing.assert_array_equal(align(steps, values, grid, "asof"), expected)
+
+
+def test_align_columns_and_empty_series():
+    values = np.stack([VALUES, -VALUES], axis=1)
+    aligned = align(STEPS, values, np.array([5, 30]), "linear")
+    np.testing.assert_array_equal(aligned, [[np.nan, np.nan], [4.0, -4.0]])
+    assert np.isnan(align(np.array([]), np.array([]), np.array([1, 2]))).all()
+
+
+def test_common_grid_modes():
+    steps = [np.array([0, 2, 4, 6]), np.array([0, 3, 6])]
+    np.testing.assert_array_equal(common_grid(steps, "union"), [0, 2, 3, 4, 6])
+    np.testing.assert_array_equal(common_grid(steps, "intersection"), [0, 6])
+    np.testing.assert_array_equal(common_grid(steps, "coarsest"), [0, 3, 6])
+
+
+def test_align_frames_prefixes_clashing_columns():
+    frames = {
+        "a": pd.DataFrame({"Step": [0, 10], "loss": [1.0, 2.0]}),
+        "b": pd.DataFrame({"Step": [0, 5, 10], "loss": [3.0, 4.0, 5.0]}),
+    }
+    aligned = align_frames(frames, grid_mode="coarsest", method="asof")
+    assert list(aligned.columns) == ["Step", "loss", "b/loss"]
+    np.testing.assert_array_equal(aligned["b/loss"], [3.0, 5.0])
+
+
+@pytest.mark.parametrize("max_points", [2, 7, 10, 99])
+def test_downsample_minmax_keeps_extremes_within_max_points(max_points):
+    rng = np.random.default_rng(max_points)
+    steps = np.arange(1000)
+    values = rng.normal(size=1000)
+    values[rng.integers(0, 1000, 20)] = np.nan
+    kept_steps, kept_values = downsample(steps, values, max_points, "minmax")
+    assert len(kept_steps) <= max_points
+    assert np.all(np.diff(kept_steps) > 0)
+    np.testing.assert_array_equal(kept_values, values[kept_steps])
+    assert np.nanmax(values) in kept_values and np.nanmin(values) in kept_values
+
+
+def test_downsample_mean_buckets():
+    steps = np.arange(10)
+    values = np.arange(10, dtype=float)
+    mean_steps, means = downsample(steps, values, 5, "mean")
+    np.testing.assert_array_equal(mean_steps, [0.5, 2.5, 4.5, 6.5, 8.5])
+    np.testing.assert_array_equal(means, [0.5, 2.5, 4.5, 6.5, 8.5])
+    # Series with at most max_points points are kept as they are.
+    assert downsample(steps, values, 10, "minmax")[0] is steps
@@ -0,0 +1,144 @@
+# Copyright (C) 2024 UCL CS SNLP Naturalnego 语言 Töötlus group
+#    - Szymon Duchniewicz
+#    - Yadong Liu
+#    - Andrzej Szablewski
+#    - Zhe Yu
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import ctypes
+import fnmatch
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+from typing import Callable
+
+# See inotify(7)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Waits for changes of files matching pattern in a directory using Linux inotify."""
+
+    def __init__(self, directory: str, pattern: str):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.pattern = pattern
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float | None) -> bool:
+        """Block up to timeout seconds (forever if None), return whether a matching file changed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            if self._drain():
+                return True
+
+    def _drain(self) -> bool:
+        matched = False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + name_length].rstrip(b"\0"))
+            offset += name_length
+            matched = matched or fnmatch.fnmatch(name, self.pattern)
+        return matched
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Portable fallback comparing the size and mtime of matching files at an interval."""
+
+    def __init__(self, directory: str, pattern: str, interval: float = 1.0):
+        self.directory = directory
+        self.pattern = pattern
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self) -> dict[str, tuple[int, int]]:
+        snapshot = {}
+        for entry in os.scandir(self.directory):
+            if fnmatch.fnmatch(entry.name, self.pattern):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout: float | None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            time.sleep(self.interval)
+            snapshot = self._snapshot()
+            if snapshot != self.snapshot:
+                self.snapshot = snapshot
+                return True
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(directory: str, pattern: str) -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory, pattern)
+        except (OSError, AttributeError):
+            # e.g. exhausted inotify watches or a filesystem without inotify support.
+            pass
+    return PollingWatcher(directory, pattern)
+
+
+def watch(
+    directory: str,
+    pattern: str,
+    on_change: Callable[[], None],
+    debounce: float = 2.0,
+) -> None:
+    """Call on_change now and after every burst of changes to files matching pattern.
+
+    A burst ends once no further change was seen for debounce seconds, so a
+    checkpoint written in several steps triggers a single update. Errors raised by
+    on_change are reported without stopping the watch. Runs until interrupted.
+    """
+    watcher = make_watcher(directory, pattern)
+    print(f"Watching {os.path.join(directory, pattern)} (Ctrl+C to stop)")
+    try:
+        while True:
+            try:
+                on_change()
+            except Exception:
+                traceback.print_exc()
+
+            watcher.wait(None)
+            while watcher.wait(debounce):
+                pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()